@@ -21,7 +21,11 @@ def create_app():
     with app.app_context():
         from . import database
         database.ensure_database()
-    
+
+        # Task Telegram còn 'running' từ lần chạy trước -> 'interrupted' (có thể resume)
+        from .telegram_tasks import TASK_STORE
+        TASK_STORE.recover_interrupted()
+
     # Đăng ký các routes từ file routes.py
     with app.app_context():
         from . import routes
@@ -42,5 +46,21 @@ def create_app():
         
         from . import chatbot_routes
         app.register_blueprint(chatbot_routes.chatbot_bp)
+
+        # Proxy chết theo lần check đã lưu vẫn bị loại sau khi khởi động lại
+        telegram_routes.restore_proxy_check()
+
+    # Scheduler Auto Seeding + các schedule cron chạy nền (ngủ tới giờ chạy kế tiếp)
+    from .automatic_scheduler import AUTO_SEEDING_SCHEDULER, SCHEDULE_RUNNER
+    AUTO_SEEDING_SCHEDULER.start(UPLOAD_FOLDER)
+    SCHEDULE_RUNNER.start(UPLOAD_FOLDER)
+
+    # Thread nhắc việc Notes (ngủ tới lần đến hạn kế tiếp)
+    from .notes_reminders import REMINDER_ENGINE
+    REMINDER_ENGINE.start()
+
+    # Dọn ảnh ghi chú không còn được tham chiếu
+    from .notes_image_gc import NOTE_IMAGE_SWEEPER
+    NOTE_IMAGE_SWEEPER.start()
     
     return app
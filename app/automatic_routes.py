@@ -8,9 +8,13 @@ Ported from Main.pyw - uses SQLite database
 
 from flask import Blueprint, request, jsonify
 import sqlite3
+import json
 from pathlib import Path
 from datetime import datetime
 
+from app.automatic_scheduler import (AUTO_SEEDING_SCHEDULER, SCHEDULE_RUNNER, JOB_TYPE_LIMITS,
+                                     CronExpression, schedule_next_fire)
+
 # Tạo Blueprint
 automatic_bp = Blueprint('automatic', __name__, url_prefix='/automatic')
 
@@ -96,7 +100,237 @@ def save_seeding_settings():
         conn.commit()
         conn.close()
         
+        # Tính lại lịch ngay với cài đặt mới
+        AUTO_SEEDING_SCHEDULER.notify()
+        
         return jsonify({'message': 'Đã lưu cài đặt Auto Seeding'})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@automatic_bp.route('/api/seeding/status', methods=['GET'])
+def get_seeding_status():
+    """Trạng thái scheduler: lần chạy kế tiếp, task đang chạy, giờ kết thúc khung"""
+    return jsonify(AUTO_SEEDING_SCHEDULER.status())
+
+
+# ===== Schedules (nhiều lịch dạng cron) =====
+
+# Trường số của schedule -> (mặc định, giá trị nhỏ nhất)
+SCHEDULE_INT_FIELDS = {
+    'core': (5, 1),
+    'delay_per_session': (10, 0),
+    'delay_between_batches': (600, 0),
+    'admin_delay': (10, 0),
+    'skip_fresh_hours': (0, 0),
+    'priority': (0, None),
+}
+
+
+def _schedule_payload():
+    """Body JSON của create/update schedule; ValueError (-> 400) nếu không phải object"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise ValueError('Body phải là JSON object')
+    return data
+
+
+def _schedule_fields(conn, data, current=None):
+    """Kiểm tra + chuẩn hóa dữ liệu schedule (current: dòng hiện có khi cập nhật).
+    Raise ValueError với thông báo hiển thị cho người dùng."""
+    merged = dict(current) if current else {}
+    if current and current['config_json']:
+        merged['config'] = json.loads(current['config_json'])
+    merged.update(data)
+
+    name = str(merged.get('name') or '').strip()
+    if not name:
+        raise ValueError('Tên schedule không được để trống')
+    cron_expr = str(merged.get('cron_expr') or '').strip()
+    CronExpression(cron_expr)
+    task_name = merged.get('task_name')
+    if task_name not in JOB_TYPE_LIMITS:
+        raise ValueError(f'Tác vụ không được hỗ trợ: {task_name}')
+    group_id = merged.get('target_session_group_id')
+    if not group_id or not conn.execute('SELECT 1 FROM session_groups WHERE id = ?', (group_id,)).fetchone():
+        raise ValueError('Không tìm thấy nhóm session')
+
+    fields = {
+        'name': name,
+        'cron_expr': cron_expr,
+        'task_name': task_name,
+        'target_session_group_id': int(group_id),
+        # Không có config riêng -> dùng cấu hình đã lưu trong task_configs lúc chạy
+        'config_json': json.dumps(merged['config'], ensure_ascii=False) if merged.get('config') else None,
+        'admin_enabled': bool(merged.get('admin_enabled', False)),
+        'is_enabled': bool(merged.get('is_enabled', True)),
+    }
+    for key, (default, minimum) in SCHEDULE_INT_FIELDS.items():
+        value = merged.get(key)
+        value = default if value is None or value == '' else int(value)
+        if minimum is not None and value < minimum:
+            raise ValueError(f'{key} phải >= {minimum}')
+        fields[key] = value
+    max_duration = merged.get('max_duration_minutes')
+    fields['max_duration_minutes'] = max(1, int(max_duration)) if max_duration else None
+    return fields
+
+
+def _schedule_to_dict(row, last_run=None):
+    schedule = dict(row)
+    schedule['config'] = json.loads(schedule.pop('config_json')) if row['config_json'] else None
+    next_fire = schedule_next_fire(row)
+    schedule['next_fire_at'] = next_fire.isoformat(timespec='seconds') if next_fire else None
+    schedule['last_run'] = dict(last_run) if last_run else None
+    return schedule
+
+
+@automatic_bp.route('/api/schedules', methods=['GET'])
+def list_schedules():
+    """Danh sách schedule + lần chạy kế tiếp + lần chạy gần nhất"""
+    try:
+        conn = get_db_connection()
+        try:
+            rows = conn.execute('SELECT * FROM schedules ORDER BY priority DESC, name').fetchall()
+            last_runs = {
+                row['schedule_id']: row for row in conn.execute(
+                    """SELECT * FROM schedule_runs WHERE id IN
+                       (SELECT MAX(id) FROM schedule_runs GROUP BY schedule_id)"""
+                ).fetchall()
+            }
+        finally:
+            conn.close()
+        return jsonify([_schedule_to_dict(row, last_runs.get(row['id'])) for row in rows])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@automatic_bp.route('/api/schedules', methods=['POST'])
+def create_schedule():
+    """Tạo schedule mới"""
+    try:
+        conn = get_db_connection()
+        try:
+            fields = _schedule_fields(conn, _schedule_payload())
+            now = datetime.now().isoformat(timespec='seconds')
+            fields.update(created_at=now, updated_at=now)
+            cursor = conn.execute(
+                f"INSERT INTO schedules ({', '.join(fields)}) VALUES ({', '.join('?' for _ in fields)})",
+                tuple(fields.values())
+            )
+            conn.commit()
+            row = conn.execute('SELECT * FROM schedules WHERE id = ?', (cursor.lastrowid,)).fetchone()
+        finally:
+            conn.close()
+        SCHEDULE_RUNNER.notify()
+        return jsonify(_schedule_to_dict(row)), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.IntegrityError:
+        return jsonify({'error': 'Tên schedule đã tồn tại'}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@automatic_bp.route('/api/schedules/<int:schedule_id>', methods=['GET'])
+def get_schedule(schedule_id):
+    """Chi tiết 1 schedule"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT * FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return jsonify({'error': 'Không tìm thấy schedule'}), 404
+    return jsonify(_schedule_to_dict(row))
+
+
+@automatic_bp.route('/api/schedules/<int:schedule_id>', methods=['PUT'])
+def update_schedule(schedule_id):
+    """Cập nhật schedule (chỉ các trường gửi lên; 'config': null -> dùng task_configs)"""
+    try:
+        conn = get_db_connection()
+        try:
+            current = conn.execute('SELECT * FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+            if not current:
+                return jsonify({'error': 'Không tìm thấy schedule'}), 404
+            fields = _schedule_fields(conn, _schedule_payload(), current)
+            fields['updated_at'] = datetime.now().isoformat(timespec='seconds')
+            if fields['cron_expr'] != current['cron_expr'] or (fields['is_enabled'] and not current['is_enabled']):
+                # Lịch mới: tính từ bây giờ, không chạy bù theo lịch cũ
+                fields['last_fire_at'] = fields['updated_at']
+            conn.execute(
+                f"UPDATE schedules SET {', '.join(f'{key} = ?' for key in fields)} WHERE id = ?",
+                (*fields.values(), schedule_id)
+            )
+            conn.commit()
+            row = conn.execute('SELECT * FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+        finally:
+            conn.close()
+        SCHEDULE_RUNNER.notify()
+        return jsonify(_schedule_to_dict(row))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.IntegrityError:
+        return jsonify({'error': 'Tên schedule đã tồn tại'}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@automatic_bp.route('/api/schedules/<int:schedule_id>', methods=['DELETE'])
+def delete_schedule(schedule_id):
+    """Xóa schedule + lịch sử chạy (task đang chạy không bị dừng)"""
+    try:
+        conn = get_db_connection()
+        try:
+            cursor = conn.execute('DELETE FROM schedules WHERE id = ?', (schedule_id,))
+            conn.execute('DELETE FROM schedule_runs WHERE schedule_id = ?', (schedule_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        if not cursor.rowcount:
+            return jsonify({'error': 'Không tìm thấy schedule'}), 404
+        SCHEDULE_RUNNER.notify()
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@automatic_bp.route('/api/schedules/<int:schedule_id>/run', methods=['POST'])
+def run_schedule_now(schedule_id):
+    """Đưa schedule vào hàng đợi ngay (vẫn tuân theo giới hạn đồng thời)"""
+    conn = get_db_connection()
+    try:
+        exists = conn.execute('SELECT 1 FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+    finally:
+        conn.close()
+    if not exists:
+        return jsonify({'error': 'Không tìm thấy schedule'}), 404
+    run_id = SCHEDULE_RUNNER.enqueue_now(schedule_id)
+    if run_id is None:
+        return jsonify({'error': 'Schedule đang chờ hoặc đang chạy'}), 409
+    return jsonify({'run_id': run_id}), 202
+
+
+@automatic_bp.route('/api/schedules/<int:schedule_id>/runs', methods=['GET'])
+def list_schedule_runs(schedule_id):
+    """Lịch sử chạy của schedule (mới nhất trước)"""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            'SELECT * FROM schedule_runs WHERE schedule_id = ? ORDER BY id DESC LIMIT ?',
+            (schedule_id, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return jsonify([dict(row) for row in rows])
+
+
+@automatic_bp.route('/api/schedules/status', methods=['GET'])
+def get_schedules_status():
+    """Hàng đợi job: đang chờ, đang chạy, lần chạy kế tiếp"""
+    return jsonify(SCHEDULE_RUNNER.status())
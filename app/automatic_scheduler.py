@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Auto Seeding Scheduler
+Daemon trong tiến trình chạy lịch auto_seeding_settings: ngủ tới đúng giờ chạy kế tiếp
+(Event.wait, không polling), khởi chạy task qua Telegram engine, dừng khi hết khung giờ
+Schedule Runner: nhiều schedule dạng cron (bảng schedules) qua hàng đợi ưu tiên có giới hạn
+số task đồng thời theo loại job, lịch sử chạy lưu trong schedule_runs
+"""
+
+import heapq
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app.database import get_db_connection
+from app.telegram_tasks import TASK_STORE
+
+# Ngủ tối đa (giây) giữa 2 lần tính lại lịch (phòng khi đồng hồ hệ thống thay đổi)
+MAX_SLEEP = 3600
+# Có task khác đang chạy: thử lại sau (giây)
+BUSY_RETRY = 60
+# Không có end_run_time: vẫn chạy bù nếu trễ không quá ngưỡng này (giây)
+CATCH_UP_GRACE = 15 * 60
+
+# Schedules: số task chạy đồng thời tối đa theo loại job (tính cả task chạy tay)
+JOB_TYPE_LIMITS = {'check-live': 2, 'joinGroup': 1, 'seedingGroup': 1}
+# Schedules: tổng số task chạy đồng thời tối đa
+MAX_CONCURRENT_JOBS = 3
+# Số lần chạy giữ lại trong lịch sử mỗi schedule
+MAX_RUNS_PER_SCHEDULE = 100
+
+# Cron 5 trường: (tên, min, max)
+CRON_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+CRON_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+}
+CRON_NAMES = {
+    'month': {name: i + 1 for i, name in enumerate(
+        ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'))},
+    'weekday': {name: i for i, name in enumerate(('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'))},
+}
+
+
+def parse_clock(value):
+    """'HH:MM' / 'HH:MM:SS' / ISO datetime -> (giờ, phút, giây); None nếu không hợp lệ."""
+    if not value:
+        return None
+    text = str(value).strip()
+    if 'T' in text:
+        text = text.split('T', 1)[1]
+    try:
+        parts = [int(part) for part in text.split(':')[:3]]
+    except ValueError:
+        return None
+    if len(parts) < 2:
+        return None
+    hour, minute, second = (parts + [0])[:3]
+    if not (0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 60):
+        return None
+    return hour, minute, second
+
+
+def _at(day, clock):
+    hour, minute, second = clock
+    return datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute, second=second)
+
+
+def occurrence_window(day, start_clock, end_clock):
+    """Khung chạy của ngày `day`: (start, end). Khung qua nửa đêm nếu end <= start."""
+    start = _at(day, start_clock)
+    end = None
+    if end_clock:
+        end = _at(day, end_clock)
+        if end <= start:
+            end += timedelta(days=1)
+    return start, end
+
+
+def next_occurrence(settings, now):
+    """Lần chạy kế tiếp chưa được thực hiện: (start, end) hoặc None.
+
+    Lần chạy đã bắt đầu (last_run_timestamp >= start) không bao giờ chạy lại,
+    nên khởi động lại ứng dụng không gây chạy trùng."""
+    start_clock = parse_clock(settings['run_time'])
+    if not start_clock:
+        return None
+    end_clock = parse_clock(settings['end_run_time'])
+    last_run = None
+    if settings['last_run_timestamp']:
+        try:
+            last_run = datetime.fromisoformat(settings['last_run_timestamp'])
+        except ValueError:
+            last_run = None
+
+    # Hôm qua (khung qua nửa đêm có thể vẫn đang mở), hôm nay, ngày mai
+    for offset in (-1, 0, 1):
+        start, end = occurrence_window(now.date() + timedelta(days=offset), start_clock, end_clock)
+        if last_run and last_run >= start:
+            continue
+        # Lỡ giờ (vd: ứng dụng tắt): chỉ chạy bù khi khung chưa đóng / trong CATCH_UP_GRACE
+        if now >= (end or start + timedelta(seconds=CATCH_UP_GRACE)):
+            continue
+        return start, end
+    return None
+
+
+def _cron_value(text, names):
+    text = text.strip().lower()
+    if text in names:
+        return names[text]
+    return int(text)
+
+
+def _parse_cron_field(text, field, low, high):
+    """1 trường cron ('*', '5', '1-5', '*/15', '0-30/10', 'mon-fri', danh sách ',') -> set giá trị."""
+    names = CRON_NAMES.get(field, {})
+    values = set()
+    for part in text.split(','):
+        span, _, step_text = part.partition('/')
+        step = int(step_text) if step_text else 1
+        if step < 1:
+            raise ValueError(f'Bước không hợp lệ ở trường {field}: {part}')
+        if span == '*':
+            start, end = low, high
+        else:
+            first, _, last = span.partition('-')
+            start = _cron_value(first, names)
+            end = _cron_value(last, names) if last else (high if step_text else start)
+        if not (low <= start <= end <= high):
+            raise ValueError(f'Giá trị ngoài khoảng {low}-{high} ở trường {field}: {part}')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """Biểu thức cron tối giản: 'phút giờ ngày tháng thứ' (thứ 0/7 = Chủ nhật) + @daily, @hourly...
+
+    Giống cron: khi cả ngày-trong-tháng và thứ đều bị giới hạn thì khớp 1 trong 2."""
+
+    def __init__(self, text):
+        expr = CRON_ALIASES.get(str(text or '').strip().lower(), str(text or '').strip())
+        parts = expr.split()
+        if len(parts) != len(CRON_FIELDS):
+            raise ValueError('Biểu thức cron cần 5 trường: phút giờ ngày tháng thứ')
+        fields = {
+            name: _parse_cron_field(part, name, low, high)
+            for part, (name, low, high) in zip(parts, CRON_FIELDS)
+        }
+        self.text = expr
+        self.minutes = sorted(fields['minute'])
+        self.hours = fields['hour']
+        self.days = fields['day']
+        self.months = fields['month']
+        self.weekdays = {value % 7 for value in fields['weekday']}
+        self._either_day = parts[2] != '*' and parts[4] != '*'
+
+    def _day_matches(self, moment):
+        in_month = moment.day in self.days
+        in_week = moment.isoweekday() % 7 in self.weekdays
+        return (in_month or in_week) if self._either_day else (in_month and in_week)
+
+    def next_after(self, moment):
+        """Thời điểm khớp đầu tiên sau `moment` (theo phút), None nếu không có trong ~4 năm."""
+        current = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = current + timedelta(days=4 * 366)
+        while current < limit:
+            if current.month not in self.months:
+                current = (current.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(current):
+                current = current.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if current.hour not in self.hours:
+                current = current.replace(minute=0) + timedelta(hours=1)
+                continue
+            minute = next((m for m in self.minutes if m >= current.minute), None)
+            if minute is None:
+                current = current.replace(minute=0) + timedelta(hours=1)
+                continue
+            return current.replace(minute=minute)
+        return None
+
+
+def _parse_iso(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _iso(moment):
+    return moment.isoformat(timespec='seconds') if moment else None
+
+
+def schedule_next_fire(row, now=None):
+    """Lần chạy kế tiếp của 1 schedule (None nếu tắt / cron lỗi)."""
+    if not row['is_enabled']:
+        return None
+    try:
+        cron = CronExpression(row['cron_expr'])
+    except ValueError:
+        return None
+    base = _parse_iso(row['last_fire_at']) or _parse_iso(row['created_at']) or now or datetime.now()
+    return cron.next_after(base)
+
+
+class _SchedulerDaemon(ABC):
+    """Vòng lặp daemon chung: gọi _tick() rồi ngủ (Event.wait) theo số giây nó trả về."""
+
+    thread_name = 'scheduler'
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._upload_folder = ''
+        self.last_error = None
+
+    def start(self, upload_folder):
+        """Khởi động daemon (gọi 1 lần trong create_app)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._upload_folder = upload_folder
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Cài đặt thay đổi -> tính lại lịch ngay."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            # Xóa cờ trước khi tick: notify() trong lúc tick làm lần wait sau trả về ngay
+            self._wake.clear()
+            try:
+                timeout = self._tick()
+            except Exception as e:
+                self.last_error = str(e)
+                timeout = BUSY_RETRY
+            self._wake.wait(max(1, min(timeout, MAX_SLEEP)))
+
+    @abstractmethod
+    def _tick(self):
+        """Một vòng xử lý; trả về số giây ngủ tới lần kế tiếp."""
+
+
+class AutoSeedingScheduler(_SchedulerDaemon):
+    """Thread daemon chạy lịch Auto Seeding (1 dòng auto_seeding_settings id = 1)."""
+
+    thread_name = 'auto-seeding-scheduler'
+
+    def __init__(self):
+        super().__init__()
+        self._recovered = False
+        self.task_id = None
+        self.window_end = None
+        self.next_run_at = None
+
+    def status(self):
+        return {
+            'running_task_id': self.task_id,
+            'window_end': self.window_end.isoformat() if self.window_end else None,
+            'next_run_at': self.next_run_at.isoformat() if self.next_run_at else None,
+            'last_error': self.last_error,
+        }
+
+    @staticmethod
+    def _load_settings():
+        conn = get_db_connection()
+        try:
+            return conn.execute('SELECT * FROM auto_seeding_settings WHERE id = 1').fetchone()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _save_settings(**fields):
+        assignments = ', '.join(f'{key} = ?' for key in fields)
+        conn = get_db_connection()
+        try:
+            conn.execute(f'UPDATE auto_seeding_settings SET {assignments} WHERE id = 1', tuple(fields.values()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _tick(self):
+        """Một vòng tính lịch. Trả về số giây ngủ tới lần kiểm tra kế tiếp."""
+        now = datetime.now()
+        settings = self._load_settings()
+        if settings is None:
+            return MAX_SLEEP
+
+        if not self._recovered:
+            self._recovered = True
+            self._recover_interrupted(settings, now)
+
+        # Đang chạy: chỉ cần canh giờ kết thúc khung
+        if self.task_id:
+            if TASK_STORE.get_status(self.task_id) != 'running':
+                self.task_id = self.window_end = None
+            elif self.window_end and now >= self.window_end:
+                TASK_STORE.add_message(self.task_id, 'Auto Seeding: hết khung giờ, dừng task.')
+                TASK_STORE.set_status(self.task_id, 'stopped')
+                self.task_id = self.window_end = None
+            else:
+                return (self.window_end - now).total_seconds() if self.window_end else MAX_SLEEP
+
+        if not settings['is_enabled'] or not settings['target_session_group_id']:
+            self.next_run_at = None
+            return MAX_SLEEP
+
+        occurrence = next_occurrence(settings, now)
+        if occurrence is None:
+            self.next_run_at = None
+            return MAX_SLEEP
+        start, end = occurrence
+        self.next_run_at = start
+        if now < start:
+            return (start - now).total_seconds()
+
+        if TASK_STORE.has_running():
+            return BUSY_RETRY
+        return self._launch(settings, now, end)
+
+    def _launch(self, settings, now, end):
+        # Import lười: telegram_routes kéo theo Flask blueprint
+        from app.telegram_routes import launch_task, load_task_config, list_group_filenames
+
+        task_name = settings['task_name'] or 'seedingGroup'
+        group_id = settings['target_session_group_id']
+        config = load_task_config(task_name)
+        filenames = list_group_filenames(group_id, exclude_dead=True)
+
+        payload, status = launch_task(
+            group_id, task_name, config, filenames,
+            core=settings['core'],
+            delay_per_session=settings['delay_per_session'],
+            delay_between_batches=settings['delay_between_batches'],
+            admin_enabled=bool(settings['admin_enabled']),
+            admin_delay=settings['admin_delay'],
+            upload_folder=self._upload_folder
+        )
+        task_id = payload.get('task_id')
+
+        # Ghi nhận lần chạy kể cả khi lỗi -> không thử lại liên tục cùng 1 lịch
+        fields = {'last_run_timestamp': now.isoformat(timespec='seconds'), 'last_task_id': task_id}
+        if not settings['run_daily']:
+            fields['is_enabled'] = 0  # Lịch 1 lần: đã dùng
+        self._save_settings(**fields)
+
+        if status >= 400 or not task_id:
+            self.last_error = payload.get('error') or payload.get('message')
+            return BUSY_RETRY
+        self.last_error = None
+        TASK_STORE.add_message(task_id, 'Auto Seeding: bắt đầu theo lịch.')
+        self.task_id = task_id
+        self.window_end = end
+        self.next_run_at = None
+        return (end - now).total_seconds() if end else MAX_SLEEP
+
+    def _recover_interrupted(self, settings, now):
+        """Khởi động lại giữa khung chạy: chạy tiếp task bị gián đoạn thay vì tạo task mới."""
+        task_id = settings['last_task_id']
+        if not task_id or not settings['last_run_timestamp']:
+            return
+        if TASK_STORE.stored_status(task_id) != 'interrupted' or TASK_STORE.has_live_thread(task_id):
+            return
+        start_clock = parse_clock(settings['run_time'])
+        if not start_clock:
+            return
+        last_run = datetime.fromisoformat(settings['last_run_timestamp'])
+        for offset in (-1, 0):
+            start, end = occurrence_window(last_run.date() + timedelta(days=offset), start_clock,
+                                           parse_clock(settings['end_run_time']))
+            if start <= last_run and (end is None or last_run < end):
+                if end is not None and now >= end:
+                    return
+                from app.telegram_routes import relaunch_task
+                payload, status = relaunch_task(task_id)
+                if status < 400:
+                    TASK_STORE.add_message(task_id, 'Auto Seeding: chạy tiếp sau khi khởi động lại.')
+                    self.task_id = task_id
+                    self.window_end = end
+                return
+
+
+class ScheduleRunner(_SchedulerDaemon):
+    """Thread daemon chạy các schedule (bảng schedules) qua hàng đợi ưu tiên.
+
+    - Schedule tới giờ -> thêm 1 dòng 'queued' vào schedule_runs (hàng đợi bền vững).
+    - Hàng đợi lấy theo priority cao trước, rồi tới giờ sớm trước; job chỉ chạy khi
+      chưa vượt JOB_TYPE_LIMITS / MAX_CONCURRENT_JOBS và nhóm session không có task khác chạy.
+    - Task kết thúc (TASK_STORE finish listener) đánh thức daemon để ghi kết quả và
+      lấy job kế tiếp; max_duration_minutes dừng task khi chạy quá lâu."""
+
+    thread_name = 'schedule-runner'
+
+    def __init__(self):
+        super().__init__()
+        self._heap = []      # (-priority, scheduled_for, run_id)
+        self._queued = {}    # run_id -> job
+        self._running = {}   # task_id -> job
+        self._restored = False
+        self.next_fire_at = None
+
+    def start(self, upload_folder):
+        if self._thread is None:
+            TASK_STORE.add_finish_listener(lambda task_id, status: self._wake.set())
+        super().start(upload_folder)
+
+    def status(self):
+        """Job đang chờ / đang chạy (đọc từ schedule_runs) + lần chạy kế tiếp."""
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(
+                """SELECT r.id AS run_id, r.schedule_id, s.name, r.status, r.task_id,
+                          r.scheduled_for, r.started_at
+                   FROM schedule_runs r JOIN schedules s ON s.id = r.schedule_id
+                   WHERE r.status IN ('queued', 'running')
+                   ORDER BY s.priority DESC, r.scheduled_for"""
+            ).fetchall()
+        finally:
+            conn.close()
+        return {
+            'queued': [dict(row) for row in rows if row['status'] == 'queued'],
+            'running': [dict(row) for row in rows if row['status'] == 'running'],
+            'next_fire_at': _iso(self.next_fire_at),
+            'last_error': self.last_error,
+        }
+
+    def _tick(self):
+        now = datetime.now()
+        conn = get_db_connection()
+        try:
+            if not self._restored:
+                self._restored = True
+                self._restore(conn, now)
+            self._reap(conn, now)
+            # Nạp 'queued' đã lưu (trước khởi động lại / từ API) trước khi xét tới giờ,
+            # để _has_active_run thấy chúng và không tạo lần chạy trùng
+            self._load_queue(conn)
+            self._enqueue_due(conn, now)
+            self._load_queue(conn)
+            self._dispatch(conn, now)
+        finally:
+            conn.close()
+
+        wakeups = [self.next_fire_at]
+        wakeups += [job['deadline'] for job in self._running.values() if not job['stopping']]
+        wakeups += [job['expires_at'] for job in self._queued.values()]
+        timeout = min(((moment - now).total_seconds() for moment in wakeups if moment), default=MAX_SLEEP)
+        # Job bị chặn bởi giới hạn: finish listener sẽ đánh thức, BUSY_RETRY chỉ để phòng hờ
+        return min(timeout, BUSY_RETRY) if self._queued else timeout
+
+    # ----- Hàng đợi -----
+
+    def _restore(self, conn, now):
+        """Khởi động lại: lần chạy còn 'running' trong DB đã bị gián đoạn cùng task của nó."""
+        rows = conn.execute("SELECT * FROM schedule_runs WHERE status = 'running'").fetchall()
+        for row in rows:
+            job = {'run_id': row['id'], 'schedule_id': row['schedule_id'],
+                   'started_at': _parse_iso(row['started_at']) or now}
+            self._finish_run(conn, job, row['task_id'], now, status='interrupted',
+                             message='Ứng dụng khởi động lại khi đang chạy')
+
+    def _enqueue_due(self, conn, now):
+        """Thêm job cho schedule đã tới giờ; lần lỡ giờ (quá hạn chạy bù) ghi 'skipped'."""
+        self.next_fire_at = None
+        for row in conn.execute('SELECT * FROM schedules WHERE is_enabled = 1').fetchall():
+            fire = schedule_next_fire(row, now)
+            if fire is None:
+                continue
+            if fire <= now:
+                grace = timedelta(minutes=row['max_duration_minutes']) if row['max_duration_minutes'] \
+                    else timedelta(seconds=CATCH_UP_GRACE)
+                if now - fire > grace:
+                    self._insert_run(conn, row['id'], fire, now, 'skipped', 'Lỡ giờ chạy (ứng dụng không chạy)')
+                elif self._has_active_run(row['id']):
+                    self._insert_run(conn, row['id'], fire, now, 'skipped', 'Lần chạy trước chưa kết thúc')
+                else:
+                    self._insert_run(conn, row['id'], fire, now, 'queued')
+                # Gộp mọi lần lỡ thành 1: lần kế tiếp tính từ bây giờ
+                conn.execute('UPDATE schedules SET last_fire_at = ? WHERE id = ?', (_iso(now), row['id']))
+                conn.commit()
+                fire = CronExpression(row['cron_expr']).next_after(now)
+            if fire and (self.next_fire_at is None or fire < self.next_fire_at):
+                self.next_fire_at = fire
+
+    def enqueue_now(self, schedule_id):
+        """Chạy ngay 1 schedule (bỏ qua cron). Trả về run_id, None nếu đang có lần chạy dở."""
+        conn = get_db_connection()
+        try:
+            if conn.execute(
+                "SELECT 1 FROM schedule_runs WHERE schedule_id = ? AND status IN ('queued', 'running')",
+                (schedule_id,)
+            ).fetchone():
+                return None
+            now = datetime.now()
+            run_id = self._insert_run(conn, schedule_id, now, now, 'queued')
+        finally:
+            conn.close()
+        self.notify()
+        return run_id
+
+    def _load_queue(self, conn):
+        """Nạp các dòng 'queued' chưa có trong heap (sau khởi động lại / chạy ngay từ API)."""
+        rows = conn.execute(
+            """SELECT r.id, r.schedule_id, r.scheduled_for, s.priority, s.max_duration_minutes
+               FROM schedule_runs r JOIN schedules s ON s.id = r.schedule_id
+               WHERE r.status = 'queued'"""
+        ).fetchall()
+        for row in rows:
+            if row['id'] in self._queued:
+                continue
+            scheduled_for = _parse_iso(row['scheduled_for']) or datetime.now()
+            max_duration = row['max_duration_minutes']
+            self._queued[row['id']] = {
+                'run_id': row['id'],
+                'schedule_id': row['schedule_id'],
+                'scheduled_for': scheduled_for,
+                'expires_at': scheduled_for + timedelta(minutes=max_duration) if max_duration else None,
+            }
+            heapq.heappush(self._heap, (-row['priority'], scheduled_for, row['id']))
+
+    def _dispatch(self, conn, now):
+        active = TASK_STORE.active_tasks()
+        running_by_type = Counter(task['task_name'] for task in active.values())
+        busy_groups = {task['group_id'] for task in active.values()}
+        running_total = len(active)
+
+        deferred = []
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            job = self._queued.get(entry[2])
+            if job is None:
+                continue
+            schedule = conn.execute('SELECT * FROM schedules WHERE id = ?', (job['schedule_id'],)).fetchone()
+            if schedule is None or not schedule['is_enabled']:
+                self._drop_queued(conn, job, now, 'Schedule đã bị xóa hoặc tắt')
+                continue
+            if job['expires_at'] and now >= job['expires_at']:
+                self._drop_queued(conn, job, now, 'Hết khung giờ khi đang chờ trong hàng đợi')
+                continue
+
+            task_name = schedule['task_name']
+            if (running_total >= MAX_CONCURRENT_JOBS
+                    or running_by_type[task_name] >= JOB_TYPE_LIMITS.get(task_name, 1)
+                    or schedule['target_session_group_id'] in busy_groups):
+                deferred.append(entry)
+                continue
+
+            del self._queued[job['run_id']]
+            if self._start_job(conn, job, schedule, now):
+                running_total += 1
+                running_by_type[task_name] += 1
+                busy_groups.add(schedule['target_session_group_id'])
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+
+    def _start_job(self, conn, job, schedule, now):
+        # Import lười: telegram_routes kéo theo Flask blueprint
+        from app.telegram_routes import launch_task, load_task_config, list_group_filenames
+
+        task_name = schedule['task_name']
+        group_id = schedule['target_session_group_id']
+        job['started_at'] = now
+        try:
+            config = json.loads(schedule['config_json']) if schedule['config_json'] \
+                else load_task_config(task_name)
+            filenames = list_group_filenames(group_id, exclude_dead=task_name != 'check-live')
+            payload, status = launch_task(
+                group_id, task_name, config, filenames,
+                core=schedule['core'],
+                delay_per_session=schedule['delay_per_session'],
+                delay_between_batches=schedule['delay_between_batches'],
+                admin_enabled=bool(schedule['admin_enabled']),
+                admin_delay=schedule['admin_delay'],
+                skip_fresh_hours=schedule['skip_fresh_hours'],
+                upload_folder=self._upload_folder
+            )
+        except Exception as e:
+            payload, status = {'error': str(e)}, 500
+
+        task_id = payload.get('task_id')
+        if status >= 400 or not task_id:
+            self._finish_run(conn, job, None, now, status='failed' if status >= 400 else 'skipped',
+                             message=payload.get('error') or payload.get('message'))
+            return False
+
+        conn.execute(
+            "UPDATE schedule_runs SET status = 'running', task_id = ?, started_at = ? WHERE id = ?",
+            (task_id, _iso(now), job['run_id'])
+        )
+        conn.commit()
+        TASK_STORE.add_message(task_id, f"Schedule \"{schedule['name']}\": bắt đầu theo lịch.")
+        max_duration = schedule['max_duration_minutes']
+        job.update({
+            'deadline': now + timedelta(minutes=max_duration) if max_duration else None,
+            'stopping': False,
+            'message': None,
+        })
+        self._running[task_id] = job
+        return True
+
+    def _reap(self, conn, now):
+        """Ghi kết quả job đã kết thúc; dừng job chạy quá max_duration_minutes."""
+        active = TASK_STORE.active_tasks()
+        for task_id, job in list(self._running.items()):
+            if task_id not in active:
+                del self._running[task_id]
+                self._finish_run(conn, job, task_id, now, message=job['message'])
+            elif job['deadline'] and now >= job['deadline'] and not job['stopping']:
+                job['stopping'] = True
+                job['message'] = 'Dừng: hết thời lượng tối đa'
+                TASK_STORE.add_message(task_id, 'Schedule: hết thời lượng tối đa, dừng task.')
+                TASK_STORE.set_status(task_id, 'stopped')
+
+    def _has_active_run(self, schedule_id):
+        return any(job['schedule_id'] == schedule_id
+                   for job in (*self._queued.values(), *self._running.values()))
+
+    # ----- Lịch sử chạy -----
+
+    @staticmethod
+    def _insert_run(conn, schedule_id, scheduled_for, now, status, message=None):
+        finished_at = None if status == 'queued' else _iso(now)
+        cursor = conn.execute(
+            """INSERT INTO schedule_runs (schedule_id, status, scheduled_for, queued_at, finished_at, message)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (schedule_id, status, _iso(scheduled_for), _iso(now), finished_at, message)
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+    def _drop_queued(self, conn, job, now, message):
+        self._queued.pop(job['run_id'], None)
+        conn.execute(
+            "UPDATE schedule_runs SET status = 'skipped', finished_at = ?, message = ? WHERE id = ?",
+            (_iso(now), message, job['run_id'])
+        )
+        conn.commit()
+
+    @staticmethod
+    def _finish_run(conn, job, task_id, now, status=None, message=None):
+        """Đóng 1 lần chạy: trạng thái cuối, thời lượng, counters lấy từ task."""
+        task = TASK_STORE.stored_task(task_id) if task_id else None
+        if status is None:
+            status = task['status'] if task else 'failed'
+        started_at = job.get('started_at') or now
+        conn.execute(
+            """UPDATE schedule_runs SET status = ?, started_at = ?, finished_at = ?, duration_seconds = ?,
+                      total = ?, processed = ?, success = ?, failed = ?, message = ?
+               WHERE id = ?""",
+            (status, _iso(started_at), _iso(now), round((now - started_at).total_seconds(), 1),
+             task['total'] if task else None, task['processed'] if task else None,
+             task['success'] if task else None, task['failed'] if task else None,
+             message, job['run_id'])
+        )
+        conn.execute(
+            """DELETE FROM schedule_runs WHERE schedule_id = ? AND id NOT IN
+               (SELECT id FROM schedule_runs WHERE schedule_id = ? ORDER BY id DESC LIMIT ?)""",
+            (job['schedule_id'], job['schedule_id'], MAX_RUNS_PER_SCHEDULE)
+        )
+        conn.commit()
+
+
+# Singleton khởi động từ create_app
+AUTO_SEEDING_SCHEDULER = AutoSeedingScheduler()
+SCHEDULE_RUNNER = ScheduleRunner()
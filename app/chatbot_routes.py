@@ -32,8 +32,8 @@ def get_context_data():
     conn = get_db_connection()
     
     # 1. Get Notes (Fix: Sort by modified_at DESC to show latest notes)
-    notes = conn.execute('SELECT title_html, content_html, status FROM notes WHERE is_marked = 0 ORDER BY modified_at DESC LIMIT 5').fetchall()
-    notes_text = "Recent Notes:\n" + "\n".join([f"- [{n['status']}] {n['title_html']}: {n['content_html']}" for n in notes])
+    notes = conn.execute('SELECT title_text, content_text, status FROM notes WHERE is_marked = 0 ORDER BY modified_at DESC LIMIT 5').fetchall()
+    notes_text = "Recent Notes:\n" + "\n".join([f"- [{n['status']}] {n['title_text']}: {n['content_text']}" for n in notes])
     
     # 2. Get Telegram Sessions Status
     sessions = conn.execute('SELECT filename, status_text, is_live FROM session_metadata LIMIT 10').fetchall()
@@ -251,22 +251,9 @@ QUAN TRỌNG:
                     if notes:
                         tool_result_text = f"\n\n[TÔI ĐÃ TÌM THẤY {len(notes)} GHI CHÚ:\n"
                         for note in notes[:5]:  # Limit to 5 results
-                            # Strip HTML tags
-                            clean_title = re.sub('<.*?>', '', note['title'])
-                            clean_content = re.sub('<.*?>', '', note['content'])
-                            
-                            # Smart snippet extraction
-                            snippet = ""
-                            # Find keyword in content (case insensitive)
-                            idx = clean_content.lower().find(search_kw.lower())
-                            if idx != -1:
-                                # Extract around keyword: -100 chars to +400 chars
-                                start = max(0, idx - 100)
-                                end = min(len(clean_content), idx + 400)
-                                snippet = f"...{clean_content[start:end]}..."
-                            else:
-                                # Keyword in title, show start of content
-                                snippet = clean_content[:500] + "..."
+                            # Tool trả về văn bản thuần + đoạn trích FTS quanh từ khóa
+                            clean_title = note['title']
+                            snippet = note['snippet']
                                 
                             tool_result_text += f"- Tiêu đề: {clean_title}\n  Nội dung: {snippet}\n"
                         tool_result_text += "]"
@@ -277,13 +264,10 @@ QUAN TRỌNG:
         elif any(phrase in user_message.lower() for phrase in ['tất cả ghi chú', 'all notes', 'danh sách ghi chú']):
             result = AVAILABLE_TOOLS['get_all_notes']['function']()
             if isinstance(result, dict) and result.get('success'):
-                import re
                 notes = result.get('notes', [])
                 tool_result_text = f"\n\n[DANH SÁCH {len(notes)} GHI CHÚ:\n"
                 for note in notes[:10]:  # Limit to 10
-                    clean_title = re.sub('<.*?>', '', note['title'])
-                    clean_content = re.sub('<.*?>', '', note['content'])
-                    tool_result_text += f"- {clean_title}: {clean_content[:300]}...\n"
+                    tool_result_text += f"- {note['title']}: {note['snippet']}\n"
                 tool_result_text += "]"
         
         # Detect MXH intent 
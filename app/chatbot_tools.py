@@ -6,7 +6,10 @@ Chatbot Tools - Các function mà chatbot có thể sử dụng để tương t
 
 import json
 from datetime import datetime
-from app.database import get_db_connection
+from app.database import get_db_connection, utc_timestamp
+from app.notes_reminders import REMINDER_ENGINE
+from app.notes_text import note_text_values, NOTE_TEXT_COLUMNS
+from app import notes_search
 
 # ===== NOTES TOOLS =====
 
@@ -22,7 +25,7 @@ def get_all_notes():
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT id, title_html, content_html, due_time, status, modified_at, is_marked
+            SELECT id, title_text, content_text, snippet, due_time, status, modified_at, is_marked
             FROM notes
             ORDER BY modified_at DESC
         ''')
@@ -30,8 +33,9 @@ def get_all_notes():
         for row in cursor.fetchall():
             notes.append({
                 'id': row['id'],
-                'title': row['title_html'],
-                'content': row['content_html'],
+                'title': row['title_text'],
+                'content': row['content_text'],
+                'snippet': row['snippet'],
                 'due_time': row['due_time'],
                 'status': row['status'],
                 'modified_at': row['modified_at'],
@@ -42,36 +46,34 @@ def get_all_notes():
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
-def search_notes(keyword):
+def search_notes(keyword, limit=20):
     """
-    Tìm kiếm ghi chú theo từ khóa trong tiêu đề hoặc nội dung.
+    Tìm kiếm ghi chú theo từ khóa trong tiêu đề hoặc nội dung (FTS5, không phân biệt dấu).
     Args:
         keyword (str): Từ khóa cần tìm.
+        limit (int): Số kết quả tối đa, xếp theo độ liên quan.
     Returns:
         dict: {'success': True, 'notes': [...], 'count': int}
     """
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, title_html, content_html, due_time, status, modified_at, is_marked
-            FROM notes
-            WHERE title_html LIKE ? OR content_html LIKE ?
-            ORDER BY modified_at DESC
-        ''', (f'%{keyword}%', f'%{keyword}%'))
-        notes = []
-        for row in cursor.fetchall():
-            notes.append({
-                'id': row['id'],
-                'title': row['title_html'],
-                'content': row['content_html'],
-                'due_time': row['due_time'],
-                'status': row['status'],
-                'modified_at': row['modified_at'],
-                'is_marked': row['is_marked']
-            })
-        conn.close()
-        return {'success': True, 'notes': notes, 'count': len(notes)}
+        try:
+            total, hits = notes_search.search_notes(conn, keyword, limit=limit, html_marks=False, snippet_tokens=64)
+        finally:
+            conn.close()
+        notes = [
+            {
+                'id': hit['id'],
+                'title': hit['title'],
+                'snippet': hit['snippet'],
+                'due_time': hit['due_time'],
+                'status': hit['status'],
+                'modified_at': hit['modified_at'],
+                'is_marked': hit['is_marked']
+            }
+            for hit in hits
+        ]
+        return {'success': True, 'notes': notes, 'count': total}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
@@ -85,12 +87,14 @@ def add_note(title, content, due_time=None):
         conn = get_db_connection()
         cursor = conn.cursor()
         note_id = str(uuid.uuid4())
-        now = datetime.now().isoformat()
-        cursor.execute('''
-            INSERT INTO notes (id, title_html, content_html, due_time, status, modified_at, is_marked)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (note_id, title, content, due_time, 'active', now, 0))
+        now = utc_timestamp()
+        cursor.execute(f'''
+            INSERT INTO notes (id, title_html, content_html, due_time, status, modified_at, is_marked,
+                               {', '.join(NOTE_TEXT_COLUMNS)})
+            VALUES (?, ?, ?, ?, ?, ?, ?, {', '.join('?' for _ in NOTE_TEXT_COLUMNS)})
+        ''', (note_id, title, content, due_time, 'active', now, 0, *note_text_values(title, content)))
         conn.commit()
+        REMINDER_ENGINE.refresh(note_id, conn)
         return {'success': True, 'note_id': note_id}
     except Exception as e:
         return {'success': False, 'error': str(e)}
@@ -120,13 +124,24 @@ def update_note(note_id, title=None, content=None, due_time=None):
         
         if not updates:
             return {'success': False, 'error': 'No fields to update'}
+        
+        if title is not None or content is not None:
+            # Tính lại văn bản thuần từ HTML mới (phần không đổi lấy từ DB)
+            current = cursor.execute('SELECT title_html, content_html FROM notes WHERE id = ?', (note_id,)).fetchone()
+            if current:
+                updates.extend(f'{column} = ?' for column in NOTE_TEXT_COLUMNS)
+                values.extend(note_text_values(
+                    title if title is not None else current['title_html'],
+                    content if content is not None else current['content_html']
+                ))
 
         updates.append('modified_at = ?')
-        values.append(datetime.now().isoformat())
+        values.append(utc_timestamp())
         values.append(note_id)
         query = f"UPDATE notes SET {', '.join(updates)} WHERE id = ?"
         cursor.execute(query, values)
         conn.commit()
+        REMINDER_ENGINE.refresh(note_id, conn)
         return {'success': True}
     except Exception as e:
         return {'success': False, 'error': str(e)}
@@ -144,6 +159,7 @@ def delete_note(note_id):
         cursor = conn.cursor()
         cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
         conn.commit()
+        REMINDER_ENGINE.refresh(note_id, conn)
         return {'success': True}
     except Exception as e:
         return {'success': False, 'error': str(e)}
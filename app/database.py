@@ -8,7 +8,7 @@ Matches Main.pyw database structure
 import sqlite3
 import os
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Paths
 BASE_DIR = Path(__file__).parent.parent
@@ -29,6 +29,166 @@ def get_db_connection():
     return conn
 
 
+def add_missing_columns(conn, table, columns):
+    """Add columns ({name: 'TYPE ...'}) that an older database is missing"""
+    existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}')
+
+
+def utc_timestamp():
+    """Thời điểm hiện tại dạng ISO UTC (+00:00), độ dài cố định để so sánh chuỗi đúng thứ tự"""
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+# modified_at cho ghi chú cũ không có giá trị: xếp cuối danh sách, cursor keyset không gặp NULL
+NOTE_EPOCH_TIMESTAMP = '1970-01-01T00:00:00.000000+00:00'
+
+
+def normalize_note_timestamps(conn):
+    """Đổi notes.modified_at cũ (giờ địa phương không múi giờ / offset khác) sang UTC +00:00.
+
+    NULL -> NOTE_EPOCH_TIMESTAMP: (modified_at, id) < (NULL, ?) luôn NULL nên trang sau sẽ rỗng."""
+    conn.execute('UPDATE notes SET modified_at = ? WHERE modified_at IS NULL', (NOTE_EPOCH_TIMESTAMP,))
+    conn.commit()
+    rows = conn.execute(
+        "SELECT id, modified_at FROM notes WHERE modified_at IS NOT NULL AND modified_at NOT LIKE '%+00:00'"
+    ).fetchall()
+    updates = []
+    for row in rows:
+        try:
+            value = datetime.fromisoformat(row['modified_at'].strip().replace('Z', '+00:00'))
+        except ValueError:
+            continue
+        # Không có múi giờ: do datetime.now() cũ ghi -> giờ địa phương của máy
+        value = value.astimezone(timezone.utc)
+        updates.append((value.isoformat(timespec='microseconds'), row['id']))
+    if updates:
+        conn.executemany('UPDATE notes SET modified_at = ? WHERE id = ?', updates)
+        conn.commit()
+
+
+def backfill_note_text(conn, batch_size=500):
+    """Tính các cột dẫn xuất (notes_text) cho ghi chú cũ chưa có (chạy 1 lần sau khi thêm cột)"""
+    from app.notes_text import note_text_values, NOTE_TEXT_COLUMNS
+    missing = ' OR '.join(f'{column} IS NULL' for column in NOTE_TEXT_COLUMNS)
+    assignments = ', '.join(f'{column} = ?' for column in NOTE_TEXT_COLUMNS)
+    while True:
+        rows = conn.execute(
+            f'SELECT id, title_html, content_html FROM notes WHERE {missing} LIMIT ?', (batch_size,)
+        ).fetchall()
+        if not rows:
+            return
+        updates = [(*note_text_values(row['title_html'], row['content_html']), row['id']) for row in rows]
+        conn.executemany(f'UPDATE notes SET {assignments} WHERE id = ?', updates)
+        conn.commit()
+
+
+# Tokenizer tìm kiếm ghi chú: bỏ dấu tiếng Việt (á/ạ/ắ... -> a). unicode61 không coi đ là
+# "a có dấu" nên đ/Đ được đổi thành d/D ngay trong biểu thức nạp vào chỉ mục
+NOTES_FTS_TOKENIZE = 'unicode61 remove_diacritics 2'
+# Cột notes được đánh chỉ mục (thứ tự = chỉ số cột trong bm25/snippet/highlight)
+NOTES_FTS_COLUMNS = ('title_text', 'content_text', 'profile_ids')
+
+
+def _fold_sql(expr):
+    return f"replace(replace({expr}, 'đ', 'd'), 'Đ', 'D')"
+
+
+def ensure_notes_fts(conn):
+    """Chỉ mục FTS5 notes_fts (external content trên notes.rowid) + trigger đồng bộ.
+
+    Tạo lại khi danh sách cột đổi; nạp lại toàn bộ khi vừa tạo hoặc số tài liệu lệch với
+    notes. Trả về False nếu SQLite không có FTS5 (tìm kiếm khi đó quay về LIKE)."""
+    existing = [row['name'] for row in conn.execute('PRAGMA table_info(notes_fts)').fetchall()]
+    if existing and tuple(existing) != NOTES_FTS_COLUMNS:
+        conn.executescript(
+            """DROP TRIGGER IF EXISTS notes_fts_ai;
+               DROP TRIGGER IF EXISTS notes_fts_ad;
+               DROP TRIGGER IF EXISTS notes_fts_au;
+               DROP TABLE notes_fts;"""
+        )
+    columns = ', '.join(NOTES_FTS_COLUMNS)
+    try:
+        conn.execute(
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                {columns},
+                content='notes', content_rowid='rowid',
+                tokenize='{NOTES_FTS_TOKENIZE}'
+            )"""
+        )
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 unavailable, notes search falls back to LIKE: {e}")
+        return False
+
+    new_values = ', '.join(['new.rowid'] + [_fold_sql(f'new.{col}') for col in NOTES_FTS_COLUMNS])
+    old_values = ', '.join(["'delete', old.rowid"] + [_fold_sql(f'old.{col}') for col in NOTES_FTS_COLUMNS])
+    # Giá trị 'delete' phải trùng giá trị đã nạp nên cả 2 chiều đều qua cùng _fold_sql
+    conn.executescript(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts(rowid, {columns}) VALUES ({new_values});
+        END;
+        CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, {columns}) VALUES ({old_values});
+        END;
+        CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF {columns} ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, {columns}) VALUES ({old_values});
+            INSERT INTO notes_fts(rowid, {columns}) VALUES ({new_values});
+        END;
+        """
+    )
+
+    indexed = conn.execute('SELECT COUNT(*) FROM notes_fts_docsize').fetchone()[0]
+    total = conn.execute('SELECT COUNT(*) FROM notes').fetchone()[0]
+    if indexed != total:
+        # Không dùng 'rebuild' của FTS5: nó đọc thẳng notes (chưa đổi đ -> d)
+        conn.execute("INSERT INTO notes_fts(notes_fts) VALUES ('delete-all')")
+        conn.execute(
+            f"""INSERT INTO notes_fts(rowid, {columns})
+                SELECT rowid, {', '.join(_fold_sql(col) for col in NOTES_FTS_COLUMNS)} FROM notes"""
+        )
+    conn.commit()
+    return True
+
+
+def ensure_note_images(conn):
+    """Bảng note_images (ghi chú -> file trong data/notes_images) do trigger giữ đồng bộ với
+    cột notes.image_files, nên mọi nơi ghi notes đều tự cập nhật tham chiếu ảnh"""
+    created = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'note_images'"
+    ).fetchone() is None
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS note_images (
+            note_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            PRIMARY KEY (note_id, filename)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_note_images_filename ON note_images(filename);
+        CREATE TRIGGER IF NOT EXISTS note_images_ai AFTER INSERT ON notes BEGIN
+            INSERT OR IGNORE INTO note_images (note_id, filename)
+                SELECT new.id, value FROM json_each(coalesce(new.image_files, '[]'));
+        END;
+        CREATE TRIGGER IF NOT EXISTS note_images_au AFTER UPDATE OF image_files ON notes BEGIN
+            DELETE FROM note_images WHERE note_id = old.id;
+            INSERT OR IGNORE INTO note_images (note_id, filename)
+                SELECT new.id, value FROM json_each(coalesce(new.image_files, '[]'));
+        END;
+        CREATE TRIGGER IF NOT EXISTS note_images_ad AFTER DELETE ON notes BEGIN
+            DELETE FROM note_images WHERE note_id = old.id;
+        END;
+        """
+    )
+    if created:
+        conn.execute(
+            """INSERT OR IGNORE INTO note_images (note_id, filename)
+               SELECT notes.id, j.value FROM notes, json_each(coalesce(notes.image_files, '[]')) AS j"""
+        )
+    conn.commit()
+
+
 def init_database():
     """Initialize database with all required tables (match Main.pyw)"""
     conn = get_db_connection()
@@ -52,10 +212,43 @@ def init_database():
             is_live BOOLEAN,
             status_text TEXT,
             last_checked TIMESTAMP,
+            file_mtime REAL,
+            precheck_ok BOOLEAN,
+            precheck_reason TEXT,
             FOREIGN KEY (group_id) REFERENCES session_groups (id),
             UNIQUE (group_id, filename)
         )"""
     )
+    # Local pre-flight check cache (keyed by file mtime)
+    add_missing_columns(conn, 'session_metadata', {
+        'file_mtime': 'REAL',
+        'precheck_ok': 'BOOLEAN',
+        'precheck_reason': 'TEXT',
+    })
+    
+    # Session inventory (index of .session files per group, synced from disk)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS session_inventory (
+            group_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            phone TEXT,
+            size INTEGER,
+            mtime REAL,
+            PRIMARY KEY (group_id, filename),
+            FOREIGN KEY (group_id) REFERENCES session_groups (id)
+        )"""
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_session_inventory_phone ON session_inventory (group_id, phone)'
+    )
+    
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS session_inventory_state (
+            group_id INTEGER PRIMARY KEY,
+            dir_mtime REAL,
+            scanned_at TEXT
+        )"""
+    )
     
     conn.execute(
         """CREATE TABLE IF NOT EXISTS task_configs (
@@ -64,6 +257,89 @@ def init_database():
         )"""
     )
     
+    # Telegram task registry (header + per-session results)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS telegram_tasks (
+            id TEXT PRIMARY KEY,
+            task_name TEXT NOT NULL,
+            group_id INTEGER,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            success INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            params_json TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            finished_at TEXT,
+            sleep_seconds REAL NOT NULL DEFAULT 0,
+            started_at TEXT,
+            active_seconds REAL NOT NULL DEFAULT 0
+        )"""
+    )
+    # started_at: lúc bắt đầu lần chạy hiện tại (tạo/chạy tiếp); active_seconds: tổng thời gian
+    # các lần chạy đã kết thúc (không tính lúc app tắt giữa 2 lần chạy)
+    add_missing_columns(conn, 'telegram_tasks', {
+        'sleep_seconds': 'REAL NOT NULL DEFAULT 0', 'started_at': 'TEXT', 'active_seconds': 'REAL NOT NULL DEFAULT 0'
+    })
+
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS telegram_task_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id TEXT NOT NULL,
+            seq INTEGER NOT NULL DEFAULT 0,
+            filename TEXT NOT NULL,
+            is_live BOOLEAN,
+            status_text TEXT,
+            result_json TEXT,
+            created_at TEXT NOT NULL,
+            error_class TEXT,
+            proxy TEXT,
+            connect_ms REAL,
+            authorize_ms REAL,
+            throttle_ms REAL,
+            rpc_ms REAL,
+            db_ms REAL,
+            total_ms REAL,
+            FOREIGN KEY (task_id) REFERENCES telegram_tasks(id) ON DELETE CASCADE
+        )"""
+    )
+    # Telemetry từng session: proxy, lớp lỗi, thời gian từng pha (ms)
+    add_missing_columns(conn, 'telegram_task_results', {
+        'seq': 'INTEGER NOT NULL DEFAULT 0',
+        'error_class': 'TEXT',
+        'proxy': 'TEXT',
+        'connect_ms': 'REAL',
+        'authorize_ms': 'REAL',
+        'throttle_ms': 'REAL',
+        'rpc_ms': 'REAL',
+        'db_ms': 'REAL',
+        'total_ms': 'REAL',
+    })
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_telegram_task_results_task ON telegram_task_results (task_id, filename)'
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_telegram_task_results_seq ON telegram_task_results (task_id, seq)'
+    )
+
+    # Seeding plan (precomputed session -> group -> message -> proxy schedule per task)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS seeding_plan_steps (
+            task_id TEXT NOT NULL,
+            step INTEGER NOT NULL,
+            kind TEXT NOT NULL DEFAULT 'seed',
+            filename TEXT NOT NULL,
+            group_link TEXT NOT NULL,
+            message_json TEXT,
+            proxy TEXT,
+            offset_seconds REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            PRIMARY KEY (task_id, step),
+            FOREIGN KEY (task_id) REFERENCES telegram_tasks(id) ON DELETE CASCADE
+        )"""
+    )
+
     # Auto Seeding table
     conn.execute(
         """CREATE TABLE IF NOT EXISTS auto_seeding_settings (
@@ -79,9 +355,11 @@ def init_database():
             delay_per_session INTEGER NOT NULL DEFAULT 10,
             delay_between_batches INTEGER NOT NULL DEFAULT 600,
             admin_enabled BOOLEAN NOT NULL DEFAULT 0,
-            admin_delay INTEGER NOT NULL DEFAULT 10
+            admin_delay INTEGER NOT NULL DEFAULT 10,
+            last_task_id TEXT
         )"""
     )
+    add_missing_columns(conn, 'auto_seeding_settings', {'last_task_id': 'TEXT'})
     
     # Ensure row exists for auto_seeding_settings
     existing = conn.execute('SELECT id FROM auto_seeding_settings WHERE id = 1').fetchone()
@@ -89,7 +367,57 @@ def init_database():
         conn.execute('''
             INSERT INTO auto_seeding_settings (id) VALUES (1)
         ''')
-    
+
+    # Named schedules (cron-like) chạy task Telegram không cần người trực
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            cron_expr TEXT NOT NULL,
+            task_name TEXT NOT NULL,
+            target_session_group_id INTEGER NOT NULL,
+            config_json TEXT,
+            core INTEGER NOT NULL DEFAULT 5,
+            delay_per_session INTEGER NOT NULL DEFAULT 10,
+            delay_between_batches INTEGER NOT NULL DEFAULT 600,
+            admin_enabled BOOLEAN NOT NULL DEFAULT 0,
+            admin_delay INTEGER NOT NULL DEFAULT 10,
+            skip_fresh_hours INTEGER NOT NULL DEFAULT 0,
+            max_duration_minutes INTEGER,
+            priority INTEGER NOT NULL DEFAULT 0,
+            is_enabled BOOLEAN NOT NULL DEFAULT 1,
+            last_fire_at TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (target_session_group_id) REFERENCES session_groups(id) ON DELETE CASCADE
+        )"""
+    )
+
+    # Lịch sử chạy của schedules (hàng đợi bền vững: dòng 'queued' được nạp lại khi khởi động)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS schedule_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            schedule_id INTEGER NOT NULL,
+            task_id TEXT,
+            status TEXT NOT NULL,
+            scheduled_for TEXT NOT NULL,
+            queued_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            duration_seconds REAL,
+            total INTEGER,
+            processed INTEGER,
+            success INTEGER,
+            failed INTEGER,
+            message TEXT,
+            FOREIGN KEY (schedule_id) REFERENCES schedules(id) ON DELETE CASCADE
+        )"""
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_schedule_runs_schedule ON schedule_runs(schedule_id, id)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_schedule_runs_status ON schedule_runs(status)')
+
     # Notes table
     conn.execute(
         """CREATE TABLE IF NOT EXISTS notes (
@@ -99,9 +427,26 @@ def init_database():
             due_time TEXT,
             status TEXT,
             modified_at TEXT,
-            is_marked INTEGER DEFAULT 0
+            is_marked INTEGER DEFAULT 0,
+            title_text TEXT,
+            content_text TEXT,
+            snippet TEXT,
+            profile_ids TEXT,
+            cover_image TEXT,
+            image_files TEXT
         )"""
     )
+    # Cột dẫn xuất từ HTML (tính lúc ghi, xem notes_text.NOTE_TEXT_COLUMNS)
+    add_missing_columns(conn, 'notes', {
+        'title_text': 'TEXT', 'content_text': 'TEXT', 'snippet': 'TEXT', 'profile_ids': 'TEXT',
+        'cover_image': 'TEXT', 'image_files': 'TEXT'
+    })
+    # Danh sách ghi chú phân trang keyset theo (modified_at, id)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notes_modified ON notes(modified_at, id)')
+    ensure_note_images(conn)
+    backfill_note_text(conn)
+    normalize_note_timestamps(conn)
+    ensure_notes_fts(conn)
     
     # MXH tables
     conn.execute(
@@ -197,7 +542,7 @@ def migrate_auto_seeding_schema():
             'id', 'is_enabled', 'run_time', 'end_run_time', 'run_daily',
             'target_session_group_id', 'last_run_timestamp', 'task_name',
             'core', 'delay_per_session', 'delay_between_batches',
-            'admin_enabled', 'admin_delay'
+            'admin_enabled', 'admin_delay', 'last_task_id'
         ]
         
         # Check if migration needed
@@ -225,7 +570,8 @@ def migrate_auto_seeding_schema():
                 delay_per_session INTEGER NOT NULL DEFAULT 10,
                 delay_between_batches INTEGER NOT NULL DEFAULT 600,
                 admin_enabled BOOLEAN NOT NULL DEFAULT 0,
-                admin_delay INTEGER NOT NULL DEFAULT 10
+                admin_delay INTEGER NOT NULL DEFAULT 10,
+                last_task_id TEXT
             )
         """)
         
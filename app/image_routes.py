@@ -1,4 +1,5 @@
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, render_template, request, jsonify
+from app.static_media import send_media
 import os
 import json
 from datetime import datetime
@@ -131,18 +132,12 @@ def get_collage_history():
 def get_collage_thumbnail(collage_id):
     """Get thumbnail image for collage"""
     try:
-        image_path = os.path.join(COLLAGE_HISTORY_DIR, f'{collage_id}.png')
-        abs_path = os.path.abspath(image_path)
-        
-        print(f"[DEBUG] Thumbnail request for ID: {collage_id}")
-        print(f"[DEBUG] Relative path: {image_path}")
-        print(f"[DEBUG] Absolute path: {abs_path}")
-        print(f"[DEBUG] File exists: {os.path.exists(abs_path)}")
-        
-        if not os.path.exists(abs_path):
+        abs_path = os.path.abspath(os.path.join(COLLAGE_HISTORY_DIR, f'{collage_id}.png'))
+        if not os.path.isfile(abs_path):
             return jsonify({'error': 'Not found', 'path': abs_path}), 404
         
-        return send_file(abs_path, mimetype='image/png')
+        # Collage lưu theo uuid, chỉ tạo/xóa chứ không ghi đè -> cache vĩnh viễn
+        return send_media(COLLAGE_HISTORY_DIR, f'{collage_id}.png', mimetype='image/png', immutable=True)
         
     except Exception as e:
         print(f"[ERROR] Thumbnail error: {str(e)}")
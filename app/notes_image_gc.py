@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notes Image GC
+Thread dọn data/notes_images: xóa file ảnh không còn ghi chú nào tham chiếu (bảng note_images)
+sau thời gian ân hạn, cùng các biến thể thumbnail của chúng; báo cáo số byte thu hồi
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from app.database import get_db_connection
+from app.notes_images import NOTE_IMAGE_STORE, NOTES_IMAGES_FOLDER
+from app.notes_image_variants import NOTE_IMAGE_VARIANTS, VARIANTS_FOLDER
+
+# File mới hơn thời gian này luôn được giữ (ảnh vừa upload/dán nhưng ghi chú chưa lưu)
+IMAGE_GC_GRACE_HOURS = 24
+IMAGE_GC_INTERVAL_HOURS = 6
+# Lần quét đầu sau khi khởi động (giây), tránh tranh I/O lúc app đang mở
+IMAGE_GC_STARTUP_DELAY = 300
+REPORT_MAX_FILES = 50
+
+
+class NoteImageSweeper:
+    """Quét định kỳ; mỗi lần quét trả về/lưu báo cáo (last_report)."""
+
+    def __init__(self, folder, variants_folder, grace_hours=IMAGE_GC_GRACE_HOURS,
+                 interval_hours=IMAGE_GC_INTERVAL_HOURS):
+        self.folder = folder
+        self.variants_folder = variants_folder
+        self.grace_seconds = grace_hours * 3600
+        self.interval_seconds = interval_hours * 3600
+        self.last_report = None
+        self._sweep_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Khởi động thread (gọi 1 lần trong create_app)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="notes-image-gc", daemon=True)
+        self._thread.start()
+
+    def status(self):
+        return {
+            "grace_hours": self.grace_seconds / 3600,
+            "interval_hours": self.interval_seconds / 3600,
+            "last_report": self.last_report,
+        }
+
+    def _run(self):
+        time.sleep(IMAGE_GC_STARTUP_DELAY)
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Image GC error: {e}")
+            time.sleep(self.interval_seconds)
+
+    def sweep(self, dry_run=False):
+        """Xóa ảnh mồ côi quá hạn ân hạn (dry_run: chỉ báo cáo) -> dict báo cáo"""
+        with self._sweep_lock:
+            started = time.perf_counter()
+            cutoff = time.time() - self.grace_seconds
+            conn = get_db_connection()
+            try:
+                referenced = {row[0] for row in conn.execute("SELECT DISTINCT filename FROM note_images")}
+                report = {
+                    "dry_run": dry_run,
+                    "scanned": 0,
+                    "referenced": 0,
+                    "in_grace_period": 0,
+                    "deleted_files": [],
+                    "deleted_count": 0,
+                    "variants_deleted": 0,
+                    "reclaimed_bytes": 0,
+                }
+                live_hashes = self._sweep_sources(conn, referenced, cutoff, dry_run, report)
+            finally:
+                conn.close()
+            self._sweep_variants(live_hashes, cutoff, dry_run, report)
+            report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            report["finished_at"] = datetime.now().isoformat()
+            if not dry_run:
+                self.last_report = report
+            return report
+
+    def _sweep_sources(self, conn, referenced, cutoff, dry_run, report):
+        """Ảnh gốc -> tập hash nội dung của ảnh còn giữ (để giữ biến thể của chúng)"""
+        live_hashes = set()
+        if not os.path.isdir(self.folder):
+            return live_hashes
+        for entry in os.scandir(self.folder):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.endswith(".part"):
+                # File tạm sót lại do ghi dở (app tắt giữa chừng)
+                if stat.st_mtime < cutoff:
+                    self._delete(entry.path, stat.st_size, dry_run, report)
+                continue
+            report["scanned"] += 1
+            if entry.name in referenced:
+                report["referenced"] += 1
+            elif stat.st_mtime >= cutoff or NOTE_IMAGE_STORE.is_pending(entry.name):
+                report["in_grace_period"] += 1
+            elif conn.execute(
+                "SELECT 1 FROM note_images WHERE filename = ? LIMIT 1", (entry.name,)
+            ).fetchone():
+                # Vừa được ghi chú tham chiếu trong lúc đang quét
+                report["referenced"] += 1
+            else:
+                self._delete(entry.path, stat.st_size, dry_run, report)
+                report["deleted_count"] += 1
+                if len(report["deleted_files"]) < REPORT_MAX_FILES:
+                    report["deleted_files"].append(entry.name)
+                continue
+            try:
+                live_hashes.add(NOTE_IMAGE_VARIANTS.content_hash(entry.name))
+            except OSError:
+                pass
+        return live_hashes
+
+    def _sweep_variants(self, live_hashes, cutoff, dry_run, report):
+        """Biến thể <hash>-<width>.<fmt> không còn ảnh gốc nào có hash đó"""
+        if not os.path.isdir(self.variants_folder):
+            return
+        for entry in os.scandir(self.variants_folder):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            if entry.name.split("-", 1)[0] in live_hashes or stat.st_mtime >= cutoff:
+                continue
+            self._delete(entry.path, stat.st_size, dry_run, report)
+            report["variants_deleted"] += 1
+
+    @staticmethod
+    def _delete(path, size, dry_run, report):
+        if not dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return
+        report["reclaimed_bytes"] += size
+
+
+NOTE_IMAGE_SWEEPER = NoteImageSweeper(NOTES_IMAGES_FOLDER, VARIANTS_FOLDER)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notes Image Variants
+Thumbnail và các mức chiều rộng (WebP; AVIF nếu Pillow hỗ trợ) của ảnh ghi chú: tạo trong
+thread pool, cache trên đĩa theo hash nội dung ảnh gốc nên URL biến thể không bao giờ đổi nội dung
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, features
+
+from app.notes_images import NOTE_IMAGE_STORE, NOTES_IMAGES_FOLDER
+
+NOTES_THUMBS_URL = "/notes/thumbs/"
+VARIANTS_FOLDER = os.path.join(NOTES_IMAGES_FOLDER, "variants")
+# Chỉ các mức này được tạo (tránh request tùy ý chiều rộng làm đầy đĩa)
+VARIANT_WIDTHS = (320, 640, 1024, 1600)
+THUMBNAIL_WIDTH = 320
+VARIANT_QUALITY = {"avif": 55, "webp": 80}
+VARIANT_MIMETYPES = {"avif": "image/avif", "webp": "image/webp"}
+VARIANT_WORKERS = 2
+# Request chờ biến thể đang tạo tối đa bấy nhiêu giây rồi trả ảnh gốc
+VARIANT_WAIT_SECONDS = 15
+
+_HASH_NAME = re.compile(r"[0-9a-f]{64}")
+
+
+def supported_formats():
+    """Định dạng biến thể theo thứ tự ưu tiên, chỉ gồm những gì Pillow build hiện tại ghi được"""
+    return tuple(fmt for fmt in ("avif", "webp") if features.check(fmt))
+
+
+class ImageVariantService:
+    """Tạo/tra biến thể <hash>-<width>.<fmt> trong VARIANTS_FOLDER.
+
+    Ảnh gốc mới (dán hoặc upload) được tạo sẵn thumbnail; các mức khác tạo khi được
+    request lần đầu. Mỗi biến thể chỉ có 1 job dù nhiều request cùng hỏi."""
+
+    def __init__(self, source_folder, folder, workers=VARIANT_WORKERS):
+        self.source_folder = source_folder
+        self.folder = folder
+        self.formats = supported_formats()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="note-image-variants")
+        self._lock = threading.Lock()
+        self._pending = {}  # đường dẫn biến thể -> Future
+        self._hashes = {}  # filename -> (mtime_ns, size, sha256) cho ảnh cũ tên uuid
+
+    def content_hash(self, filename):
+        """Hash nội dung ảnh gốc: tên file nếu đã là tên theo hash, không thì sha256 file"""
+        stem = os.path.splitext(filename)[0]
+        if _HASH_NAME.fullmatch(stem):
+            return stem
+        stat = os.stat(os.path.join(self.source_folder, filename))
+        cached = self._hashes.get(filename)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(os.path.join(self.source_folder, filename), "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self._hashes[filename] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+        return digest.hexdigest()
+
+    def variant_path(self, filename, width, fmt):
+        return os.path.join(self.folder, f"{self.content_hash(filename)}-{width}.{fmt}")
+
+    def request(self, filename, width, fmt):
+        """Đảm bảo biến thể đã có hoặc đang tạo -> (path, Future|None)"""
+        path = self.variant_path(filename, width, fmt)
+        if os.path.exists(path):
+            return path, None
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                future = self._pool.submit(self._generate, filename, path, width, fmt)
+                self._pending[path] = future
+                future.add_done_callback(lambda _f, key=path: self._done(key))
+        return path, future
+
+    def get(self, filename, width, fmt, timeout=VARIANT_WAIT_SECONDS):
+        """Đường dẫn biến thể đã tạo xong, None nếu lỗi/quá thời gian chờ"""
+        path, future = self.request(filename, width, fmt)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                return None
+        return path if os.path.exists(path) else None
+
+    def pregenerate(self, filename):
+        """Tạo sẵn thumbnail cho ảnh gốc mới (listener của NOTE_IMAGE_STORE)"""
+        for fmt in self.formats:
+            self.request(filename, THUMBNAIL_WIDTH, fmt)
+
+    def _done(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def _generate(self, filename, path, width, fmt):
+        with Image.open(os.path.join(self.source_folder, filename)) as source:
+            img = ImageOps.exif_transpose(source)
+            if img.width > width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.Resampling.LANCZOS)
+            has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+            img = img.convert("RGBA" if has_alpha else "RGB")
+            os.makedirs(self.folder, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    img.save(f, format=fmt.upper(), quality=VARIANT_QUALITY[fmt])
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+
+NOTE_IMAGE_VARIANTS = ImageVariantService(NOTES_IMAGES_FOLDER, VARIANTS_FOLDER)
+NOTE_IMAGE_STORE.add_listener(NOTE_IMAGE_VARIANTS.pregenerate)
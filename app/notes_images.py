@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notes Images
+Ảnh base64 dán vào ghi chú -> file trong data/notes_images đặt tên theo sha256 (trùng nội dung
+thì dùng lại file cũ). Request quét HTML 1 lượt, giải mã base64 (sai thì giữ nguyên data URI)
+và thay bằng URL; ghi file chạy trong thread pool có giới hạn hàng đợi
+"""
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.database import DATA_DIR
+
+NOTES_IMAGES_FOLDER = os.path.join(DATA_DIR, "notes_images")
+NOTES_IMAGES_URL = "/notes/images/"
+
+DATA_URI_PREFIX = "data:image/"
+IMAGE_WORKERS = 2
+# Số ảnh chờ ghi tối đa; đầy thì request dán ảnh phải chờ (backpressure)
+MAX_PENDING_IMAGES = 16
+# Thời gian tối đa serve_note_image chờ 1 ảnh vừa dán ghi xong
+PENDING_WAIT_SECONDS = 30
+
+_MIME_SUBTYPE = re.compile(r"[a-zA-Z0-9+.-]{1,32}")
+_BASE64_RUN = re.compile(r"[A-Za-z0-9+/=]+")
+
+
+def content_filename(data, ext):
+    """Tên file theo nội dung: sha256 của bytes ảnh + đuôi"""
+    return f"{hashlib.sha256(data).hexdigest()}.{ext}"
+
+
+def decode_payload(payload):
+    """Chuỗi base64 (có thể thiếu padding) -> bytes, None nếu không hợp lệ hoặc rỗng"""
+    try:
+        data = base64.b64decode(payload + "=" * (-len(payload) % 4), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return data or None
+
+
+def image_extension(subtype):
+    """'jpeg' -> 'jpg', 'svg+xml' -> 'svg' (giống cách đặt đuôi file cũ)"""
+    ext = subtype.lower().split("+")[0]
+    return "jpg" if "jpeg" in ext else ext
+
+
+class NoteImageStore:
+    """Kho ảnh ghi chú theo nội dung.
+
+    Tên file = sha256 của bytes ảnh + đuôi theo MIME, nên request trả về ngay URL cuối cùng;
+    ảnh đã có trên đĩa (lưu lại ghi chú cũ, dán lại cùng ảnh ở ghi chú khác hoặc upload) không
+    tốn lần ghi nào."""
+
+    def __init__(self, folder, workers=IMAGE_WORKERS, max_pending=MAX_PENDING_IMAGES):
+        self.folder = folder
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="note-images")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = {}  # filename -> Future ghi file
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """callback(filename) sau mỗi file ảnh mới được ghi (vd tạo thumbnail)"""
+        self._listeners.append(callback)
+
+    def extract_data_uris(self, html):
+        """Thay mọi data:image/...;base64,... trong HTML bằng URL /notes/images/<hash>.<ext>.
+
+        Quét 1 lượt bằng str.find; HTML đã tách ảnh (không còn 'data:image/') trả về ngay.
+        Payload base64 hỏng được giữ nguyên trong HTML, không thay bằng URL không có file."""
+        if not html or DATA_URI_PREFIX not in html:
+            return html
+        parts = []
+        pos = 0
+        while True:
+            start = html.find(DATA_URI_PREFIX, pos)
+            if start < 0:
+                break
+            subtype_start = start + len(DATA_URI_PREFIX)
+            marker = html.find(";base64,", subtype_start, subtype_start + 40)
+            payload_start = marker + len(";base64,")
+            run = _BASE64_RUN.match(html, payload_start) if marker >= 0 else None
+            valid = run and _MIME_SUBTYPE.fullmatch(html, subtype_start, marker)
+            data = decode_payload(run.group(0)) if valid else None
+            if data is None:
+                # Không phải data URI ảnh base64 hợp lệ: giữ nguyên, quét tiếp phía sau
+                parts.append(html[pos:subtype_start])
+                pos = subtype_start
+                continue
+            filename = self.store(image_extension(html[subtype_start:marker]), data)
+            parts.append(html[pos:start])
+            parts.append(NOTES_IMAGES_URL + filename)
+            pos = run.end()
+        parts.append(html[pos:])
+        return "".join(parts)
+
+    def store(self, ext, data):
+        """Đưa ảnh (bytes) vào kho -> tên file (ghi file ở thread pool nếu chưa có)."""
+        filename = content_filename(data, ext)
+        with self._lock:
+            if filename in self._pending or self._touch(filename):
+                return filename
+        self._slots.acquire()
+        with self._lock:
+            if filename in self._pending:
+                self._slots.release()
+                return filename
+            future = self._pool.submit(self._write, filename, data)
+            self._pending[filename] = future
+        future.add_done_callback(lambda _f, name=filename: self._done(name))
+        return filename
+
+    def store_bytes(self, ext, data):
+        """Ảnh upload (bytes) -> tên file, cùng cách đặt tên với ảnh dán base64 nên 1 ảnh
+        upload rồi dán lại vẫn chỉ có 1 file. Ghi ngay trong request."""
+        filename = content_filename(data, ext)
+        if not self._touch(filename):
+            self._write_file(filename, data)
+        return filename
+
+    def is_pending(self, filename):
+        with self._lock:
+            return filename in self._pending
+
+    def _touch(self, filename):
+        """File đã có -> cập nhật mtime (ảnh vừa được dùng lại không bị coi là mồ côi) -> True"""
+        try:
+            os.utime(os.path.join(self.folder, filename))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def wait(self, filename, timeout=PENDING_WAIT_SECONDS):
+        """Chờ ảnh đang ghi (nếu có) trước khi phục vụ file."""
+        with self._lock:
+            future = self._pending.get(filename)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+
+    def _done(self, filename):
+        with self._lock:
+            self._pending.pop(filename, None)
+        self._slots.release()
+
+    def _write(self, filename, data):
+        try:
+            self._write_file(filename, data)
+        except Exception as e:
+            print(f"Error processing image: {e}")
+
+    def _write_file(self, filename, data):
+        os.makedirs(self.folder, exist_ok=True)
+        # Ghi file tạm rồi đổi tên: không bao giờ phục vụ file ghi dở
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.folder, filename))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        for callback in self._listeners:
+            try:
+                callback(filename)
+            except Exception as e:
+                print(f"Image listener error: {e}")
+
+
+NOTE_IMAGE_STORE = NoteImageStore(NOTES_IMAGES_FOLDER)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notes Reminder Engine
+Thread nhắc việc: min-heap thời điểm đến hạn (nạp 1 lần, cập nhật khi thêm/sửa/xóa/xác nhận
+ghi chú), ngủ tới đúng lần đến hạn kế tiếp và đẩy thông báo vào hàng đợi theo id ghi chú
+"""
+
+import heapq
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from app.database import get_db_connection, DATA_DIR
+
+SOUNDS_FOLDER = os.path.join(DATA_DIR, "sounds")
+SOUND_EXTENSIONS = (".wav", ".mp3", ".ogg")
+DEFAULT_SOUND_URL = "/notes/sounds/notification.wav"
+
+# Ngủ tối đa (giây) giữa 2 lần tính lại (phòng khi đồng hồ hệ thống thay đổi)
+MAX_SLEEP = 3600
+
+
+def parse_due_time(value):
+    """due_time (ISO, có thể kết thúc bằng 'Z') -> datetime UTC; giờ không có múi coi là UTC."""
+    if not value:
+        return None
+    try:
+        due = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if due.tzinfo is None:
+        due = due.replace(tzinfo=timezone.utc)
+    return due.astimezone(timezone.utc)
+
+
+def trie_pattern(words):
+    """Regex dạng trie cho danh sách từ: tiền tố chung được gộp nên mỗi vị trí trong chuỗi
+    chỉ thử nhánh khớp ký tự đầu; tại cùng vị trí, từ dài hơn được ưu tiên (greedy ?)."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return re.compile(build(trie)) if trie else None
+
+
+class SoundCatalog:
+    """Danh mục file âm báo, chỉ quét lại khi mtime thư mục thay đổi.
+
+    Chọn âm báo: tên file (không đuôi) xuất hiện sớm nhất trong tiêu đề; cùng vị trí thì
+    tên dài hơn thắng. Một lần search regex trie thay cho vòng lặp qua từng file."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._pattern = None
+        self._files = {}
+
+    def _snapshot(self):
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._mtime:
+                files = {}
+                if mtime is not None:
+                    for name in sorted(os.listdir(self.folder)):
+                        stem = os.path.splitext(name)[0].lower()
+                        if name.endswith(SOUND_EXTENSIONS) and stem:
+                            files.setdefault(stem, name)
+                self._files = files
+                self._pattern = trie_pattern(files)
+                self._mtime = mtime
+            return self._pattern, self._files
+
+    def url_for_title(self, title):
+        """URL âm báo cho tiêu đề (mặc định notification.wav)"""
+        pattern, files = self._snapshot()
+        match = pattern.search((title or "").lower()) if pattern else None
+        return f"/notes/sounds/{files[match.group(0)]}" if match else DEFAULT_SOUND_URL
+
+
+SOUND_CATALOG = SoundCatalog(SOUNDS_FOLDER)
+
+
+class ReminderEngine:
+    """Lịch nhắc của ghi chú 'active' có due_time.
+
+    Heap chứa (due, note_id); `_due` giữ thời điểm hiện hành của từng ghi chú nên phần tử
+    heap cũ (ghi chú đã sửa/xóa) bị bỏ qua khi lấy ra thay vì phải xóa giữa heap."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._due = {}
+        self._queue = OrderedDict()  # note_id -> payload thông báo chờ frontend lấy
+        self._thread = None
+
+    def start(self):
+        """Nạp lịch từ DB và khởi động thread (gọi 1 lần trong create_app)."""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            conn = get_db_connection()
+            try:
+                rows = conn.execute(
+                    "SELECT id, due_time FROM notes WHERE status = 'active' AND due_time IS NOT NULL"
+                ).fetchall()
+            finally:
+                conn.close()
+            for row in rows:
+                self._schedule_locked(row["id"], parse_due_time(row["due_time"]))
+            self._thread = threading.Thread(target=self._run, name="notes-reminders", daemon=True)
+            self._thread.start()
+
+    # ----- Cập nhật lịch (gọi sau khi ghi DB) -----
+
+    def refresh(self, note_id, conn=None):
+        """Đồng bộ lịch của 1 ghi chú với DB (sau thêm/sửa/xóa)."""
+        own_conn = conn is None
+        conn = conn or get_db_connection()
+        try:
+            row = conn.execute("SELECT status, due_time FROM notes WHERE id = ?", (note_id,)).fetchone()
+        finally:
+            if own_conn:
+                conn.close()
+        due = parse_due_time(row["due_time"]) if row and row["status"] == "active" else None
+        with self._cond:
+            if row is None:
+                self._queue.pop(note_id, None)
+            self._schedule_locked(note_id, due)
+            self._cond.notify()
+
+    def acknowledge(self, note_id):
+        """Người dùng đã xem thông báo: bỏ khỏi hàng đợi và lịch."""
+        self.acknowledge_many((note_id,))
+
+    def acknowledge_many(self, note_ids):
+        """Bỏ nhiều ghi chú khỏi hàng đợi và lịch trong 1 lần khóa (đã xem thông báo hoặc đã xóa)."""
+        with self._cond:
+            for note_id in note_ids:
+                self._queue.pop(note_id, None)
+                self._due.pop(note_id, None)
+
+    def _schedule_locked(self, note_id, due):
+        if due is None:
+            self._due.pop(note_id, None)
+            return
+        self._due[note_id] = due
+        heapq.heappush(self._heap, (due, note_id))
+
+    # ----- Hàng đợi thông báo -----
+
+    def pop_notification(self):
+        """Lấy thông báo cũ nhất (None nếu không có)."""
+        with self._cond:
+            if not self._queue:
+                return None
+            return self._queue.popitem(last=False)[1]
+
+    # ----- Thread -----
+
+    def _take_due_locked(self, now):
+        due_ids = []
+        while self._heap and self._heap[0][0] <= now:
+            due, note_id = heapq.heappop(self._heap)
+            if self._due.get(note_id) == due:
+                del self._due[note_id]
+                due_ids.append(note_id)
+        return due_ids
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = datetime.now(timezone.utc)
+                due_ids = self._take_due_locked(now)
+                if not due_ids:
+                    timeout = (self._heap[0][0] - now).total_seconds() if self._heap else MAX_SLEEP
+                    self._cond.wait(max(0.05, min(timeout, MAX_SLEEP)))
+                    continue
+            try:
+                self._fire(due_ids)
+            except Exception as e:
+                print(f"Reminder error: {e}")
+
+    def _fire(self, note_ids):
+        """Đưa ghi chú đến hạn vào hàng đợi và đánh dấu 'notified' (giống logic cũ)."""
+        conn = get_db_connection()
+        try:
+            placeholders = ",".join("?" for _ in note_ids)
+            # DB là nguồn chuẩn: chỉ báo ghi chú vẫn còn active
+            notes = conn.execute(
+                f"SELECT id, title_text, content_html FROM notes WHERE status = 'active' AND id IN ({placeholders})",
+                note_ids
+            ).fetchall()
+            if not notes:
+                return
+            fired = [note["id"] for note in notes]
+            conn.execute(
+                f"UPDATE notes SET status = 'notified', due_time = NULL WHERE id IN ({','.join('?' for _ in fired)})",
+                fired
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        payloads = [
+            {
+                "id": note["id"],
+                "title": note["title_text"] or "",
+                "notes": note["content_html"] or "",
+                "sound_url": SOUND_CATALOG.url_for_title(note["title_text"]),
+            }
+            for note in notes
+        ]
+        with self._cond:
+            for payload in payloads:
+                self._queue.setdefault(payload["id"], payload)
+
+
+# Singleton khởi động từ create_app
+REMINDER_ENGINE = ReminderEngine()
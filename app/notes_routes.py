@@ -1,120 +1,126 @@
 import uuid
 import os
-from datetime import datetime, timezone
-from flask import Blueprint, request, jsonify, send_from_directory
-from app.database import get_db_connection, DATA_DIR
-from bs4 import BeautifulSoup
+import json
+from flask import Blueprint, request, jsonify
+from app.database import get_db_connection, utc_timestamp
+from app.notes_reminders import REMINDER_ENGINE, SOUNDS_FOLDER
+from app.notes_text import note_text_fields, note_text_values, NOTE_TEXT_COLUMNS
+from app.notes_search import search_notes, MAX_SEARCH_LIMIT
+from app.notes_images import NOTE_IMAGE_STORE, NOTES_IMAGES_FOLDER, NOTES_IMAGES_URL
+from app.notes_image_gc import NOTE_IMAGE_SWEEPER
+from app.static_media import send_media, SOUND_MAX_AGE
+from app.notes_image_variants import (
+    NOTE_IMAGE_VARIANTS, NOTES_THUMBS_URL, THUMBNAIL_WIDTH, VARIANT_MIMETYPES, VARIANT_WIDTHS, VARIANTS_FOLDER
+)
 from PIL import Image
 import io
 import base64
 
-SOUNDS_FOLDER = os.path.join(DATA_DIR, "sounds")
-NOTES_IMAGES_FOLDER = os.path.join(DATA_DIR, "notes_images")
-
 # --- BLUEPRINT DEFINITION ---
 notes_bp = Blueprint("notes_feature", __name__, url_prefix="/notes")
 
-# --- GLOBAL VARS FOR NOTES (Copied from temp_Main.pyw) ---
-NOTIFICATIONS_QUEUE = []
+# Danh sách ghi chú: bản tóm tắt (không có content_html), trang theo keyset (modified_at, id)
+NOTES_PAGE_SIZE = 50
+MAX_NOTES_PAGE_SIZE = 200
+NOTE_SUMMARY_COLUMNS = "id, title_html, snippet, status, due_time, modified_at, is_marked, cover_image"
 
-# --- CORE FUNCTIONS (Copied from temp_Main.pyw, lines 1459-1507) ---
-def check_and_queue_reminders():
-    """Checks for due reminders from SQLite and queues them for notification."""
-    conn = get_db_connection()
-    now_utc_iso = datetime.now(timezone.utc).isoformat()
-    due_notes = conn.execute(
-        "SELECT * FROM notes WHERE status = 'active' AND due_time IS NOT NULL AND due_time <= ?",
-        (now_utc_iso,)
-    ).fetchall()
+# /api/batch: thao tác -> câu UPDATE/DELETE áp cho 1 nhóm id (RETURNING id để biết id nào có thật)
+BATCH_OPERATIONS = {
+    "mark": "UPDATE notes SET is_marked = 1 WHERE id IN ({ids}) RETURNING id",
+    "unmark": "UPDATE notes SET is_marked = 0 WHERE id IN ({ids}) RETURNING id",
+    "acknowledge": "UPDATE notes SET status = 'notified', due_time = NULL WHERE id IN ({ids}) RETURNING id",
+    "delete": "DELETE FROM notes WHERE id IN ({ids}) RETURNING id",
+}
+MAX_BATCH_NOTES = 500
 
-    if not due_notes:
-        conn.close()
-        return
 
-    sound_files = []
-    if os.path.exists(SOUNDS_FOLDER):
-        sound_files = [f for f in os.listdir(SOUNDS_FOLDER) if f.endswith((".wav", ".mp3", ".ogg"))]
-    
-    ids_to_update = []
-    for note in due_notes:
-        note_dict = dict(note)
-        title_lower = (note_dict.get("title_html") or "").lower() # Use title_html
-        sound_url = "/notes/sounds/notification.wav" # Default
-        for sf in sound_files:
-            if os.path.splitext(sf)[0].lower() in title_lower:
-                sound_url = f"/notes/sounds/{sf}"
-                break
-        
-        notification_payload = {
-            "id": note_dict["id"],
-            "title": BeautifulSoup(note_dict["title_html"], "html.parser").get_text(),
-            "notes": note_dict.get("content_html", ""),
-            "sound_url": sound_url
-        }
-        if not any(q['id'] == note_dict['id'] for q in NOTIFICATIONS_QUEUE):
-            NOTIFICATIONS_QUEUE.append(notification_payload)
-        
-        ids_to_update.append(note_dict["id"])
+def _encode_cursor(row):
+    raw = json.dumps([row["modified_at"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(token):
+    """next_cursor -> (modified_at, id); ValueError nếu không hợp lệ"""
+    try:
+        modified_at, note_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return modified_at, note_id
 
-    if ids_to_update:
-        # Update status in bulk
-        placeholders = ','.join('?' for _ in ids_to_update)
-        conn.execute(f"UPDATE notes SET status = 'notified', due_time = NULL WHERE id IN ({placeholders})", ids_to_update)
-        conn.commit()
-    
-    conn.close()
 
 # --- API ROUTES (Copied from temp_Main.pyw, starting from line 1509) ---
 @notes_bp.route("/api/get")
 def api_get_notes():
-    check_and_queue_reminders()
+    """Danh sách ghi chú mới sửa trước, từng trang.
+
+    Query: limit, cursor (next_cursor của trang trước), status ('active,notified'...),
+    is_marked (0/1), due_from/due_to (ISO, so với due_time). Nội dung đầy đủ: /api/<note_id>"""
+    limit = min(max(request.args.get("limit", NOTES_PAGE_SIZE, type=int), 1), MAX_NOTES_PAGE_SIZE)
+    where, params = [], []
+
+    statuses = [s.strip() for s in request.args.get("status", "").split(",") if s.strip()]
+    if statuses:
+        where.append(f"status IN ({','.join('?' for _ in statuses)})")
+        params.extend(statuses)
+    is_marked = request.args.get("is_marked")
+    if is_marked is not None:
+        if is_marked not in ("0", "1"):
+            return jsonify({"error": "is_marked must be 0 or 1"}), 400
+        where.append("is_marked = ?")
+        params.append(int(is_marked))
+    if request.args.get("due_from"):
+        where.append("due_time >= ?")
+        params.append(request.args["due_from"])
+    if request.args.get("due_to"):
+        where.append("due_time <= ?")
+        params.append(request.args["due_to"])
+    if request.args.get("cursor"):
+        try:
+            where.append("(modified_at, id) < (?, ?)")
+            params.extend(_decode_cursor(request.args["cursor"]))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
     conn = get_db_connection()
-    notes_rows = conn.execute("SELECT * FROM notes ORDER BY modified_at DESC").fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in notes_rows])
+    try:
+        # Lấy dư 1 dòng để biết còn trang sau hay không
+        rows = conn.execute(
+            f"SELECT {NOTE_SUMMARY_COLUMNS} FROM notes {where_sql} ORDER BY modified_at DESC, id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+    finally:
+        conn.close()
 
-import re
+    page = rows[:limit]
+    next_cursor = _encode_cursor(page[-1]) if len(rows) > limit else None
+    return jsonify({"notes": [dict(row) for row in page], "next_cursor": next_cursor, "limit": limit})
 
-# ... (existing imports)
+@notes_bp.route("/api/<note_id>")
+def api_get_note(note_id):
+    """Một ghi chú đầy đủ (title_html/content_html), tải khi mở chi tiết"""
+    conn = get_db_connection()
+    note = conn.execute("SELECT * FROM notes WHERE id = ?", (note_id,)).fetchone()
+    conn.close()
+    if not note:
+        return jsonify({"error": "Không tìm thấy ghi chú"}), 404
+    return jsonify(dict(note))
 
-# Helper function to process Base64 images
-def process_base64_images(content_html):
-    if not content_html:
-        return content_html
-        
-    def replace_match(match):
-        try:
-            full_match = match.group(0)
-            # Extract extension and data
-            m = re.match(r'data:image/(?P<ext>.*?);base64,(?P<data>.*)', full_match, re.DOTALL)
-            if not m:
-                return full_match
-                
-            ext = m.group('ext')
-            data_str = m.group('data')
-            
-            # Normalize extension
-            if 'jpeg' in ext: ext = 'jpg'
-            if '+' in ext: ext = ext.split('+')[0]
-            
-            image_data = base64.b64decode(data_str)
-            filename = f"{uuid.uuid4()}.{ext}"
-            
-            # Ensure folder exists
-            os.makedirs(NOTES_IMAGES_FOLDER, exist_ok=True)
-            
-            file_path = os.path.join(NOTES_IMAGES_FOLDER, filename)
-            with open(file_path, 'wb') as f:
-                f.write(image_data)
-                
-            return f"/notes/images/{filename}"
-        except Exception as e:
-            print(f"Error processing image: {e}")
-            return match.group(0)
-
-    # Find and replace Base64 images
-    # Exclude '&' to prevent consuming HTML entities like &quot;
-    return re.sub(r'data:image/[a-zA-Z0-9+.-]+;base64,[^"\'\s>&]+', replace_match, content_html)
+@notes_bp.route("/api/search")
+def api_search_notes():
+    """Tìm kiếm toàn văn ?q=...&limit=20&offset=0 (không phân biệt dấu), xếp theo độ liên quan"""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Missing search query (q)"}), 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), MAX_SEARCH_LIMIT)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+
+    conn = get_db_connection()
+    try:
+        total, hits = search_notes(conn, query, limit=limit, offset=offset)
+    finally:
+        conn.close()
+    return jsonify({"query": query, "total": total, "limit": limit, "offset": offset, "results": hits})
 
 @notes_bp.route("/api/add", methods=["POST"])
 def api_add_note():
@@ -122,31 +128,34 @@ def api_add_note():
     title_html = data.get("title_html", "").strip()
     content_html = data.get("content_html", "").strip()
     
-    # Process images
-    content_html = process_base64_images(content_html)
+    # Ảnh base64 dán vào -> file theo hash (ghi ở thread pool)
+    content_html = NOTE_IMAGE_STORE.extract_data_uris(content_html)
     
     reminder_time = data.get("reminder_time") or None
     # ... (rest of add logic)
     if not title_html and not content_html:
         return jsonify({"error": "Tiêu đề hoặc nội dung không được để trống"}), 400
     
-    now = datetime.now(timezone.utc).isoformat()
+    now = utc_timestamp()
     new_note = {
         "id": str(uuid.uuid4()), "title_html": title_html, "content_html": content_html,
         "due_time": reminder_time, 
         "status": "active" if reminder_time else "none", 
         "modified_at": now,
-        "is_marked": data.get("is_marked", False)
+        "is_marked": data.get("is_marked", False),
+        # Văn bản thuần tính 1 lần lúc ghi
+        **note_text_fields(title_html, content_html)
     }
 
     conn = get_db_connection()
     conn.execute(
-        "INSERT INTO notes (id, title_html, content_html, due_time, status, modified_at, is_marked) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (new_note['id'], new_note['title_html'], new_note['content_html'], new_note['due_time'], new_note['status'], new_note['modified_at'], new_note['is_marked'])
+        f"INSERT INTO notes ({', '.join(new_note)}) VALUES ({', '.join('?' for _ in new_note)})",
+        tuple(new_note.values())
     )
     conn.commit()
     
     saved_note_row = conn.execute("SELECT * FROM notes WHERE id = ?", (new_note['id'],)).fetchone()
+    REMINDER_ENGINE.refresh(new_note['id'], conn)
     conn.close()
     return jsonify(dict(saved_note_row)), 201
 
@@ -156,15 +165,15 @@ def api_update_note(note_id):
     title_html = data.get("title_html", "").strip()
     content_html = data.get("content_html", "").strip()
     
-    # Process images
-    content_html = process_base64_images(content_html)
+    # Ảnh base64 dán vào -> file theo hash (ghi ở thread pool)
+    content_html = NOTE_IMAGE_STORE.extract_data_uris(content_html)
     
     reminder_time = data.get("reminder_time")
     # ... (rest of update logic)
     if not title_html and not content_html:
         return jsonify({"error": "Tiêu đề hoặc nội dung không được để trống"}), 400
     
-    modified_at = datetime.now(timezone.utc).isoformat()
+    modified_at = utc_timestamp()
 
     conn = get_db_connection()
     
@@ -180,9 +189,10 @@ def api_update_note(note_id):
     else:
         status = current_note['status']
 
+    text_columns = ", ".join(f"{column} = ?" for column in NOTE_TEXT_COLUMNS)
     cursor = conn.execute(
-        "UPDATE notes SET title_html = ?, content_html = ?, due_time = ?, status = ?, modified_at = ? WHERE id = ?",
-        (title_html, content_html, reminder_time, status, modified_at, note_id)
+        f"UPDATE notes SET title_html = ?, content_html = ?, due_time = ?, status = ?, modified_at = ?, {text_columns} WHERE id = ?",
+        (title_html, content_html, reminder_time, status, modified_at, *note_text_values(title_html, content_html), note_id)
     )
     conn.commit()
     
@@ -191,6 +201,7 @@ def api_update_note(note_id):
         return jsonify({"error": "Không tìm thấy ghi chú"}), 404
     
     updated_note = conn.execute("SELECT * FROM notes WHERE id = ?", (note_id,)).fetchone()
+    REMINDER_ENGINE.refresh(note_id, conn)
     conn.close()
     return jsonify(dict(updated_note))
 
@@ -199,6 +210,7 @@ def api_delete_note(note_id):
     conn = get_db_connection()
     cursor = conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
     conn.commit()
+    REMINDER_ENGINE.refresh(note_id, conn)
     conn.close()
     return jsonify({"success": True}) if cursor.rowcount > 0 else (jsonify({"error": "Không tìm thấy ghi chú"}), 404)
 
@@ -224,25 +236,65 @@ def acknowledge_notification(note_id):
     conn.execute("UPDATE notes SET status = 'notified', due_time = NULL WHERE id = ?", (note_id,))
     conn.commit()
     conn.close()
+    REMINDER_ENGINE.acknowledge(note_id)
     return jsonify({"success": True})
 
+@notes_bp.route("/api/batch", methods=["POST"])
+def api_batch_notes():
+    """Nhiều thao tác trong 1 transaction.
+
+    Body: {"operations": [{"op": "mark"|"unmark"|"acknowledge"|"delete", "ids": [...]} hoặc "id": "..."]}
+    Trả về theo thứ tự: [{"op", "done": số ghi chú đã áp dụng, "not_found": [id không tồn tại]}]"""
+    payload = request.get_json(silent=True)
+    operations = payload.get("operations") if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        op = operation.get("op") if isinstance(operation, dict) else None
+        if op not in BATCH_OPERATIONS:
+            return jsonify({"error": f"operations[{index}]: op must be one of {list(BATCH_OPERATIONS)}"}), 400
+        ids = operation.get("ids", [operation["id"]] if "id" in operation else [])
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, str) for i in ids):
+            return jsonify({"error": f"operations[{index}]: id or non-empty ids list required"}), 400
+        parsed.append((op, list(dict.fromkeys(ids))))
+    if sum(len(ids) for _op, ids in parsed) > MAX_BATCH_NOTES:
+        return jsonify({"error": f"At most {MAX_BATCH_NOTES} note ids per batch"}), 400
+
+    results = []
+    unscheduled = set()
+    conn = get_db_connection()
+    try:
+        with conn:
+            for op, ids in parsed:
+                sql = BATCH_OPERATIONS[op].format(ids=", ".join("?" for _ in ids))
+                found = {row["id"] for row in conn.execute(sql, ids).fetchall()}
+                results.append({"op": op, "done": len(found), "not_found": [i for i in ids if i not in found]})
+                if op in ("acknowledge", "delete"):
+                    unscheduled.update(found)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+    # Chỉ cập nhật lịch nhắc sau khi transaction đã commit
+    REMINDER_ENGINE.acknowledge_many(unscheduled)
+    return jsonify({"success": True, "results": results})
+
 @notes_bp.route("/api/check-notifications")
 def api_check_notifications():
     """Endpoint để frontend kiểm tra xem có thông báo mới không."""
-    check_and_queue_reminders()
-    if NOTIFICATIONS_QUEUE:
-        # Lấy thông báo đầu tiên và xóa khỏi hàng đợi
-        notification_to_send = NOTIFICATIONS_QUEUE.pop(0)
-        return jsonify(notification_to_send)
-    return jsonify(None) # Trả về null nếu không có gì
+    # Thread nhắc việc đã đưa thông báo đến hạn vào hàng đợi; ở đây chỉ lấy ra
+    return jsonify(REMINDER_ENGINE.pop_notification()) # Trả về null nếu không có gì
 
 @notes_bp.route("/sounds/<path:filename>")
 def serve_sound(filename):
-    return send_from_directory(os.path.join(DATA_DIR, "sounds"), filename)
+    # Range để trình duyệt tua/phát lại audio; cache ngắn vì file âm báo có thể bị thay
+    return send_media(SOUNDS_FOLDER, filename, max_age=SOUND_MAX_AGE)
 
 @notes_bp.route("/api/upload-image", methods=["POST"])
 def api_upload_image():
-    """Upload image for profile, resize to max 1024px width, return URL"""
+    """Upload image for profile: lưu ảnh gốc theo hash, thumbnail/các mức chiều rộng tạo nền"""
     try:
         if 'image' not in request.files:
             return jsonify({"error": "No image file provided"}), 400
@@ -251,37 +303,57 @@ def api_upload_image():
         if file.filename == '':
             return jsonify({"error": "No selected file"}), 400
         
-        # Create notes_images folder if not exists
-        os.makedirs(NOTES_IMAGES_FOLDER, exist_ok=True)
-        
-        # Generate unique filename
-        ext = os.path.splitext(file.filename)[1].lower()
-        if ext not in ['.png', '.jpg', '.jpeg', '.gif', '.webp']:
-            ext = '.png'
-        
-        unique_filename = f"{uuid.uuid4()}{ext}"
-        file_path = os.path.join(NOTES_IMAGES_FOLDER, unique_filename)
-        
-        # Open and resize image
-        img = Image.open(file.stream)
-        
-        # Resize if width > 1024px
-        if img.width > 1024:
-            ratio = 1024 / img.width
-            new_height = int(img.height * ratio)
-            img = img.resize((1024, new_height), Image.Resampling.LANCZOS)
+        data = file.read()
+        # Chỉ đọc header để xác nhận là ảnh và lấy định dạng (không giải mã/resize trong request)
+        with Image.open(io.BytesIO(data)) as img:
+            image_format = (img.format or '').lower()
+        ext = {'jpeg': 'jpg'}.get(image_format, image_format)
+        if ext not in ['png', 'jpg', 'gif', 'webp']:
+            ext = 'png'
         
-        # Save image
-        img.save(file_path, optimize=True, quality=85)
-        
-        # Return URL
-        image_url = f"/notes/images/{unique_filename}"
-        return jsonify({"success": True, "url": image_url}), 200
+        filename = NOTE_IMAGE_STORE.store_bytes(ext, data)
+        return jsonify({
+            "success": True,
+            "url": f"{NOTES_IMAGES_URL}{filename}",
+            "thumbnail_url": f"{NOTES_THUMBS_URL}{THUMBNAIL_WIDTH}/{filename}",
+        }), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@notes_bp.route("/api/images/gc", methods=["GET", "POST"])
+def api_note_images_gc():
+    """GET: báo cáo lần dọn ảnh gần nhất; POST: dọn ngay (?dry_run=1 chỉ báo cáo)"""
+    if request.method == "GET":
+        return jsonify(NOTE_IMAGE_SWEEPER.status())
+    dry_run = request.args.get("dry_run") in ("1", "true")
+    return jsonify(NOTE_IMAGE_SWEEPER.sweep(dry_run=dry_run))
+
 @notes_bp.route("/images/<path:filename>")
 def serve_note_image(filename):
     """Serve uploaded note images"""
-    return send_from_directory(NOTES_IMAGES_FOLDER, filename)
+    # Ảnh vừa dán có thể còn đang được ghi ở thread pool
+    NOTE_IMAGE_STORE.wait(filename)
+    # Tên file theo hash nội dung (ảnh cũ: uuid) không bao giờ bị ghi đè -> cache vĩnh viễn
+    return send_media(NOTES_IMAGES_FOLDER, filename, immutable=True)
+
+@notes_bp.route("/thumbs/<int:width>/<filename>")
+def serve_note_image_variant(width, filename):
+    """Biến thể ảnh ghi chú (WebP/AVIF theo header Accept), cache dài hạn vì tên theo hash nội dung"""
+    if width not in VARIANT_WIDTHS:
+        return jsonify({"error": f"Width must be one of {list(VARIANT_WIDTHS)}"}), 404
+    NOTE_IMAGE_STORE.wait(filename)
+    if not os.path.isfile(os.path.join(NOTES_IMAGES_FOLDER, filename)):
+        return jsonify({"error": "Image not found"}), 404
+
+    accepted = {mimetype for mimetype, _quality in request.accept_mimetypes}
+    fmt = next((f for f in NOTE_IMAGE_VARIANTS.formats if VARIANT_MIMETYPES[f] in accepted), None)
+    path = NOTE_IMAGE_VARIANTS.get(filename, width, fmt) if fmt else None
+    if path is None:
+        # Trình duyệt không nhận WebP/AVIF hoặc tạo biến thể lỗi: trả ảnh gốc
+        # (không cache dài hạn: lần sau có thể đã có biến thể)
+        response = send_media(NOTES_IMAGES_FOLDER, filename)
+    else:
+        response = send_media(VARIANTS_FOLDER, os.path.basename(path), mimetype=VARIANT_MIMETYPES[fmt], immutable=True)
+    response.vary.add("Accept")
+    return response
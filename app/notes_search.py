@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notes Search
+Tìm ghi chú qua chỉ mục FTS5 notes_fts (xem database.ensure_notes_fts): không phân biệt dấu
+tiếng Việt, xếp hạng bm25 (tiêu đề nặng hơn nội dung), trả về highlight()/snippet() quanh từ khớp
+"""
+
+import html
+import re
+
+# Trọng số bm25 theo cột (title_text, content_text, profile_ids)
+TITLE_WEIGHT = 5.0
+CONTENT_WEIGHT = 1.0
+PROFILE_WEIGHT = 5.0
+SNIPPET_TOKENS = 32
+MAX_SEARCH_LIMIT = 100
+
+# Ký tự đánh dấu tạm trong kết quả SQL: escape HTML xong mới đổi thành <mark>
+_OPEN, _CLOSE = '\x02', '\x03'
+_WORD = re.compile(r'\w+')
+
+
+def fold_text(text):
+    """đ/Đ -> d/D (các dấu còn lại do tokenizer unicode61 bỏ)"""
+    return text.replace('đ', 'd').replace('Đ', 'D')
+
+
+def match_query(query):
+    """Chuỗi người dùng -> biểu thức MATCH: mọi từ đều phải có, khớp tiền tố ("mua"* "sua"*).
+
+    Từ được đặt trong ngoặc kép nên ký tự đặc biệt của cú pháp FTS5 không gây lỗi."""
+    terms = _WORD.findall(fold_text(query or '').lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def fts_available(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes_fts'"
+    ).fetchone() is not None
+
+
+def _render(text, html_marks):
+    text = text or ''
+    if not html_marks:
+        return text.replace(_OPEN, '').replace(_CLOSE, '')
+    return html.escape(text, quote=False).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def search_notes(conn, query, limit=20, offset=0, html_marks=True, snippet_tokens=SNIPPET_TOKENS):
+    """Tìm ghi chú -> (total, hits) theo độ liên quan giảm dần.
+
+    html_marks=True: title_highlight/snippet đã escape HTML, từ khớp bọc trong <mark>;
+    False: văn bản thuần (cho chatbot)."""
+    expr = match_query(query)
+    if not expr:
+        return 0, []
+    if not fts_available(conn):
+        return _search_like(conn, query, limit, offset, html_marks)
+
+    total = conn.execute(
+        'SELECT COUNT(*) FROM notes_fts WHERE notes_fts MATCH ?', (expr,)
+    ).fetchone()[0]
+    # Bước 1 chỉ xếp hạng (rowid, score); snippet()/highlight() tốn kém nên bước 2 chỉ tính
+    # cho các dòng của trang, không phải cho mọi tài liệu khớp
+    ranked = conn.execute(
+        """SELECT rowid, bm25(notes_fts, ?, ?, ?) AS score FROM notes_fts
+           WHERE notes_fts MATCH ? ORDER BY score LIMIT ? OFFSET ?""",
+        (TITLE_WEIGHT, CONTENT_WEIGHT, PROFILE_WEIGHT, expr, limit, offset)
+    ).fetchall()
+    if not ranked:
+        return total, []
+    scores = {row['rowid']: row['score'] for row in ranked}
+    placeholders = ','.join('?' for _ in scores)
+    page = {
+        row['rowid']: row
+        for row in conn.execute(
+            f"""SELECT notes_fts.rowid AS rowid, n.id, n.title_text, n.due_time, n.status,
+                       n.modified_at, n.is_marked, n.cover_image,
+                       highlight(notes_fts, 0, ?, ?) AS title_highlight,
+                       snippet(notes_fts, 1, ?, ?, '…', ?) AS content_snippet
+                FROM notes_fts JOIN notes n ON n.rowid = notes_fts.rowid
+                WHERE notes_fts MATCH ? AND notes_fts.rowid IN ({placeholders})""",
+            (_OPEN, _CLOSE, _OPEN, _CLOSE, snippet_tokens, expr, *scores)
+        )
+    }
+    rows = [page[rowid] for rowid in scores if rowid in page]
+
+    hits = [
+        {
+            'id': row['id'],
+            'title': row['title_text'] or '',
+            'title_highlight': _render(row['title_highlight'], html_marks),
+            'snippet': _render(row['content_snippet'], html_marks),
+            'due_time': row['due_time'],
+            'status': row['status'],
+            'modified_at': row['modified_at'],
+            'is_marked': row['is_marked'],
+            'cover_image': row['cover_image'],
+            # bm25 của SQLite âm, càng nhỏ càng liên quan -> đổi dấu cho dễ đọc
+            'score': round(-scores[row['rowid']], 4),
+        }
+        for row in rows
+    ]
+    return total, hits
+
+
+def _search_like(conn, query, limit, offset, html_marks):
+    """Dự phòng khi SQLite không có FTS5: LIKE trên cột văn bản thuần, mới sửa trước"""
+    # Chuỗi con nguyên văn: escape ký tự đại diện của LIKE
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    pattern = f'%{escaped}%'
+    where = ("WHERE title_text LIKE ? ESCAPE '\\' OR content_text LIKE ? ESCAPE '\\' "
+             "OR profile_ids LIKE ? ESCAPE '\\'")
+    total = conn.execute(f'SELECT COUNT(*) FROM notes {where}', (pattern, pattern, pattern)).fetchone()[0]
+    rows = conn.execute(
+        f"""SELECT id, title_text, snippet, due_time, status, modified_at, is_marked, cover_image
+            FROM notes {where} ORDER BY modified_at DESC LIMIT ? OFFSET ?""",
+        (pattern, pattern, pattern, limit, offset)
+    ).fetchall()
+    hits = [
+        {
+            'id': row['id'],
+            'title': row['title_text'] or '',
+            'title_highlight': _render(row['title_text'], html_marks),
+            'snippet': _render(row['snippet'], html_marks),
+            'due_time': row['due_time'],
+            'status': row['status'],
+            'modified_at': row['modified_at'],
+            'is_marked': row['is_marked'],
+            'cover_image': row['cover_image'],
+            'score': None,
+        }
+        for row in rows
+    ]
+    return total, hits
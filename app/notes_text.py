@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notes Text
+Chuyển title_html/content_html của ghi chú thành văn bản thuần + snippet (và danh sách
+data-profile-id để tìm theo ID profile, ảnh đầu tiên làm thumbnail, các file ảnh được tham
+chiếu), tính 1 lần lúc ghi để các nơi đọc (nhắc việc, chatbot, tìm kiếm, danh sách, dọn ảnh)
+không phải parse HTML mỗi request
+"""
+
+import json
+import re
+from html.parser import HTMLParser
+
+from app.notes_images import NOTES_IMAGES_URL
+
+# Độ dài snippet lưu trong cột notes.snippet
+NOTE_SNIPPET_LENGTH = 300
+# Cột dẫn xuất trong bảng notes (đúng thứ tự key của note_text_fields)
+NOTE_TEXT_COLUMNS = ('title_text', 'content_text', 'snippet', 'profile_ids', 'cover_image', 'image_files')
+
+# Thẻ khối: chèn xuống dòng để chữ ở 2 khối liền nhau không dính vào nhau
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'tr', 'td', 'th', 'table', 'blockquote', 'pre',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'section', 'article',
+}
+SKIP_TAGS = {'script', 'style'}
+
+# Tham chiếu ảnh ở bất kỳ đâu trong HTML (src, data-profile-images, HTML lồng trong thuộc tính)
+_IMAGE_REF = re.compile(re.escape(NOTES_IMAGES_URL) + r'([A-Za-z0-9_-]+\.[A-Za-z0-9]+)')
+_SPACES = re.compile(r'[ \t\r\f\v\u00a0]+')
+_BLANK_LINES = re.compile(r'\s*\n\s*')
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.profile_ids = []
+        self.images = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        profile_id = attrs.get('data-profile-id')
+        if profile_id and profile_id not in self.profile_ids:
+            self.profile_ids.append(profile_id)
+        src = attrs.get('src') or ''
+        if tag == 'img' and src.startswith(NOTES_IMAGES_URL):
+            self.images.append(src[len(NOTES_IMAGES_URL):])
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def _extract(html):
+    parser = _TextExtractor()
+    parser.feed(html or '')
+    parser.close()
+    text = _SPACES.sub(' ', ''.join(parser.parts))
+    return _BLANK_LINES.sub('\n', text).strip(), parser
+
+
+def html_to_text(html):
+    """HTML -> văn bản thuần (giữ xuống dòng giữa các khối, gộp khoảng trắng)"""
+    return _extract(html)[0] if html else ''
+
+
+def make_snippet(text, length=NOTE_SNIPPET_LENGTH):
+    """Đoạn đầu văn bản trên 1 dòng, cắt ở ranh giới từ"""
+    flat = ' '.join(text.split())
+    if len(flat) <= length:
+        return flat
+    cut = flat.rfind(' ', 0, length)
+    return flat[:cut if cut > length // 2 else length].rstrip() + '…'
+
+
+def note_text_fields(title_html, content_html):
+    """Các cột dẫn xuất lưu cùng ghi chú (NOTE_TEXT_COLUMNS)"""
+    title_text, title = _extract(title_html)
+    content_text, content = _extract(content_html)
+    images = title.images + content.images
+    return {
+        'title_text': title_text,
+        'content_text': content_text,
+        'snippet': make_snippet(content_text),
+        'profile_ids': ' '.join(dict.fromkeys(title.profile_ids + content.profile_ids)),
+        'cover_image': images[0] if images else '',
+        # JSON list; trigger trên notes đồng bộ sang bảng note_images
+        'image_files': json.dumps(list(dict.fromkeys(
+            _IMAGE_REF.findall(title_html or '') + _IMAGE_REF.findall(content_html or '')
+        ))),
+    }
+
+
+def note_text_values(title_html, content_html):
+    """Giá trị NOTE_TEXT_COLUMNS theo thứ tự, để ghép vào INSERT/UPDATE"""
+    return tuple(note_text_fields(title_html, content_html).values())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Static Media
+Phục vụ file media dùng chung (ảnh ghi chú + biến thể, âm báo, thumbnail collage): ETag mạnh,
+Cache-Control theo loại file, HTTP Range (audio tua/phát lại), sendfile zero-copy khi server hỗ trợ
+"""
+
+import os
+import re
+
+from flask import Response, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+# File bất biến (tên theo hash nội dung hoặc uuid không bao giờ ghi đè): trình duyệt không hỏi lại
+IMMUTABLE_MAX_AGE = 31536000
+# Âm báo có thể bị thay file cùng tên: cache 1 giờ rồi hỏi lại bằng ETag (304)
+SOUND_MAX_AGE = 3600
+
+# <sha256>.<ext> (ảnh gốc) hoặc <sha256>-<width>.<fmt> (biến thể)
+_CONTENT_NAME = re.compile(r"[0-9a-f]{64}(?:-\d+)?\.[A-Za-z0-9]+")
+
+
+def media_etag(filename, stat):
+    """ETag mạnh: tên file nếu đã theo hash nội dung, không thì mtime_ns-size"""
+    if _CONTENT_NAME.fullmatch(filename):
+        return filename
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def _apply_cache(response, immutable, max_age):
+    response.cache_control.no_cache = None
+    if immutable:
+        max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    if max_age is None:
+        # Không cache dài hạn: luôn hỏi lại, ETag giúp trả 304 không kèm nội dung
+        response.cache_control.no_cache = True
+        return response
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+def send_media(directory, filename, mimetype=None, immutable=False, max_age=None):
+    """Trả file trong directory (NotFound nếu không có / thoát khỏi thư mục).
+
+    immutable: Cache-Control public, max-age 1 năm, immutable; max_age: giây cache (None = no-cache).
+    Range/If-Range/If-None-Match do werkzeug xử lý; thân file đi qua wsgi.file_wrapper (os.sendfile
+    trên waitress/gunicorn) hoặc X-Sendfile khi bật USE_X_SENDFILE sau reverse proxy."""
+    path = safe_join(os.path.abspath(directory), filename)
+    if path is None:
+        raise NotFound()
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise NotFound()
+    if not os.path.isfile(path):
+        raise NotFound()
+
+    etag = media_etag(os.path.basename(path), stat)
+    if request.if_none_match.contains(etag) and not request.range:
+        # Trình duyệt đã có bản này: trả 304 luôn, không mở file
+        response = Response(status=304)
+        response.set_etag(etag)
+        return _apply_cache(response, immutable, max_age)
+
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        etag=etag,
+        last_modified=stat.st_mtime,
+        max_age=None,
+        conditional=True,
+    )
+    if response.status_code == 200:
+        # werkzeug chỉ gửi Accept-Ranges kèm 206; <audio> cần thấy nó ngay ở 200 để cho tua
+        response.accept_ranges = "bytes"
+    return _apply_cache(response, immutable, max_age)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Telegram Session Inventory
+Chỉ mục file .session theo nhóm (filename, phone, size, mtime) trong SQLite
+Quét thư mục tăng dần: chỉ quét lại khi mtime thư mục thay đổi
+"""
+
+import os
+import re
+from datetime import datetime
+
+PHONE_PATTERN = re.compile(r'\+?\d{9,15}')
+
+# Cột cho phép sắp xếp -> biểu thức SQL
+SORT_COLUMNS = {
+    'filename': 'i.filename',
+    'phone': 'i.phone',
+    'size': 'i.size',
+    'mtime': 'i.mtime',
+    'full_name': 'm.full_name',
+    'username': 'm.username',
+    'status': 'm.status_text',
+    'is_live': 'm.is_live',
+    'last_checked': 'm.last_checked',
+}
+
+# Bộ lọc trạng thái -> điều kiện SQL
+STATUS_FILTERS = {
+    'live': 'm.is_live = 1',
+    'dead': 'm.last_checked IS NOT NULL AND (m.is_live = 0 OR m.is_live IS NULL)',
+    'unchecked': 'm.last_checked IS NULL',
+    'broken': 'm.precheck_ok = 0',
+}
+
+
+def extract_phone(filename):
+    """Lấy số điện thoại từ tên file (match Main.pyw)"""
+    phone_match = PHONE_PATTERN.search(filename.replace('.session', ''))
+    return phone_match.group(0) if phone_match else filename
+
+
+def sync_group_inventory(conn, group_id, folder_path, force=False):
+    """Đồng bộ chỉ mục với thư mục nhóm. Trả về True nếu có quét lại.
+
+    Bỏ qua khi mtime thư mục không đổi (thêm/xóa/đổi tên file đều đổi mtime thư mục).
+    Khi quét: chỉ ghi những file mới, đã đổi size/mtime hoặc đã bị xóa."""
+    try:
+        dir_mtime = os.stat(folder_path).st_mtime
+    except OSError:
+        dir_mtime = None
+
+    state = conn.execute(
+        'SELECT dir_mtime FROM session_inventory_state WHERE group_id = ?', (group_id,)
+    ).fetchone()
+    if not force and state and dir_mtime is not None and state['dir_mtime'] == dir_mtime:
+        return False
+
+    on_disk = {}
+    if dir_mtime is not None:
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                if entry.name.endswith('.session') and entry.is_file():
+                    st = entry.stat()
+                    on_disk[entry.name] = (st.st_size, st.st_mtime)
+
+    indexed = {
+        row['filename']: (row['size'], row['mtime'])
+        for row in conn.execute(
+            'SELECT filename, size, mtime FROM session_inventory WHERE group_id = ?', (group_id,)
+        ).fetchall()
+    }
+
+    upserts = [
+        (group_id, name, extract_phone(name), size, mtime)
+        for name, (size, mtime) in on_disk.items()
+        if indexed.get(name) != (size, mtime)
+    ]
+    removed = [(group_id, name) for name in indexed if name not in on_disk]
+
+    if upserts:
+        conn.executemany(
+            """INSERT INTO session_inventory (group_id, filename, phone, size, mtime)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(group_id, filename)
+               DO UPDATE SET phone=excluded.phone, size=excluded.size, mtime=excluded.mtime""",
+            upserts
+        )
+    if removed:
+        conn.executemany('DELETE FROM session_inventory WHERE group_id = ? AND filename = ?', removed)
+    conn.execute(
+        """INSERT INTO session_inventory_state (group_id, dir_mtime, scanned_at) VALUES (?, ?, ?)
+           ON CONFLICT(group_id) DO UPDATE SET dir_mtime=excluded.dir_mtime, scanned_at=excluded.scanned_at""",
+        (group_id, dir_mtime, datetime.now().isoformat())
+    )
+    conn.commit()
+    return True
+
+
+def like_pattern(text):
+    """Chuỗi tìm kiếm -> pattern LIKE '%...%' khớp đúng chuỗi con (escape % _ \\, dùng ESCAPE '\\')"""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def drop_group_inventory(conn, group_id):
+    """Xóa chỉ mục của nhóm (không commit)"""
+    conn.execute('DELETE FROM session_inventory WHERE group_id = ?', (group_id,))
+    conn.execute('DELETE FROM session_inventory_state WHERE group_id = ?', (group_id,))
+
+
+def query_group_sessions(conn, group_id, q=None, status=None, sort='filename', order='asc',
+                         limit=None, offset=0):
+    """Đọc danh sách session từ chỉ mục (join metadata). Trả về (total, rows)."""
+    where = ['i.group_id = ?']
+    params = [group_id]
+    if q:
+        where.append("(i.filename LIKE ? ESCAPE '\\' OR i.phone LIKE ? ESCAPE '\\' "
+                     "OR m.full_name LIKE ? ESCAPE '\\' OR m.username LIKE ? ESCAPE '\\')")
+        params.extend([like_pattern(q)] * 4)
+    if status in STATUS_FILTERS:
+        where.append(STATUS_FILTERS[status])
+
+    base = f"""FROM session_inventory i
+               LEFT JOIN session_metadata m ON m.group_id = i.group_id AND m.filename = i.filename
+               WHERE {' AND '.join(where)}"""
+
+    total = conn.execute(f'SELECT COUNT(*) AS n {base}', params).fetchone()['n']
+
+    sort_expr = SORT_COLUMNS.get(sort, 'i.filename')
+    direction = 'DESC' if str(order).lower() == 'desc' else 'ASC'
+    sql = f"""SELECT i.filename, i.phone, i.size, i.mtime, m.id AS meta_id, m.full_name,
+                     m.username, m.is_live, m.status_text, m.last_checked,
+                     m.precheck_ok, m.precheck_reason
+              {base} ORDER BY {sort_expr} {direction}, i.filename {direction}"""
+    page_params = list(params)
+    if limit is not None:
+        sql += ' LIMIT ? OFFSET ?'
+        page_params.extend([limit, offset])
+    return total, conn.execute(sql, page_params).fetchall()
+
+
+def session_row_to_dict(row, stt):
+    """Định dạng 1 dòng giống response cũ của get_group_sessions (match Main.pyw)"""
+    has_meta = row['meta_id'] is not None
+    # Dòng metadata chỉ có cache pre-check (chưa chạy task nào) vẫn hiển thị như chưa kiểm tra
+    checked = has_meta and (row['last_checked'] is not None or row['full_name'] is not None
+                            or row['username'] is not None)
+    status_text = row['status_text'] if checked else 'Sẵn sàng'
+    if row['precheck_ok'] == 0 and not checked:
+        status_text = f"Session lỗi: {row['precheck_reason']}"
+    return {
+        'stt': stt,
+        'phone': row['phone'],
+        'filename': row['filename'],
+        'full_name': row['full_name'] if checked else 'Chưa kiểm tra',
+        'username': row['username'] if checked else '',
+        'is_live': row['is_live'],
+        'status_text': status_text,
+        'size': row['size'],
+        'mtime': row['mtime'],
+        'last_checked': row['last_checked'],
+    }
+
+
+def plan_check_live(conn, group_id, filenames, skip_fresh_hours=0):
+    """Chính sách freshness cho check-live. Trả về (thứ tự chạy, danh sách bỏ qua).
+
+    Bỏ qua session đã Live trong `skip_fresh_hours` giờ gần nhất (0 = không bỏ qua).
+    Thứ tự: chưa kiểm tra -> đã lỗi/die -> Live cũ; trong mỗi nhóm, kiểm tra lâu nhất trước."""
+    rows = conn.execute(
+        """SELECT filename, is_live, last_checked,
+                  last_checked >= datetime('now', ?) AS fresh
+           FROM session_metadata WHERE group_id = ?""",
+        (f'-{max(0, skip_fresh_hours)} hours', group_id)
+    ).fetchall()
+    meta = {row['filename']: row for row in rows}
+
+    def priority(filename):
+        row = meta.get(filename)
+        if row is None or row['last_checked'] is None:
+            return (0, '')
+        return (1 if not row['is_live'] else 2, row['last_checked'])
+
+    ordered, skipped = [], []
+    for filename in dict.fromkeys(filenames):
+        row = meta.get(filename)
+        if skip_fresh_hours > 0 and row is not None and row['is_live'] and row['fresh']:
+            skipped.append(filename)
+        else:
+            ordered.append(filename)
+    ordered.sort(key=priority)
+    return ordered, skipped
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Telegram Task Metrics
+Telemetry từng session (connect/authorize/throttle/RPC/DB, proxy, lớp lỗi) lưu cùng
+telegram_task_results; tổng hợp p50/p95/p99, throughput và thời gian ngủ/làm việc của task
+"""
+
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from app.database import get_db_connection
+
+# Pha đo thời gian -> cột (ms) trong telegram_task_results
+TIMING_PHASES = ('connect', 'authorize', 'throttle', 'rpc', 'db', 'total')
+TIMING_COLUMNS = tuple(f'{phase}_ms' for phase in TIMING_PHASES)
+PERCENTILES = (50, 95, 99)
+
+
+@contextmanager
+def timed(timings, phase):
+    """Cộng dồn thời gian (giây) của khối lệnh vào timings[phase] (timings None -> bỏ qua)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - started
+
+
+def to_telemetry(timings, proxy):
+    """timings (giây) -> dict cột telemetry (ms) cho TASK_STORE.record_result"""
+    telemetry = {'proxy': proxy}
+    for phase, column in zip(TIMING_PHASES, TIMING_COLUMNS):
+        if phase in timings:
+            telemetry[column] = round(timings[phase] * 1000, 1)
+    return telemetry
+
+
+def percentile(sorted_values, pct):
+    """Percentile nội suy tuyến tính trên list đã sắp xếp"""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def summarize(values):
+    """count/avg/max + p50/p95/p99 (ms) của 1 pha"""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    summary = {
+        'count': len(values),
+        'avg': round(sum(values) / len(values), 1),
+        'max': round(values[-1], 1),
+    }
+    for pct in PERCENTILES:
+        summary[f'p{pct}'] = round(percentile(values, pct), 1)
+    return summary
+
+
+def task_metrics(task_id, live_sleep_seconds=None, live_active_seconds=None):
+    """Tổng hợp telemetry của task. None nếu task không tồn tại.
+
+    live_sleep_seconds / live_active_seconds: thời gian ngủ / thời gian chạy đang tích lũy trong
+    bộ nhớ (task chưa kết thúc). wall_seconds chỉ tính lúc task thực sự chạy, không tính khoảng
+    app tắt giữa các lần chạy tiếp."""
+    conn = get_db_connection()
+    try:
+        task = conn.execute('SELECT * FROM telegram_tasks WHERE id = ?', (task_id,)).fetchone()
+        if not task:
+            return None
+        rows = conn.execute(
+            f"""SELECT created_at, is_live, error_class, proxy, {', '.join(TIMING_COLUMNS)}
+                FROM telegram_task_results WHERE task_id = ? ORDER BY seq""",
+            (task_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    params = json.loads(task['params_json'] or '{}')
+    core = max(1, int(params.get('core') or 1))
+    if live_active_seconds is not None:
+        wall_seconds = live_active_seconds
+    elif task['started_at'] is not None:
+        wall_seconds = task['active_seconds'] or 0.0
+    else:
+        # Task cũ chưa có started_at/active_seconds
+        started = datetime.fromisoformat(task['created_at'])
+        finished = datetime.fromisoformat(task['finished_at']) if task['finished_at'] else datetime.now()
+        wall_seconds = max(0.0, (finished - started).total_seconds())
+    sleep_seconds = live_sleep_seconds if live_sleep_seconds is not None else (task['sleep_seconds'] or 0.0)
+    # Tổng thời gian xử lý session (cộng dồn qua các slot core chạy song song)
+    work_seconds = sum(row['total_ms'] or 0 for row in rows) / 1000
+
+    by_proxy = defaultdict(lambda: {'sessions': 0, 'errors': 0, 'connect_ms': [], 'total_ms': []})
+    for row in rows:
+        stat = by_proxy[row['proxy'] or 'direct']
+        stat['sessions'] += 1
+        stat['errors'] += 1 if row['error_class'] else 0
+        stat['connect_ms'].append(row['connect_ms'])
+        stat['total_ms'].append(row['total_ms'])
+
+    return {
+        'task_id': task_id,
+        'task_name': task['task_name'],
+        'status': task['status'],
+        'core': core,
+        'delay_per_session': params.get('delay_per_session'),
+        'delay_between_batches': params.get('delay_between_batches'),
+        'sessions': len(rows),
+        'wall_seconds': round(wall_seconds, 1),
+        'sleep_seconds': round(sleep_seconds, 1),
+        'work_seconds': round(work_seconds, 1),
+        # Tỉ lệ sử dụng slot: 1.0 = cả `core` slot luôn bận suốt thời gian chạy
+        'utilization': round(work_seconds / (wall_seconds * core), 3) if wall_seconds else None,
+        'sessions_per_minute': round(len(rows) / (wall_seconds / 60), 2) if wall_seconds else None,
+        'timings_ms': {
+            phase: summarize(row[column] for row in rows)
+            for phase, column in zip(TIMING_PHASES, TIMING_COLUMNS)
+        },
+        'errors': dict(Counter(row['error_class'] for row in rows if row['error_class'])),
+        'proxies': {
+            proxy: {
+                'sessions': stat['sessions'],
+                'error_rate': round(stat['errors'] / stat['sessions'], 3),
+                'connect_ms': summarize(stat['connect_ms']),
+                'total_ms': summarize(stat['total_ms']),
+            }
+            for proxy, stat in by_proxy.items()
+        },
+    }
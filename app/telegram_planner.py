@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Telegram Seeding Planner
+Lập trước toàn bộ kế hoạch seeding (session -> nhóm -> tin nhắn -> proxy -> thời điểm)
+theo nhịp từng nhóm và giới hạn mỗi session; lưu vào SQLite để chạy/resume/dry-run
+"""
+
+import json
+import random
+from collections import Counter
+
+from app.database import get_db_connection
+
+# Số bước mẫu trả về trong dry-run
+DRY_RUN_SAMPLE_SIZE = 100
+
+
+def build_seeding_plan(filenames, config, delay_per_session, delay_between_batches,
+                       admin_enabled=False, admin_delay=0, proxies=None):
+    """Lập kế hoạch seeding. Trả về list bước theo thứ tự thời gian.
+
+    - Mỗi bước seeding: session gửi 1 tin vào nhóm rảnh sớm nhất mà session chưa gửi.
+    - Nhịp nhóm (`group_interval`, mặc định delay_between_batches): khoảng cách tối thiểu
+      giữa 2 tin trong cùng nhóm. Hai bước bất kỳ cách nhau ít nhất delay_per_session.
+    - Giới hạn session (`max_messages_per_session`, mặc định 1) và khoảng cách tối thiểu
+      giữa 2 tin của cùng session (`session_interval`, mặc định bằng nhịp nhóm).
+    - Admin (nếu bật): sau mỗi vòng len(group_links) tin, admin trả lời 1 nhóm (xoay vòng)
+      sau admin_delay giây, giống logic sau mỗi đợt trước đây.
+    - Proxy gán cố định theo session (xoay vòng danh sách proxy)."""
+    group_links = config.get('group_links', [])
+    messages = config.get('messages', []) or ['']
+    if not group_links or not filenames:
+        return []
+
+    group_interval = float(config.get('group_interval', delay_between_batches))
+    session_interval = float(config.get('session_interval', group_interval))
+    max_per_session = max(1, int(config.get('max_messages_per_session', 1)))
+    stagger = max(0.0, float(delay_per_session))
+    proxies = proxies or []
+
+    group_free = {link: 0.0 for link in group_links}
+    session_free = {}
+    session_groups = {}
+    session_proxy = {
+        filename: proxies[i % len(proxies)] if proxies else None
+        for i, filename in enumerate(filenames)
+    }
+
+    admin_messages = config.get('admin_messages', [])
+    admin_session_file = config.get('admin_session_file')
+    with_admin = bool(admin_enabled and admin_session_file and admin_messages)
+
+    steps = []
+    next_start = 0.0
+    message_index = 0
+    admin_group_index = 0
+    seeded_in_round = 0
+    for _ in range(max_per_session):
+        for filename in filenames:
+            used = session_groups.setdefault(filename, set())
+            candidates = [link for link in group_links if link not in used] or group_links
+            group_link = min(candidates, key=lambda link: group_free[link])
+
+            offset = max(next_start, group_free[group_link], session_free.get(filename, 0.0))
+            next_start = offset + stagger
+            group_free[group_link] = offset + group_interval
+            session_free[filename] = offset + session_interval
+            used.add(group_link)
+
+            steps.append({
+                'kind': 'seed',
+                'filename': filename,
+                'group_link': group_link,
+                'message': messages[message_index % len(messages)],
+                'proxy': session_proxy[filename],
+                'offset_seconds': offset,
+            })
+            message_index += 1
+            seeded_in_round += 1
+
+            if with_admin and seeded_in_round == len(group_links):
+                seeded_in_round = 0
+                steps.append({
+                    'kind': 'admin',
+                    'filename': admin_session_file,
+                    'group_link': group_links[admin_group_index],
+                    'message': random.choice(admin_messages),
+                    'proxy': None,  # Admin không dùng proxy (match Main.pyw)
+                    'offset_seconds': offset + max(0, admin_delay),
+                })
+                admin_group_index = (admin_group_index + 1) % len(group_links)
+
+    steps.sort(key=lambda step: step['offset_seconds'])
+    for index, step in enumerate(steps):
+        step['step'] = index
+    return steps
+
+
+def summarize_plan(steps, sample_size=DRY_RUN_SAMPLE_SIZE):
+    """Tóm tắt kế hoạch cho dry-run (số bước, thời lượng ước tính, phân bố theo nhóm/session)."""
+    seeds = [step for step in steps if step['kind'] == 'seed']
+    per_session = Counter(step['filename'] for step in seeds)
+    return {
+        'total_steps': len(steps),
+        'seed_steps': len(seeds),
+        'admin_steps': len(steps) - len(seeds),
+        'sessions': len(per_session),
+        'estimated_duration_seconds': round(steps[-1]['offset_seconds']) if steps else 0,
+        'messages_per_group': dict(Counter(step['group_link'] for step in seeds)),
+        'max_messages_per_session': max(per_session.values()) if per_session else 0,
+        'messages_per_proxy': dict(Counter(step['proxy'] or 'direct' for step in seeds)),
+        'sample': steps[:sample_size],
+    }
+
+
+def save_plan(task_id, steps):
+    """Lưu kế hoạch của task (thay thế kế hoạch cũ nếu có)."""
+    conn = get_db_connection()
+    try:
+        conn.execute('DELETE FROM seeding_plan_steps WHERE task_id = ?', (task_id,))
+        conn.executemany(
+            """INSERT INTO seeding_plan_steps
+               (task_id, step, kind, filename, group_link, message_json, proxy, offset_seconds, status)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending')""",
+            [
+                (task_id, step['step'], step['kind'], step['filename'], step['group_link'],
+                 json.dumps(step['message'], ensure_ascii=False), step['proxy'], step['offset_seconds'])
+                for step in steps
+            ]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_pending_steps(task_id):
+    """Các bước chưa chạy của task (resume), theo thứ tự thời gian."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            """SELECT step, kind, filename, group_link, message_json, proxy, offset_seconds
+               FROM seeding_plan_steps WHERE task_id = ? AND status = 'pending'
+               ORDER BY offset_seconds, step""",
+            (task_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {
+            'step': row['step'],
+            'kind': row['kind'],
+            'filename': row['filename'],
+            'group_link': row['group_link'],
+            'message': json.loads(row['message_json']),
+            'proxy': row['proxy'],
+            'offset_seconds': row['offset_seconds'],
+        }
+        for row in rows
+    ]
+
+
+def has_plan(task_id):
+    conn = get_db_connection()
+    try:
+        row = conn.execute('SELECT 1 FROM seeding_plan_steps WHERE task_id = ? LIMIT 1', (task_id,)).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def mark_step(task_id, step, status):
+    """Cập nhật trạng thái 1 bước (done / failed)."""
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            'UPDATE seeding_plan_steps SET status = ? WHERE task_id = ? AND step = ?',
+            (status, task_id, step)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def plan_progress(task_id):
+    """Số bước theo trạng thái của kế hoạch đã lưu."""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            'SELECT status, COUNT(*) AS n FROM seeding_plan_steps WHERE task_id = ? GROUP BY status',
+            (task_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return {row['status']: row['n'] for row in rows}
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Telegram Rate Limiter
+Token bucket theo session và theo nhóm đích, tôn trọng FloodWait của Telegram
+Dùng cho join/seeding workers thay cho asyncio.sleep cố định
+"""
+
+import asyncio
+import threading
+import time
+
+# Tốc độ mặc định mỗi session (request/giây) và burst
+SESSION_RATE = 0.5
+SESSION_BURST = 3
+# Tốc độ tối thiểu/tối đa khi tự điều chỉnh (AIMD) theo FloodWait
+SESSION_MIN_RATE = 1 / 60
+SESSION_MAX_RATE = 1.0
+SESSION_RATE_STEP = 0.02
+# Tốc độ mặc định mỗi nhóm đích (tổng mọi session)
+TARGET_RATE = 1.0
+TARGET_BURST = 5
+# FloodWait dài hơn ngưỡng này: không chờ trong worker, trả về để chạy lại sau
+MAX_INLINE_FLOOD_WAIT = 300
+
+
+class TokenBucket:
+    """Token bucket đơn giản; reserve() trả số giây cần chờ cho token kế tiếp."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now):
+        """Lấy 1 token (có thể âm = đặt trước) và trả về thời gian phải chờ."""
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class FloodWaitLimiter:
+    """Giới hạn theo session + theo target; FloodWait chặn session đúng thời gian
+    Telegram yêu cầu và giảm tốc session đó (tăng dần lại khi thành công)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._targets = {}
+
+    def _session(self, key):
+        state = self._sessions.get(key)
+        if state is None:
+            state = {
+                'bucket': TokenBucket(SESSION_RATE, SESSION_BURST),
+                'blocked_until': 0.0,
+                'waited': 0.0,
+                'flood_waits': 0,
+                'flood_wait_seconds': 0,
+                'requests': 0,
+            }
+            self._sessions[key] = state
+        return state
+
+    def _target(self, target):
+        bucket = self._targets.get(target)
+        if bucket is None:
+            bucket = TokenBucket(TARGET_RATE, TARGET_BURST)
+            self._targets[target] = bucket
+        return bucket
+
+    def reserve(self, session_key, target=None):
+        """Đặt chỗ cho 1 request, trả số giây cần chờ trước khi gửi."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._session(session_key)
+            wait = state['bucket'].reserve(now)
+            if target:
+                wait = max(wait, self._target(target).reserve(now))
+            wait = max(wait, state['blocked_until'] - now)
+            state['waited'] += wait
+            state['requests'] += 1
+            return wait
+
+    async def acquire(self, session_key, target=None):
+        """Chờ tới khi session được phép gửi request tới target."""
+        wait = self.reserve(session_key, target)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def flood_wait(self, session_key, seconds):
+        """Ghi nhận FloodWait: chặn session `seconds` giây và giảm tốc độ."""
+        with self._lock:
+            state = self._session(session_key)
+            state['blocked_until'] = max(state['blocked_until'], time.monotonic() + seconds)
+            state['flood_waits'] += 1
+            state['flood_wait_seconds'] += seconds
+            bucket = state['bucket']
+            bucket.rate = max(SESSION_MIN_RATE, bucket.rate / 2)
+
+    def success(self, session_key):
+        """Request thành công: tăng dần tốc độ session lên lại."""
+        with self._lock:
+            bucket = self._session(session_key)['bucket']
+            bucket.rate = min(SESSION_MAX_RATE, bucket.rate + SESSION_RATE_STEP)
+
+    def session_wait(self, session_key):
+        with self._lock:
+            state = self._sessions.get(session_key)
+            return round(state['waited'], 1) if state else 0.0
+
+    def stats(self):
+        """Thống kê chờ theo session (cho API)."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    'requests': state['requests'],
+                    'waited_seconds': round(state['waited'], 1),
+                    'flood_waits': state['flood_waits'],
+                    'flood_wait_seconds': state['flood_wait_seconds'],
+                    'blocked_for': max(0, round(state['blocked_until'] - now)),
+                    'rate_per_minute': round(state['bucket'].rate * 60, 2),
+                }
+                for key, state in self._sessions.items()
+            }
+
+
+# Singleton dùng chung mọi task (giới hạn Telegram tính theo tài khoản, không theo task)
+TELEGRAM_LIMITER = FloodWaitLimiter()
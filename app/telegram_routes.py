@@ -10,10 +10,9 @@ from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 import os
 import json
-import uuid
+import asyncio
 import traceback
 import shutil
-import re
 import sqlite3
 from datetime import datetime
 from pathlib import Path
@@ -26,6 +25,34 @@ from app.telegram_workers import (
     seeding_group_worker,
     run_task_in_thread
 )
+from app.telegram_tasks import TASK_STORE
+from app.telegram_metrics import task_metrics
+from app.telegram_proxies import PROXY_MANAGER, DEAD_PROXY_TTL_HOURS, check_proxies
+from app.telegram_ratelimit import TELEGRAM_LIMITER
+from app.telegram_sessions import (
+    UPLOAD_JOBS,
+    STREAM_CHUNK_SIZE,
+    count_archive_members,
+    import_session_archive,
+    precheck_group_sessions,
+    bulk_delete_sessions,
+    bulk_move_sessions,
+    SessionFileOpError
+)
+from app.telegram_planner import (
+    build_seeding_plan,
+    summarize_plan,
+    has_plan,
+    load_pending_steps,
+    plan_progress
+)
+from app.telegram_inventory import (
+    sync_group_inventory,
+    drop_group_inventory,
+    query_group_sessions,
+    session_row_to_dict,
+    plan_check_live
+)
 
 # Tạo Blueprint cho Telegram
 telegram_bp = Blueprint('telegram', __name__, url_prefix='/telegram')
@@ -37,9 +64,6 @@ DATABASE_PATH = DATA_DIR / 'Data.db'
 UPLOAD_FOLDER = DATA_DIR / 'uploaded_sessions'
 ADMIN_SESSION_FOLDER = "Adminsession"
 
-# Global task storage (in-memory, like Main.pyw)
-TASKS = {}
-
 # Tạo thư mục nếu chưa có
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
@@ -60,7 +84,32 @@ def load_proxies():
                 return json.load(f)
         except:
             pass
-    return {'enabled': False, 'proxies': []}
+    return {'enabled': False, 'proxies': [], 'sticky_sessions': False}
+
+
+def load_proxy_check():
+    """ Kết quả pre-flight check proxy lần gần nhất"""
+    check_file = DATA_DIR / 'telegram' / 'proxy_check.json'
+    if check_file.exists():
+        try:
+            with open(check_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except:
+            pass
+    return {'checked_at': None, 'results': []}
+
+
+def proxy_dead_ttl(proxy_config):
+    """ Số giây proxy check thất bại bị loại khỏi vòng chọn"""
+    try:
+        return float(proxy_config.get('dead_ttl_hours', DEAD_PROXY_TTL_HOURS)) * 3600
+    except (TypeError, ValueError):
+        return DEAD_PROXY_TTL_HOURS * 3600
+
+
+def restore_proxy_check():
+    """ Khởi động: nạp lại proxy chết theo lần check đã lưu (gọi trong create_app)"""
+    PROXY_MANAGER.load_check(load_proxy_check(), dead_ttl=proxy_dead_ttl(load_proxies()))
 
 
 def save_proxies(proxy_config):
@@ -116,11 +165,12 @@ def manage_groups():
                     file.save(os.path.join(group_path, secure_filename(file.filename)))
                     saved_count += 1
             try:
-                conn.execute(
+                cursor = conn.execute(
                     'INSERT INTO session_groups (name, folder_path) VALUES (?, ?)',
                     (name, group_path),
                 )
                 conn.commit()
+                sync_group_inventory(conn, cursor.lastrowid, group_path, force=True)
                 return jsonify({'success': True, 'message': f'Tạo nhóm thành công với {saved_count} sessions'}), 201
             except sqlite3.IntegrityError:
                 shutil.rmtree(group_path)
@@ -145,6 +195,12 @@ def delete_group(group_id):
         if group and os.path.exists(group['folder_path']):
             shutil.rmtree(group['folder_path'])
         conn.execute('DELETE FROM session_metadata WHERE group_id = ?', (group_id,))
+        drop_group_inventory(conn, group_id)
+        conn.execute(
+            'DELETE FROM schedule_runs WHERE schedule_id IN '
+            '(SELECT id FROM schedules WHERE target_session_group_id = ?)', (group_id,)
+        )
+        conn.execute('DELETE FROM schedules WHERE target_session_group_id = ?', (group_id,))
         conn.execute('DELETE FROM session_groups WHERE id = ?', (group_id,))
         conn.commit()
         
@@ -168,39 +224,68 @@ def get_group_sessions(group_id):
         if not group:
             return jsonify({'error': 'Không tìm thấy nhóm'}), 404
         
-        # Lấy metadata từ database
-        metadata_rows = conn.execute(
-            'SELECT * FROM session_metadata WHERE group_id = ?', (group_id,)
-        ).fetchall()
+        # Đồng bộ chỉ mục (chỉ quét lại khi thư mục thay đổi)
+        sync_group_inventory(conn, group_id, group['folder_path'])
+        
+        q = request.args.get('q', '').strip() or None
+        status = request.args.get('status')
+        sort = request.args.get('sort', 'filename')
+        order = request.args.get('order', 'asc')
+        
+        # Không có ?page= -> trả toàn bộ danh sách như cũ (match Main.pyw)
+        if 'page' not in request.args:
+            _, rows = query_group_sessions(conn, group_id, q=q, status=status, sort=sort, order=order)
+            sessions = [session_row_to_dict(row, i + 1) for i, row in enumerate(rows)]
+            return jsonify(sessions)
+        
+        page = max(1, request.args.get('page', 1, type=int))
+        page_size = max(1, min(request.args.get('page_size', 100, type=int), 1000))
+        offset = (page - 1) * page_size
+        total, rows = query_group_sessions(
+            conn, group_id, q=q, status=status, sort=sort, order=order,
+            limit=page_size, offset=offset
+        )
+        return jsonify({
+            'items': [session_row_to_dict(row, offset + i + 1) for i, row in enumerate(rows)],
+            'total': total,
+            'page': page,
+            'page_size': page_size
+        })
         
-        metadata_map = {row['filename']: dict(row) for row in metadata_rows}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        conn.close()
+
+
+@telegram_bp.route('/api/groups/<int:group_id>/precheck', methods=['POST'])
+def precheck_group(group_id):
+    """Pre-check cục bộ toàn bộ session trong nhóm (không kết nối mạng)"""
+    conn = get_db_connection()
+    try:
+        group = conn.execute(
+            'SELECT folder_path FROM session_groups WHERE id = ?', (group_id,)
+        ).fetchone()
         
-        sessions = []
-        folder_path = group['folder_path']
+        if not group:
+            return jsonify({'error': 'Không tìm thấy nhóm'}), 404
         
-        if os.path.exists(folder_path):
-            session_files = sorted(
-                [f for f in os.listdir(folder_path) if f.endswith('.session')]
-            )
-            
-            for i, filename in enumerate(session_files):
-                meta = metadata_map.get(filename, {})
-                
-                # Extract phone từ filename
-                phone_match = re.search(r'\+?\d{9,15}', filename.replace('.session', ''))
-                phone = phone_match.group(0) if phone_match else filename
-                
-                sessions.append({
-                    'stt': i + 1,
-                    'phone': phone,
-                    'filename': filename,
-                    'full_name': meta.get('full_name', 'Chưa kiểm tra'),
-                    'username': meta.get('username', ''),
-                    'is_live': meta.get('is_live'),
-                    'status_text': meta.get('status_text', 'Sẵn sàng'),
-                })
-        
-        return jsonify(sessions)
+        sync_group_inventory(conn, group_id, group['folder_path'])
+        filenames = [
+            row['filename'] for row in conn.execute(
+                'SELECT filename FROM session_inventory WHERE group_id = ?', (group_id,)
+            ).fetchall()
+        ]
+        results = precheck_group_sessions(conn, group_id, group['folder_path'], filenames)
+        broken = [
+            {'filename': filename, 'reason': reason}
+            for filename, (ok, reason) in sorted(results.items()) if not ok
+        ]
+        return jsonify({
+            'total': len(results),
+            'ok': len(results) - len(broken),
+            'broken': broken
+        })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -208,6 +293,95 @@ def get_group_sessions(group_id):
         conn.close()
 
 
+def _run_archive_import(job_id, archive_path, group_name, group_path):
+    """ Thread: giải nén archive vào thư mục nhóm rồi đăng ký hàng loạt vào DB"""
+    try:
+        UPLOAD_JOBS.update(job_id, status='extracting', total_entries=count_archive_members(archive_path))
+        imported, invalid, duplicates = import_session_archive(
+            archive_path, group_path,
+            progress=lambda done, bad: UPLOAD_JOBS.update(job_id, imported=done, invalid=bad)
+        )
+        
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                'INSERT INTO session_groups (name, folder_path) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET folder_path=excluded.folder_path',
+                (group_name, group_path),
+            )
+            conn.commit()
+            group = conn.execute('SELECT id FROM session_groups WHERE name = ?', (group_name,)).fetchone()
+            sync_group_inventory(conn, group['id'], group_path, force=True)
+        finally:
+            conn.close()
+        
+        UPLOAD_JOBS.update(job_id, status='completed', imported=len(imported), invalid=invalid,
+                           duplicates=duplicates, group_id=group['id'])
+    except Exception as e:
+        UPLOAD_JOBS.update(job_id, status='failed', error=str(e))
+    finally:
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+
+
+@telegram_bp.route('/api/groups/import-archive', methods=['POST'])
+def import_group_archive():
+    """ Import nhóm session từ 1 archive zip/tar (stream body, giải nén nền)"""
+    try:
+        name = (request.args.get('name') or request.form.get('name') or '').strip()
+        if not name:
+            return jsonify({'error': 'Tên nhóm không được trống'}), 400
+        
+        # Nhóm đã tồn tại -> thêm session vào thư mục hiện có
+        conn = get_db_connection()
+        group = conn.execute('SELECT folder_path FROM session_groups WHERE name = ?', (name,)).fetchone()
+        conn.close()
+        if group:
+            group_path = group['folder_path']
+        elif name == ADMIN_SESSION_FOLDER:
+            group_path = os.path.join(UPLOAD_FOLDER, ADMIN_SESSION_FOLDER)
+        else:
+            group_path = os.path.join(UPLOAD_FOLDER, secure_filename(name))
+        
+        job_id = UPLOAD_JOBS.create(name)
+        tmp_dir = DATA_DIR / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        archive_path = str(tmp_dir / f'{job_id}.archive')
+        
+        archive_file = request.files.get('archive')
+        if archive_file:
+            archive_file.save(archive_path)
+            UPLOAD_JOBS.update(job_id, bytes_received=os.path.getsize(archive_path))
+        else:
+            # Body thô: ghi từng chunk ra đĩa, không giữ cả archive trong RAM
+            received = 0
+            with open(archive_path, 'wb') as f:
+                while True:
+                    chunk = request.stream.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    received += len(chunk)
+                    UPLOAD_JOBS.update(job_id, bytes_received=received)
+        
+        thread = Thread(target=_run_archive_import, args=(job_id, archive_path, name, group_path))
+        thread.daemon = True
+        thread.start()
+        
+        return jsonify({'success': True, 'job_id': job_id}), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@telegram_bp.route('/api/uploads/<job_id>')
+def get_upload_job(job_id):
+    """ Tiến độ import archive"""
+    job = UPLOAD_JOBS.get(job_id)
+    if not job:
+        return jsonify({'error': 'Không tìm thấy job'}), 404
+    return jsonify(job)
+
+
 @telegram_bp.route('/api/upload-admin-sessions', methods=['POST'])
 def upload_admin_sessions():
     """ Upload admin sessions (match Main.pyw)"""
@@ -237,6 +411,10 @@ def upload_admin_sessions():
                 (ADMIN_SESSION_FOLDER, admin_folder_path),
             )
             conn.commit()
+            admin_group = conn.execute(
+                'SELECT id FROM session_groups WHERE name = ?', (ADMIN_SESSION_FOLDER,)
+            ).fetchone()
+            sync_group_inventory(conn, admin_group['id'], admin_folder_path, force=True)
         finally:
             conn.close()
         
@@ -249,6 +427,35 @@ def upload_admin_sessions():
         return jsonify({'error': str(e)}), 500
 
 
+def load_task_config(task_name):
+    """ Đọc cấu hình đã lưu của task (dùng ngoài request, vd: auto seeding)"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            'SELECT config_json FROM task_configs WHERE task_name = ?', (task_name,)
+        ).fetchone()
+        return json.loads(row['config_json']) if row else {}
+    finally:
+        conn.close()
+
+
+def list_group_filenames(group_id, exclude_dead=False):
+    """ Danh sách file session của nhóm từ chỉ mục (exclude_dead: bỏ session đã biết là die)"""
+    conn = get_db_connection()
+    try:
+        group = conn.execute('SELECT folder_path FROM session_groups WHERE id = ?', (group_id,)).fetchone()
+        if not group:
+            return []
+        sync_group_inventory(conn, group_id, group['folder_path'])
+        _, rows = query_group_sessions(conn, group_id)
+        return [
+            row['filename'] for row in rows
+            if not (exclude_dead and row['last_checked'] is not None and not row['is_live'])
+        ]
+    finally:
+        conn.close()
+
+
 @telegram_bp.route('/api/config/<task_name>', methods=['GET', 'POST'])
 def manage_config(task_name):
     """ Lấy hoặc lưu cấu hình task (match Main.pyw)"""
@@ -295,10 +502,14 @@ def update_proxies():
         
         proxy_config = {
             'enabled': enabled,
-            'proxies': proxies
+            'proxies': proxies,
+            # Gán lại session vào proxy thành công gần nhất
+            'sticky_sessions': bool(data.get('sticky_sessions', False)),
+            'dead_ttl_hours': data.get('dead_ttl_hours', load_proxies().get('dead_ttl_hours', DEAD_PROXY_TTL_HOURS))
         }
         
         save_proxies(proxy_config)
+        PROXY_MANAGER.dead_ttl = proxy_dead_ttl(proxy_config)
         
         return jsonify({'success': True, 'message': f'Đã lưu {len(proxies)} proxy.'})
         
@@ -306,90 +517,272 @@ def update_proxies():
         return jsonify({'error': str(e)}), 500
 
 
+def resolve_task_worker(task_name, config):
+    """ Chọn worker function + args theo tên task (match Main.pyw)"""
+    if task_name == "check-live":
+        return check_single_session_worker, []
+    if task_name == "joinGroup":
+        return join_group_worker, [config.get("links", [])]
+    if task_name == "seedingGroup":
+        return seeding_group_worker, [config]  # Pass whole config
+    return None, []
+
+
+def start_task_thread(task_id, params, filenames):
+    """ Khởi chạy thread worker cho task với danh sách filenames"""
+    worker_func, args = resolve_task_worker(params['task_name'], params.get('config', {}))
+    
+    # Load proxies
+    proxy_config = load_proxies()
+    proxies_to_use = proxy_config['proxies'] if proxy_config.get('enabled', False) else []
+    
+    thread = Thread(
+        target=run_task_in_thread,
+        args=(
+            task_id, params['group_id'], params['folder_path'], filenames, params['core'],
+            params['delay_per_session'], params['delay_between_batches'],
+            params['admin_enabled'], params['admin_delay'],
+            worker_func, params['upload_folder'], *args
+        ),
+        kwargs={"proxies": proxies_to_use, "sticky_proxies": proxy_config.get('sticky_sessions', False)}
+    )
+    thread.daemon = True
+    thread.start()
+
+
+@telegram_bp.route('/api/proxies/health', methods=['GET'])
+def get_proxy_health():
+    """ Số liệu sức khỏe proxy (latency, tỉ lệ thành công, cách ly)"""
+    proxy_config = load_proxies()
+    return jsonify(PROXY_MANAGER.snapshot(proxy_config.get('proxies', [])))
+
+
+@telegram_bp.route('/api/proxies/check', methods=['GET', 'POST'])
+def check_proxies_route():
+    """ Pre-flight check song song toàn bộ proxy (TCP + SOCKS5 handshake)"""
+    if request.method == 'GET':
+        return jsonify(load_proxy_check())
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        concurrency = max(1, min(int(data.get('concurrency', 20)), 100))
+        timeout = max(1.0, min(float(data.get('timeout', 5)), 30.0))
+        proxies = load_proxies().get('proxies', [])
+        
+        results = asyncio.run(check_proxies(proxies, concurrency=concurrency, timeout=timeout))
+        checked_at = datetime.now()
+        
+        # Đưa kết quả vào PROXY_MANAGER: proxy chết bị loại tới lần check kế tiếp
+        for item in results:
+            latency = item['latency_ms'] / 1000 if item['latency_ms'] is not None else None
+            PROXY_MANAGER.record_check(item['proxy'], item['ok'], latency=latency, error=item['error'],
+                                       checked_at=checked_at.timestamp())
+        
+        check_result = {'checked_at': checked_at.isoformat(), 'results': results}
+        check_file = DATA_DIR / 'telegram' / 'proxy_check.json'
+        check_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(check_file, 'w', encoding='utf-8') as f:
+            json.dump(check_result, f, ensure_ascii=False, indent=2)
+        
+        alive = sum(1 for item in results if item['ok'])
+        return jsonify({
+            'success': True,
+            'message': f'{alive}/{len(results)} proxy hoạt động.',
+            **check_result
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@telegram_bp.route('/api/rate-limits', methods=['GET'])
+def get_rate_limits():
+    """ Thống kê rate limit / FloodWait theo session"""
+    return jsonify(TELEGRAM_LIMITER.stats())
+
+
+def launch_task(group_id, task_name, config, filenames, core=5, delay_per_session=10,
+                delay_between_batches=600, admin_enabled=False, admin_delay=10,
+                skip_fresh_hours=0, upload_folder=''):
+    """ Tạo + khởi chạy task (dùng chung cho route run-task và auto seeding scheduler).
+    Trả về (payload, HTTP status)."""
+    if not all([group_id, task_name, filenames]):
+        return {'error': 'Dữ liệu không hợp lệ'}, 400
+    
+    # Get group info
+    conn = get_db_connection()
+    try:
+        group = conn.execute('SELECT folder_path FROM session_groups WHERE id = ?', (group_id,)).fetchone()
+        
+        # Check-live: ưu tiên session chưa kiểm tra/đã lỗi, bỏ qua session vừa Live
+        skipped_fresh = []
+        if task_name == 'check-live' and group:
+            filenames, skipped_fresh = plan_check_live(conn, group_id, filenames, skip_fresh_hours)
+    finally:
+        conn.close()
+    
+    if not group or not group['folder_path']:
+        return {'error': 'Không tìm thấy nhóm hoặc đường dẫn thư mục của nhóm không hợp lệ.'}, 404
+    
+    if not filenames:
+        return {
+            'task_id': None,
+            'skipped_fresh': len(skipped_fresh),
+            'message': f'Tất cả session đã Live trong {skip_fresh_hours} giờ qua, không cần kiểm tra lại.'
+        }, 200
+    
+    # Determine worker function based on task name
+    worker_func, _ = resolve_task_worker(task_name, config)
+    if not worker_func:
+        return {'error': 'Tác vụ không được hỗ trợ'}, 400
+    
+    # Params lưu cùng task để có thể resume sau khi khởi động lại
+    params = {
+        'task_name': task_name,
+        'group_id': group_id,
+        'folder_path': group['folder_path'],
+        'filenames': filenames,
+        'config': config,
+        'core': core,
+        'delay_per_session': delay_per_session,
+        'delay_between_batches': delay_between_batches,
+        'admin_enabled': admin_enabled,
+        'admin_delay': admin_delay,
+        'skip_fresh_hours': skip_fresh_hours,
+        'upload_folder': upload_folder,
+    }
+    
+    task_id = TASK_STORE.create_task(task_name, group_id, len(filenames), params)
+    
+    # Start worker thread (match Main.pyw)
+    start_task_thread(task_id, params, filenames)
+    
+    return {'task_id': task_id, 'skipped_fresh': len(skipped_fresh)}, 202
+
+
+def relaunch_task(task_id):
+    """ Chạy tiếp task bị gián đoạn/đã dừng, bỏ qua session đã xử lý. Trả về (payload, HTTP status)."""
+    params = TASK_STORE.get_params(task_id)
+    if params is None:
+        return {'error': 'Không tìm thấy task'}, 404
+    
+    # Task đã 'stopped' nhưng thread cũ chưa thoát: chạy tiếp lúc này sẽ có 2 thread trên cùng task
+    if TASK_STORE.get_status(task_id) == 'running' or TASK_STORE.has_live_thread(task_id):
+        return {'error': 'Task đang chạy hoặc chưa dừng hẳn, thử lại sau'}, 409
+    
+    done = TASK_STORE.processed_filenames(task_id)
+    remaining = [f for f in params.get('filenames', []) if f and f not in done]
+    if params.get('task_name') == 'seedingGroup' and has_plan(task_id):
+        # Seeding theo kế hoạch: session còn bước pending (có thể đã gửi 1 phần)
+        remaining = list(dict.fromkeys(
+            step['filename'] for step in load_pending_steps(task_id) if step['kind'] == 'seed'
+        ))
+    if not remaining:
+        return {'error': 'Task đã xử lý hết session'}, 400
+    
+    TASK_STORE.reopen_task(task_id)
+    start_task_thread(task_id, params, remaining)
+    
+    return {'task_id': task_id, 'remaining': len(remaining), 'skipped': len(done)}, 202
+
+
 @telegram_bp.route('/api/run-task', methods=['POST'])
 def run_task():
     """ Chạy task (match Main.pyw - với skeleton worker)"""
     try:
         data = request.get_json() or {}
         # Extract parameters (match Main.pyw)
-        group_id = data.get('groupId')
-        task_name = data.get('task')
+        payload, status = launch_task(
+            data.get('groupId'),
+            data.get('task'),
+            data.get('config', {}),
+            data.get('filenames', []),
+            core=int(data.get('core', 5)),
+            delay_per_session=int(data.get('delay_per_session', 10)),
+            delay_between_batches=int(data.get('delay_between_batches', 600)),
+            admin_enabled=bool(data.get('admin_enabled', False)),
+            admin_delay=int(data.get('admin_delay', 10)),
+            skip_fresh_hours=max(0, int(data.get('skip_fresh_hours', 0) or 0)),
+            # Get UPLOAD_FOLDER from Flask config to pass to worker
+            upload_folder=current_app.config.get("UPLOAD_FOLDER", "")
+        )
+        return jsonify(payload), status
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@telegram_bp.route('/api/seeding/plan', methods=['POST'])
+def dry_run_seeding_plan():
+    """ Dry-run: lập kế hoạch seeding (không chạy) để ước tính quy mô chiến dịch"""
+    try:
+        data = request.get_json() or {}
         config = data.get('config', {})
-        filenames = data.get('filenames', [])
-        core = int(data.get('core', 5))
-        delay_per_session = int(data.get('delay_per_session', 10))
-        delay_between_batches = int(data.get('delay_between_batches', 600))
-        admin_enabled = bool(data.get('admin_enabled', False))
-        admin_delay = int(data.get('admin_delay', 10))
+        filenames = [f for f in data.get('filenames', []) if f]
         
-        if not all([group_id, task_name, filenames]):
+        if not filenames:
             return jsonify({'error': 'Dữ liệu không hợp lệ'}), 400
+        if not config.get('group_links'):
+            return jsonify({'error': 'Seeding cần ít nhất 1 link nhóm.'}), 400
         
-        # Get group info
-        conn = get_db_connection()
-        group = conn.execute('SELECT folder_path FROM session_groups WHERE id = ?', (group_id,)).fetchone()
-        conn.close()
-        
-        if not group or not group['folder_path']:
-            return jsonify({'error': 'Không tìm thấy nhóm hoặc đường dẫn thư mục của nhóm không hợp lệ.'}), 404
-        
-        # Load proxies
         proxy_config = load_proxies()
-        proxies_to_use = proxy_config['proxies'] if proxy_config.get('enabled', False) else []
-        
-        # Create task (match Main.pyw structure)
-        task_id = str(uuid.uuid4())
-        TASKS[task_id] = {
-            'task_name': task_name,
-            'group_id': group_id,
-            'status': 'running',
-            'total': len(filenames),
-            'processed': 0,
-            'success': 0,
-            'failed': 0,
-            'results': [],
-            'messages': []
-        }
+        proxies = proxy_config['proxies'] if proxy_config.get('enabled', False) else []
+        steps = build_seeding_plan(
+            filenames, config,
+            int(data.get('delay_per_session', 10)),
+            int(data.get('delay_between_batches', 600)),
+            bool(data.get('admin_enabled', False)),
+            int(data.get('admin_delay', 10)),
+            proxies
+        )
+        return jsonify(summarize_plan(steps))
         
-        # Determine worker function based on task name
-        worker_func, args = None, []
-        if task_name == "check-live":
-            worker_func = check_single_session_worker
-        elif task_name == "joinGroup":
-            worker_func = join_group_worker
-            args = [config.get("links", [])]
-        elif task_name == "seedingGroup":
-            worker_func = seeding_group_worker
-            args = [config]  # Pass whole config
-        
-        if not worker_func:
-            if task_id in TASKS:
-                del TASKS[task_id]
-            return jsonify({'error': 'Tác vụ không được hỗ trợ'}), 400
-        
-        # Start worker thread (match Main.pyw)
-        # Get UPLOAD_FOLDER from Flask config to pass to worker
-        from flask import current_app
-        upload_folder = current_app.config.get("UPLOAD_FOLDER", "")
-        
-        thread = Thread(
-            target=run_task_in_thread,
-            args=(
-                task_id, group_id, group['folder_path'], filenames, core,
-                delay_per_session, delay_between_batches, admin_enabled, admin_delay,
-                worker_func, upload_folder, *args
-            ),
-            kwargs={"proxies": proxies_to_use}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@telegram_bp.route('/api/tasks/<task_id>/plan')
+def get_task_plan(task_id):
+    """ Tiến độ kế hoạch seeding đã lưu của task (số bước theo trạng thái)"""
+    progress = plan_progress(task_id)
+    if not progress:
+        return jsonify({'error': 'Task không có kế hoạch seeding'}), 404
+    return jsonify(progress)
+
+
+@telegram_bp.route('/api/tasks/<task_id>/metrics')
+def get_task_metrics(task_id):
+    """ Telemetry của task: p50/p95/p99 từng pha, throughput, thời gian ngủ/làm việc, theo proxy"""
+    try:
+        metrics = task_metrics(
+            task_id, TASK_STORE.live_sleep_seconds(task_id), TASK_STORE.live_active_seconds(task_id)
         )
-        thread.daemon = True
-        thread.start()
+        if metrics is None:
+            return jsonify({'error': 'Không tìm thấy task'}), 404
+        return jsonify(metrics)
         
-        return jsonify({'task_id': task_id}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@telegram_bp.route('/api/resume-task/<task_id>', methods=['POST'])
+def resume_task(task_id):
+    """ Chạy tiếp task bị gián đoạn/đã dừng, bỏ qua session đã xử lý"""
+    try:
+        payload, status = relaunch_task(task_id)
+        return jsonify(payload), status
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@telegram_bp.route('/api/tasks')
+def list_tasks():
+    """ Lịch sử task (lưu trong DB)"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(TASK_STORE.list_tasks(limit=max(1, min(limit, 500))))
+
+
 @telegram_bp.route('/api/global-settings', methods=['POST'])
 def save_telegram_global_settings():
     """ Lưu cài đặt global (match Main.pyw)"""
@@ -430,46 +823,41 @@ def save_telegram_global_settings():
 
 @telegram_bp.route('/api/task-status/<task_id>')
 def task_status(task_id):
-    """Lấy trạng thái task (match Main.pyw)"""
-    task = TASKS.get(task_id)
-    if not task:
+    """Lấy trạng thái task: results/messages mới hơn cursor ?since= (không xóa buffer)"""
+    since = request.args.get('since', 0, type=int)
+    response = TASK_STORE.snapshot(task_id, since=max(0, since))
+    if not response:
         return jsonify({'status': 'not_found'}), 404
     
-    # Match Main.pyw: Return and clear results/messages
-    response = task.copy()
-    response['results'], response['messages'] = task.get('results', []), task.get('messages', [])
-    task['results'], task['messages'] = [], []
-    
     return jsonify(response)
 
 
 @telegram_bp.route('/api/stop-task/<task_id>', methods=['POST'])
 def stop_task_route(task_id):
     """ Dừng task (match Main.pyw)"""
-    if task_id in TASKS:
-        TASKS[task_id]['status'] = 'stopped'
+    TASK_STORE.set_status(task_id, 'stopped')
     return jsonify({'message': 'Yêu cầu dừng đã được gửi.'}), 200
 
 
 @telegram_bp.route('/api/active-tasks')
 def get_active_tasks():
     """ Lấy danh sách task đang chạy (match Main.pyw)"""
-    active_tasks = {
-        task_id: {
-            'task_name': task_data.get('task_name'),
-            'group_id': task_data.get('group_id'),
-            'status': task_data.get('status'),
-            'total': task_data.get('total'),
-            'processed': task_data.get('processed'),
-            'success': task_data.get('success'),
-            'failed': task_data.get('failed'),
-        }
-        for task_id, task_data in TASKS.items()
-        if task_data.get('status') in ['running', 'stopped']
-    }
+    active_tasks = TASK_STORE.active_tasks()
     return jsonify(active_tasks)
 
 
+def _split_session_filenames(filenames):
+    """Tách filename hợp lệ / không hợp lệ (chặn path traversal)"""
+    valid, invalid = [], []
+    for filename in filenames:
+        clean_filename = os.path.basename(filename) if isinstance(filename, str) else ''
+        if clean_filename and clean_filename == filename:
+            valid.append(clean_filename)
+        else:
+            invalid.append(filename)
+    return valid, invalid
+
+
 @telegram_bp.route('/api/sessions/delete', methods=['POST'])
 def delete_sessions():
     """ Xóa sessions (match Main.pyw)"""
@@ -488,8 +876,7 @@ def delete_sessions():
             return jsonify({'error': 'filenames must be a non-empty list'}), 400
         
         # Check if any task is running
-        active_tasks = [task for task in TASKS.values() if task.get('status') == 'running']
-        if active_tasks:
+        if TASK_STORE.has_running():
             return jsonify({'error': 'Task is running'}), 409
         
         conn = get_db_connection()
@@ -502,36 +889,76 @@ def delete_sessions():
             if not os.path.exists(group_folder):
                 return jsonify({'error': 'Group folder not found'}), 404
             
-            deleted = []
-            missing = []
-            failed = []
-            
-            for filename in filenames:
-                # Sanitize filename
-                clean_filename = os.path.basename(filename)
-                if clean_filename != filename or not clean_filename:
-                    failed.append(filename)
-                    continue
-                
-                file_path = os.path.join(group_folder, clean_filename)
-                
-                try:
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-                        deleted.append(clean_filename)
-                        
-                        # Remove from metadata
-                        conn.execute('DELETE FROM session_metadata WHERE group_id = ? AND filename = ?',
-                                   (group_id, clean_filename))
-                    else:
-                        missing.append(clean_filename)
-                except OSError as e:
-                    failed.append(clean_filename)
-            conn.commit()
+            valid, failed = _split_session_filenames(filenames)
+            try:
+                deleted, missing, cleanup_failed = bulk_delete_sessions(conn, group_id, group_folder, valid)
+            except SessionFileOpError as e:
+                return jsonify({'error': f'Không xóa được session, đã hoàn tác: {e}'}), 500
+            sync_group_inventory(conn, group_id, group_folder, force=True)
             
             return jsonify({
                 'deleted': deleted,
                 'missing': missing,
+                'failed': failed,
+                # Đã xóa khỏi DB nhưng file tạm chưa xóa được (tự dọn ở lần xóa sau)
+                'cleanup_failed': cleanup_failed
+            })
+            
+        finally:
+            conn.close()
+            
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@telegram_bp.route('/api/sessions/move', methods=['POST'])
+def move_sessions():
+    """ Chuyển sessions sang nhóm khác (đổi tên file + chuyển metadata)"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Invalid JSON payload'}), 400
+        
+        group_id = data.get('group_id')
+        target_group_id = data.get('target_group_id')
+        filenames = data.get('filenames', [])
+        
+        if not group_id or not target_group_id:
+            return jsonify({'error': 'group_id and target_group_id are required'}), 400
+        
+        if str(group_id) == str(target_group_id):
+            return jsonify({'error': 'Nhóm đích trùng nhóm nguồn'}), 400
+        
+        if not filenames or not isinstance(filenames, list):
+            return jsonify({'error': 'filenames must be a non-empty list'}), 400
+        
+        if TASK_STORE.has_running():
+            return jsonify({'error': 'Task is running'}), 409
+        
+        conn = get_db_connection()
+        try:
+            group = conn.execute('SELECT folder_path FROM session_groups WHERE id = ?', (group_id,)).fetchone()
+            target = conn.execute('SELECT folder_path FROM session_groups WHERE id = ?', (target_group_id,)).fetchone()
+            if not group or not target:
+                return jsonify({'error': 'Group not found'}), 404
+            
+            if not os.path.exists(group['folder_path']):
+                return jsonify({'error': 'Group folder not found'}), 404
+            
+            valid, failed = _split_session_filenames(filenames)
+            try:
+                moved, missing, conflicts = bulk_move_sessions(
+                    conn, group_id, group['folder_path'], target_group_id, target['folder_path'], valid
+                )
+            except SessionFileOpError as e:
+                return jsonify({'error': f'Không chuyển được session, đã hoàn tác: {e}'}), 500
+            sync_group_inventory(conn, group_id, group['folder_path'], force=True)
+            sync_group_inventory(conn, target_group_id, target['folder_path'], force=True)
+            
+            return jsonify({
+                'moved': moved,
+                'missing': missing,
+                'conflicts': conflicts,
                 'failed': failed
             })
             
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Telegram Session Files
+Tiện ích xử lý file .session: kiểm tra hợp lệ, import hàng loạt từ archive (zip/tar)
+"""
+
+import os
+import shutil
+import sqlite3
+import tarfile
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+# SQLite nhỏ nhất hợp lệ: 1 trang 512 byte
+MIN_SESSION_SIZE = 512
+# Telethon lưu auth key dạng 2048 bit
+AUTH_KEY_SIZE = 256
+# Số luồng pre-check session song song
+PRECHECK_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+# Kích thước chunk khi stream request body / giải nén
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Số luồng kiểm tra file song song khi import
+IMPORT_WORKERS = 4
+# Số luồng đổi tên/xóa file khi thao tác hàng loạt
+FILE_OP_WORKERS = 8
+# Đuôi file tạm của session đang xóa (đổi tên trước khi commit DB)
+DELETING_SUFFIX = '.deleting'
+# Số job upload giữ lại để tra cứu tiến độ
+MAX_UPLOAD_JOBS = 20
+
+
+def validate_session_file(path, require_auth=False):
+    """Kiểm tra nhanh file có phải session SQLite của Telethon. Trả về (ok, lý do).
+
+    require_auth=True: kiểm tra thêm session đã đăng nhập (có DC + auth key 256 byte)."""
+    try:
+        size = os.path.getsize(path)
+        if size == 0:
+            return False, 'File rỗng'
+        if size < MIN_SESSION_SIZE:
+            return False, 'File quá nhỏ'
+        with open(path, 'rb') as f:
+            if f.read(len(SQLITE_MAGIC)) != SQLITE_MAGIC:
+                return False, 'Không phải file SQLite'
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sessions'"
+            ).fetchone()
+            if not row:
+                return False, 'Thiếu bảng sessions'
+            if not require_auth:
+                return True, None
+            session = conn.execute(
+                'SELECT dc_id, server_address, port, auth_key FROM sessions'
+            ).fetchone()
+        finally:
+            conn.close()
+        if not session:
+            return False, 'Chưa đăng nhập'
+        dc_id, server_address, port, auth_key = session
+        if not dc_id or not server_address or not port:
+            return False, 'Thiếu thông tin DC'
+        if not auth_key or len(auth_key) != AUTH_KEY_SIZE:
+            return False, 'Auth key không hợp lệ'
+        return True, None
+    except (OSError, sqlite3.Error) as e:
+        return False, str(e)[:80]
+
+
+def precheck_group_sessions(conn, group_id, folder_path, filenames):
+    """Pre-check cục bộ (không mạng) các session của nhóm, cache theo mtime file.
+
+    Chỉ kiểm tra lại file có mtime khác cache trong session_metadata; kết quả mới
+    được ghi lại (commit). Trả về {filename: (ok, lý do)}."""
+    cached = {
+        row['filename']: row
+        for row in conn.execute(
+            'SELECT filename, file_mtime, precheck_ok, precheck_reason FROM session_metadata WHERE group_id = ?',
+            (group_id,)
+        ).fetchall()
+    }
+
+    results, stale = {}, []
+    for filename in filenames:
+        path = os.path.join(folder_path, filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            results[filename] = (False, 'Không tìm thấy file')
+            continue
+        row = cached.get(filename)
+        if row and row['file_mtime'] == mtime and row['precheck_ok'] is not None:
+            results[filename] = (bool(row['precheck_ok']), row['precheck_reason'])
+        else:
+            stale.append((filename, path, mtime))
+
+    if stale:
+        # sqlite3 và I/O file nhả GIL nên thread pool đủ song song cho việc này
+        with ThreadPoolExecutor(max_workers=PRECHECK_WORKERS) as pool:
+            checked = pool.map(lambda item: validate_session_file(item[1], require_auth=True), stale)
+            updates = []
+            for (filename, _, mtime), (ok, reason) in zip(stale, checked):
+                results[filename] = (ok, reason)
+                updates.append((group_id, filename, mtime, ok, reason))
+        conn.executemany(
+            """INSERT INTO session_metadata (group_id, filename, file_mtime, precheck_ok, precheck_reason)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(group_id, filename)
+               DO UPDATE SET file_mtime=excluded.file_mtime, precheck_ok=excluded.precheck_ok,
+                             precheck_reason=excluded.precheck_reason""",
+            updates
+        )
+        conn.commit()
+
+    return results
+
+
+class SessionFileOpError(Exception):
+    """Thao tác file hàng loạt thất bại (đã hoàn tác các file đã đổi tên)"""
+
+
+def _rename_all(pairs):
+    """Đổi tên song song các cặp (src, dst); lỗi bất kỳ -> hoàn tác toàn bộ và raise."""
+    done, errors = [], []
+    with ThreadPoolExecutor(max_workers=FILE_OP_WORKERS) as pool:
+        futures = {pool.submit(shutil.move, src, dst): (src, dst) for src, dst in pairs}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                done.append(futures[future])
+            except OSError as e:
+                errors.append((os.path.basename(futures[future][0]), e))
+    if errors:
+        _undo_renames(done)
+        name, error = errors[0]
+        raise SessionFileOpError(f'{len(errors)} file lỗi (vd: {name}: {error})')
+    return done
+
+
+def _undo_renames(pairs):
+    with ThreadPoolExecutor(max_workers=FILE_OP_WORKERS) as pool:
+        list(pool.map(lambda pair: shutil.move(pair[1], pair[0]), pairs))
+
+
+def _split_existing(folder, filenames):
+    """Tách filenames thành (có trên đĩa, không tìm thấy)."""
+    existing, missing = [], []
+    for filename in dict.fromkeys(filenames):
+        (existing if os.path.isfile(os.path.join(folder, filename)) else missing).append(filename)
+    return existing, missing
+
+
+def sweep_deleting_files(group_folder):
+    """Xóa file tạm *.deleting còn sót (lần xóa trước đã commit DB nhưng os.remove lỗi)."""
+    removed = 0
+    try:
+        entries = list(os.scandir(group_folder))
+    except OSError:
+        return 0
+    for entry in entries:
+        if entry.name.startswith('.') and entry.name.endswith(DELETING_SUFFIX) and entry.is_file():
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def bulk_delete_sessions(conn, group_id, group_folder, filenames):
+    """Xóa hàng loạt session: file + metadata + chỉ mục trong 1 transaction.
+
+    File được đổi tên sang tên tạm trước; chỉ khi commit DB thành công mới xóa
+    hẳn, lỗi giữa chừng -> đổi tên lại và rollback. Sau commit, file xóa lỗi không
+    làm hỏng kết quả: được báo lại và dọn ở lần gọi sau.
+    Trả về (deleted, missing, cleanup_failed)."""
+    sweep_deleting_files(group_folder)
+    existing, missing = _split_existing(group_folder, filenames)
+    staged = _rename_all([
+        (os.path.join(group_folder, name), os.path.join(group_folder, f'.{uuid.uuid4().hex}{DELETING_SUFFIX}'))
+        for name in existing
+    ])
+    try:
+        rows = [(group_id, name) for name in existing]
+        conn.executemany('DELETE FROM session_metadata WHERE group_id = ? AND filename = ?', rows)
+        conn.executemany('DELETE FROM session_inventory WHERE group_id = ? AND filename = ?', rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        _undo_renames(staged)
+        raise
+
+    def remove(pair):
+        try:
+            os.remove(pair[1])
+            return None
+        except OSError:
+            return os.path.basename(pair[0])
+
+    with ThreadPoolExecutor(max_workers=FILE_OP_WORKERS) as pool:
+        cleanup_failed = [name for name in pool.map(remove, staged) if name]
+    return existing, missing, cleanup_failed
+
+
+def bulk_move_sessions(conn, group_id, group_folder, target_group_id, target_folder, filenames):
+    """Chuyển hàng loạt session sang nhóm khác (đổi tên file, không copy).
+
+    Metadata đi theo file; file trùng tên ở nhóm đích bị bỏ qua. Lỗi giữa chừng
+    -> chuyển file về chỗ cũ và rollback. Trả về (moved, missing, conflicts)."""
+    existing, missing = _split_existing(group_folder, filenames)
+    conflicts = {name for name in existing if os.path.exists(os.path.join(target_folder, name))}
+    to_move = [name for name in existing if name not in conflicts]
+    os.makedirs(target_folder, exist_ok=True)
+    moved_pairs = _rename_all([
+        (os.path.join(group_folder, name), os.path.join(target_folder, name)) for name in to_move
+    ])
+    try:
+        # Metadata cũ (mồ côi) ở nhóm đích bị thay bằng metadata đi theo file
+        conn.executemany(
+            'DELETE FROM session_metadata WHERE group_id = ? AND filename = ?',
+            [(target_group_id, name) for name in to_move]
+        )
+        conn.executemany(
+            'UPDATE session_metadata SET group_id = ? WHERE group_id = ? AND filename = ?',
+            [(target_group_id, group_id, name) for name in to_move]
+        )
+        conn.executemany(
+            'DELETE FROM session_inventory WHERE group_id = ? AND filename = ?',
+            [(group_id, name) for name in to_move]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        _undo_renames(moved_pairs)
+        raise
+    return to_move, missing, sorted(conflicts)
+
+
+def _iter_archive_members(archive_path):
+    """Duyệt các entry .session trong zip/tar: yield (tên gốc, file object mở lười)."""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.endswith('.session'):
+                    yield info.filename, lambda info=info: archive.open(info)
+        return
+    if tarfile.is_tarfile(archive_path):
+        # Mode 'r|*' đọc tuần tự (stream), không cần seek toàn bộ archive
+        with tarfile.open(archive_path, 'r|*') as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith('.session'):
+                    yield member.name, lambda member=member: archive.extractfile(member)
+        return
+    raise ValueError('Archive không phải zip hoặc tar')
+
+
+def count_archive_members(archive_path):
+    """Đếm số entry .session (để báo tiến độ); tar nén không đếm trước được -> None."""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            return sum(1 for info in archive.infolist()
+                       if not info.is_dir() and info.filename.endswith('.session'))
+    return None
+
+
+def import_session_archive(archive_path, group_folder, progress=None):
+    """Giải nén tăng dần các .session vào group_folder, kiểm tra song song.
+
+    Mỗi entry được ghi ra file tạm rồi kiểm tra trong thread pool; file hợp lệ
+    được os.replace vào tên đích, file lỗi bị xóa. Các entry cùng tên file ở thư mục
+    khác nhau trong archive: giữ entry đầu tiên, các entry sau bị bỏ qua và báo lại.
+    `progress(imported, invalid)` được gọi sau mỗi entry.
+    Trả về (danh sách filename đã import, số file lỗi, danh sách entry trùng tên)."""
+    os.makedirs(group_folder, exist_ok=True)
+    imported, invalid, duplicates = [], [], []
+    seen = set()
+    lock = threading.Lock()
+
+    def finalize(tmp_path, final_name):
+        try:
+            ok, _ = validate_session_file(tmp_path)
+            if ok:
+                os.replace(tmp_path, os.path.join(group_folder, final_name))
+        finally:
+            _discard(tmp_path)
+        with lock:
+            (imported if ok else invalid).append(final_name)
+            if progress:
+                progress(len(imported), len(invalid))
+
+    with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+        futures = []
+        for member_name, open_member in _iter_archive_members(archive_path):
+            final_name = secure_filename(os.path.basename(member_name))
+            if not final_name.endswith('.session'):
+                continue
+            if final_name in seen:
+                duplicates.append(member_name)
+                continue
+            source = open_member()
+            if source is None:
+                continue
+            seen.add(final_name)
+            tmp_path = os.path.join(group_folder, f'.{uuid.uuid4().hex}.part')
+            try:
+                with source, open(tmp_path, 'wb') as target:
+                    shutil.copyfileobj(source, target, STREAM_CHUNK_SIZE)
+            except BaseException:
+                _discard(tmp_path)
+                raise
+            futures.append(pool.submit(finalize, tmp_path, final_name))
+        for future in futures:
+            future.result()
+
+    return imported, len(invalid), duplicates
+
+
+def _discard(path):
+    """Xóa file tạm nếu còn (sau os.replace thì không còn)."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadJobs:
+    """Tiến độ các job import archive (in-memory, giữ MAX_UPLOAD_JOBS job gần nhất)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def create(self, group_name):
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'group_name': group_name,
+                'status': 'receiving',
+                'bytes_received': 0,
+                'total_entries': None,
+                'imported': 0,
+                'invalid': 0,
+                'duplicates': [],
+                'error': None,
+                'created_at': datetime.now().isoformat(),
+            }
+            while len(self._jobs) > MAX_UPLOAD_JOBS:
+                self._jobs.pop(next(iter(self._jobs)))
+        return job_id
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+
+UPLOAD_JOBS = UploadJobs()
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Telegram Task Store
+Lưu trữ task Telegram bền vững (SQLite) + bản sao in-memory thread-safe
+Thay thế dict TASKS toàn cục trong telegram_routes
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+
+from app.database import get_db_connection
+from app.telegram_metrics import TIMING_COLUMNS
+
+# Số task đã kết thúc giữ lại trong bộ nhớ (task cũ hơn chỉ đọc từ DB)
+MAX_FINISHED_TASKS_IN_MEMORY = 20
+# Thời gian giữ task đã kết thúc trong bộ nhớ (giây)
+FINISHED_TASK_TTL = 3600
+# Số task giữ lại trong lịch sử DB (cũ hơn sẽ bị xóa cùng kết quả)
+MAX_TASK_HISTORY = 200
+
+# Kích thước ring buffer results/messages mỗi task (client đọc bằng cursor ?since=)
+RESULT_BUFFER_SIZE = 1000
+MESSAGE_BUFFER_SIZE = 200
+
+# Trạng thái task vẫn còn thread đang chạy
+LIVE_STATUSES = ('running', 'stopped')
+
+
+def _now_iso():
+    return datetime.now().isoformat()
+
+
+def _utc_iso_after(seconds):
+    """Thời điểm (UTC, ISO) sau `seconds` giây - dùng cho countdown phía client."""
+    return datetime.fromtimestamp(time.time() + seconds, timezone.utc).isoformat(timespec='milliseconds')
+
+
+class TaskStore:
+    """Task registry: header + kết quả từng session lưu trong SQLite, trạng thái
+    nóng (counters, ring buffer results/messages) giữ trong bộ nhớ dưới một lock.
+
+    Mỗi result/message nhận một số thứ tự `seq` tăng dần theo task; client poll
+    với cursor `since` nên nhiều tab cùng theo dõi một task không lấy mất dữ liệu
+    của nhau."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tasks = {}
+        # task_id -> thời điểm kết thúc (time.monotonic) để dọn bộ nhớ
+        self._finished = {}
+        # Callback(task_id, status) gọi khi thread của task kết thúc (vd: scheduler)
+        self._finish_listeners = []
+
+    # ----- Lifecycle -----
+
+    def create_task(self, task_name, group_id, total, params=None):
+        """Tạo task mới, lưu header vào DB và trả về task_id."""
+        task_id = str(uuid.uuid4())
+        now = _now_iso()
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                """INSERT INTO telegram_tasks
+                   (id, task_name, group_id, status, total, params_json, created_at, updated_at, started_at)
+                   VALUES (?, ?, ?, 'running', ?, ?, ?, ?, ?)""",
+                (task_id, task_name, group_id, total,
+                 json.dumps(params or {}, ensure_ascii=False), now, now, now)
+            )
+            conn.commit()
+            self._prune_history(conn)
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._tasks[task_id] = self._new_memory_task(task_name, group_id, 'running', total)
+        return task_id
+
+    def discard_task(self, task_id):
+        """Xóa hoàn toàn task (dùng khi task không khởi chạy được)."""
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self._finished.pop(task_id, None)
+        conn = get_db_connection()
+        try:
+            conn.execute('DELETE FROM telegram_task_results WHERE task_id = ?', (task_id,))
+            conn.execute('DELETE FROM seeding_plan_steps WHERE task_id = ?', (task_id,))
+            conn.execute('DELETE FROM telegram_tasks WHERE id = ?', (task_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def reopen_task(self, task_id):
+        """Đưa task (interrupted/stopped) về trạng thái running để chạy tiếp."""
+        row = self._load_row(task_id)
+        if not row:
+            return False
+        with self._lock:
+            task = self._new_memory_task(row['task_name'], row['group_id'], 'running', row['total'])
+            task['processed'] = row['processed']
+            task['success'] = row['success']
+            task['failed'] = row['failed']
+            task['sleep_seconds'] = row['sleep_seconds'] or 0.0
+            task['active_seconds'] = self._previous_active_seconds(row)
+            task['seq'] = task['dropped_seq'] = self._max_result_seq(task_id)
+            self._tasks[task_id] = task
+            self._finished.pop(task_id, None)
+        self._persist_header(
+            task_id, status='running', finished_at=None, started_at=_now_iso(),
+            active_seconds=round(task['active_seconds'], 3)
+        )
+        return True
+
+    def finish_task(self, task_id):
+        """Đánh dấu thread của task đã kết thúc (running -> completed)."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if not task:
+                return
+            if task['status'] == 'running':
+                task['status'] = 'completed'
+            status = task['status']
+            sleep_seconds = round(task['sleep_seconds'], 3)
+            task['active_seconds'] = self._active_seconds_locked(task)
+            task['run_started'] = None
+            active_seconds = round(task['active_seconds'], 3)
+            self._finished[task_id] = time.monotonic()
+        self._persist_header(
+            task_id, status=status, finished_at=_now_iso(), sleep_seconds=sleep_seconds,
+            active_seconds=active_seconds
+        )
+        self._evict()
+        for listener in list(self._finish_listeners):
+            try:
+                listener(task_id, status)
+            except Exception:
+                pass
+
+    def add_finish_listener(self, listener):
+        """Đăng ký callback(task_id, status) khi task kết thúc."""
+        with self._lock:
+            self._finish_listeners.append(listener)
+
+    def recover_interrupted(self):
+        """Khi khởi động lại: task còn 'running'/'stopped' trong DB là bị gián đoạn.
+
+        Lần chạy bị cắt được tính tới lần ghi cuối (updated_at) vào active_seconds."""
+        conn = get_db_connection()
+        try:
+            placeholders = ','.join('?' for _ in LIVE_STATUSES)
+            conn.execute(
+                f"""UPDATE telegram_tasks SET status = 'interrupted',
+                        active_seconds = active_seconds + COALESCE(
+                            MAX(0, (julianday(updated_at) - julianday(started_at)) * 86400), 0),
+                        updated_at = ?
+                    WHERE finished_at IS NULL AND status IN ({placeholders})""",
+                (_now_iso(), *LIVE_STATUSES)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ----- Mutations from worker threads -----
+
+    def set_status(self, task_id, status):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if not task:
+                return False
+            task['status'] = status
+        self._persist_header(task_id, status=status)
+        return True
+
+    def get_status(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return task['status'] if task else None
+
+    def get_task_name(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return task['task_name'] if task else None
+
+    def is_stopped(self, task_id):
+        return self.get_status(task_id) in (None, 'stopped', 'failed')
+
+    def adjust_total(self, task_id, delta):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if not task:
+                return
+            task['total'] = max(0, task['total'] + delta)
+            total = task['total']
+        self._persist_header(task_id, total=total)
+
+    def add_message(self, task_id, message):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task:
+                task['seq'] += 1
+                task['messages'].append((task['seq'], message))
+
+    def set_countdown(self, task_id, key, seconds):
+        """Đặt mốc thời gian (next_batch_at / next_admin_at) thay cho message mỗi giây."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task:
+                task[key] = _utc_iso_after(seconds) if seconds else None
+
+    def add_sleep(self, task_id, seconds):
+        """Cộng thời gian task chờ theo lịch (delay giữa session/đợt) - telemetry."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task:
+                task['sleep_seconds'] += seconds
+
+    def live_sleep_seconds(self, task_id):
+        """Thời gian ngủ đang tích lũy của task còn trong bộ nhớ (None nếu không có)."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return task['sleep_seconds'] if task else None
+
+    def live_active_seconds(self, task_id):
+        """Tổng thời gian chạy (các lần trước + lần đang chạy) của task còn trong bộ nhớ."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return self._active_seconds_locked(task) if task else None
+
+    def record_result(self, task_id, filename, status_result, telemetry=None):
+        """Ghi kết quả 1 session: cập nhật counters + lưu dòng kết quả vào DB.
+
+        `telemetry`: proxy + thời gian từng pha (ms) - xem telegram_metrics."""
+        is_live = bool(status_result.get('is_live'))
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if not task:
+                return
+            task['processed'] += 1
+            if is_live:
+                task['success'] += 1
+            else:
+                task['failed'] += 1
+            task['seq'] += 1
+            seq = task['seq']
+            if len(task['results']) == task['results'].maxlen:
+                task['dropped_seq'] = task['results'][0][0]
+            task['results'].append((seq, {'filename': filename, **status_result}))
+            counters = (task['processed'], task['success'], task['failed'])
+
+        telemetry = telemetry or {}
+        now = _now_iso()
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                f"""INSERT INTO telegram_task_results
+                   (task_id, seq, filename, is_live, status_text, result_json, created_at,
+                    error_class, proxy, {', '.join(TIMING_COLUMNS)})
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?{', ?' * len(TIMING_COLUMNS)})""",
+                (task_id, seq, filename, is_live, status_result.get('status_text'),
+                 json.dumps(status_result, ensure_ascii=False, default=str), now,
+                 status_result.get('error_class'), telemetry.get('proxy'),
+                 *(telemetry.get(column) for column in TIMING_COLUMNS))
+            )
+            conn.execute(
+                """UPDATE telegram_tasks SET processed = ?, success = ?, failed = ?, updated_at = ?
+                   WHERE id = ?""",
+                (*counters, now, task_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ----- Reads -----
+
+    def snapshot(self, task_id, since=0):
+        """Trạng thái task + results/messages có seq > since.
+
+        `cursor` trong kết quả là seq mới nhất; client gửi lại làm `since` ở lần
+        poll sau. Results đã rơi khỏi ring buffer được bù từ DB."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task:
+                response = {k: v for k, v in task.items() if k not in ('results', 'messages', 'seq', 'dropped_seq')}
+                response['cursor'] = task['seq']
+                results = [dict(item, seq=seq) for seq, item in task['results'] if seq > since]
+                response['messages'] = [msg for seq, msg in task['messages'] if seq > since]
+                dropped_seq = task['dropped_seq']
+        if not task:
+            row = self._load_row(task_id)
+            if not row:
+                return None
+            response = self._row_to_task(row)
+            response['cursor'] = self._max_result_seq(task_id)
+            results, dropped_seq = [], response['cursor']
+
+        if since < dropped_seq:
+            backlog = self._load_results(task_id, since, dropped_seq)
+            if len(backlog) >= RESULT_BUFFER_SIZE:
+                # Backlog quá dài: trả từng trang, client tiếp tục từ cursor này
+                results = backlog
+                response['cursor'] = backlog[-1]['seq']
+                response['messages'] = []
+            else:
+                results = backlog + results
+        response['results'] = results
+        return response
+
+    def has_running(self):
+        with self._lock:
+            return any(t['status'] == 'running' for t in self._tasks.values())
+
+    def active_tasks(self):
+        """Task đang chạy hoặc đang dừng (thread chưa kết thúc)."""
+        with self._lock:
+            return {
+                task_id: {k: task[k] for k in ('task_name', 'group_id', 'status', 'total',
+                                                'processed', 'success', 'failed')}
+                for task_id, task in self._tasks.items()
+                if task['status'] in LIVE_STATUSES and task_id not in self._finished
+            }
+
+    def has_live_thread(self, task_id):
+        """Thread worker của task chưa gọi finish_task (kể cả khi đã bị dừng)."""
+        with self._lock:
+            return task_id in self._tasks and task_id not in self._finished
+
+    def list_tasks(self, limit=50):
+        """Lịch sử task từ DB (mới nhất trước)."""
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(
+                'SELECT * FROM telegram_tasks ORDER BY created_at DESC LIMIT ?', (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_task(row, include_params=True) for row in rows]
+
+    def stored_status(self, task_id):
+        """Trạng thái task trong DB (kể cả task không còn trong bộ nhớ, vd: 'interrupted')."""
+        row = self._load_row(task_id)
+        return row['status'] if row else None
+
+    def stored_task(self, task_id):
+        """Header task trong DB (trạng thái + counters), None nếu không có."""
+        row = self._load_row(task_id)
+        return self._row_to_task(row) if row else None
+
+    def get_params(self, task_id):
+        row = self._load_row(task_id)
+        if not row:
+            return None
+        return json.loads(row['params_json'] or '{}')
+
+    def processed_filenames(self, task_id):
+        """Tập filename đã có kết quả - dùng để bỏ qua khi resume."""
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(
+                'SELECT DISTINCT filename FROM telegram_task_results WHERE task_id = ?', (task_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {row['filename'] for row in rows}
+
+    # ----- Internals -----
+
+    @staticmethod
+    def _new_memory_task(task_name, group_id, status, total):
+        return {
+            'task_name': task_name,
+            'group_id': group_id,
+            'status': status,
+            'total': total,
+            'processed': 0,
+            'success': 0,
+            'failed': 0,
+            'sleep_seconds': 0.0,
+            'active_seconds': 0.0,
+            'run_started': time.monotonic(),
+            'next_batch_at': None,
+            'next_admin_at': None,
+            'seq': 0,
+            'dropped_seq': 0,
+            'results': deque(maxlen=RESULT_BUFFER_SIZE),
+            'messages': deque(maxlen=MESSAGE_BUFFER_SIZE)
+        }
+
+    @staticmethod
+    def _active_seconds_locked(task):
+        if task['run_started'] is None:
+            return task['active_seconds']
+        return task['active_seconds'] + time.monotonic() - task['run_started']
+
+    @staticmethod
+    def _previous_active_seconds(row):
+        """active_seconds khi chạy tiếp; task cũ (trước khi có started_at) lấy created_at -> finished_at"""
+        if row['started_at'] is None and row['finished_at']:
+            elapsed = datetime.fromisoformat(row['finished_at']) - datetime.fromisoformat(row['created_at'])
+            return max(0.0, elapsed.total_seconds())
+        return row['active_seconds'] or 0.0
+
+    @staticmethod
+    def _row_to_task(row, include_params=False):
+        task = {
+            'task_id': row['id'],
+            'task_name': row['task_name'],
+            'group_id': row['group_id'],
+            'status': row['status'],
+            'total': row['total'],
+            'processed': row['processed'],
+            'success': row['success'],
+            'failed': row['failed'],
+            'created_at': row['created_at'],
+            'finished_at': row['finished_at'],
+            'results': [],
+            'messages': []
+        }
+        if include_params:
+            task['params'] = json.loads(row['params_json'] or '{}')
+        return task
+
+    @staticmethod
+    def _load_results(task_id, since, until):
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(
+                """SELECT seq, filename, result_json FROM telegram_task_results
+                   WHERE task_id = ? AND seq > ? AND seq <= ? ORDER BY seq LIMIT ?""",
+                (task_id, since, until, RESULT_BUFFER_SIZE)
+            ).fetchall()
+        finally:
+            conn.close()
+        # Cùng dạng với kết quả trong bộ nhớ: filename nằm ở cột riêng, không có trong result_json
+        return [
+            {'filename': row['filename'], **json.loads(row['result_json'] or '{}'), 'seq': row['seq']}
+            for row in rows
+        ]
+
+    @staticmethod
+    def _max_result_seq(task_id):
+        conn = get_db_connection()
+        try:
+            row = conn.execute(
+                'SELECT MAX(seq) AS seq FROM telegram_task_results WHERE task_id = ?', (task_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row['seq'] or 0
+
+    def _load_row(self, task_id):
+        conn = get_db_connection()
+        try:
+            return conn.execute('SELECT * FROM telegram_tasks WHERE id = ?', (task_id,)).fetchone()
+        finally:
+            conn.close()
+
+    def _persist_header(self, task_id, **fields):
+        fields['updated_at'] = _now_iso()
+        assignments = ', '.join(f'{key} = ?' for key in fields)
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                f'UPDATE telegram_tasks SET {assignments} WHERE id = ?',
+                (*fields.values(), task_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _evict(self):
+        """Giới hạn số task đã kết thúc trong bộ nhớ (theo TTL và số lượng)."""
+        with self._lock:
+            now = time.monotonic()
+            expired = [tid for tid, ended in self._finished.items() if now - ended > FINISHED_TASK_TTL]
+            overflow = len(self._finished) - len(expired) - MAX_FINISHED_TASKS_IN_MEMORY
+            if overflow > 0:
+                remaining = sorted(
+                    (tid for tid in self._finished if tid not in expired),
+                    key=self._finished.get
+                )
+                expired.extend(remaining[:overflow])
+            for tid in expired:
+                self._finished.pop(tid, None)
+                self._tasks.pop(tid, None)
+
+    @staticmethod
+    def _prune_history(conn):
+        """Xóa task cũ vượt quá MAX_TASK_HISTORY (chỉ task đã kết thúc)."""
+        old_ids = [row['id'] for row in conn.execute(
+            """SELECT id FROM telegram_tasks WHERE finished_at IS NOT NULL OR status = 'interrupted'
+               ORDER BY created_at DESC LIMIT -1 OFFSET ?""",
+            (MAX_TASK_HISTORY,)
+        ).fetchall()]
+        if not old_ids:
+            return
+        conn.executemany('DELETE FROM telegram_task_results WHERE task_id = ?', [(tid,) for tid in old_ids])
+        conn.executemany('DELETE FROM seeding_plan_steps WHERE task_id = ?', [(tid,) for tid in old_ids])
+        conn.executemany('DELETE FROM telegram_tasks WHERE id = ?', [(tid,) for tid in old_ids])
+        conn.commit()
+
+
+# Singleton dùng chung giữa routes và workers
+TASK_STORE = TaskStore()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test telegram_proxies: SOCKS5 handshake qua server giả lập cục bộ (chậm / từ chối / trả lời sai),
+cách ly + backoff và thứ tự chọn proxy của ProxyManager.
+
+Chạy: python -m pytest -q tests/test_proxies.py
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.telegram_proxies import (  # noqa: E402
+    QUARANTINE_AFTER_FAILURES, QUARANTINE_BASE, QUARANTINE_MAX,
+    ProxyCheckError, ProxyManager, _socks5_handshake, check_proxies,
+)
+
+TARGET = ('149.154.167.51', 443)
+TIMEOUT = 0.5
+
+
+# ----- SOCKS5 server giả lập -----
+
+@asynccontextmanager
+async def socks_stub(mode='ok', username=None, password=None):
+    """Server SOCKS5 tối giản trên 127.0.0.1 -> port.
+
+    mode: 'ok' | 'slow' (không trả lời lời chào) | 'no_method' (0xFF) | 'bad_version'
+          | 'connect_fail' (CONNECT trả mã 5) | 'hangup' (đóng kết nối ngay)"""
+    async def handle(reader, writer):
+        try:
+            if mode == 'hangup':
+                return
+            _version, count = await reader.readexactly(2)
+            methods = await reader.readexactly(count)
+            if mode == 'slow':
+                await asyncio.sleep(TIMEOUT * 10)
+                return
+            if mode == 'bad_version':
+                writer.write(b'\x04\x00')
+                return
+            if mode == 'no_method':
+                writer.write(b'\x05\xff')
+                return
+            if username is not None:
+                if 2 not in methods:
+                    writer.write(b'\x05\xff')
+                    return
+                writer.write(b'\x05\x02')
+                await writer.drain()
+                _ver, user_len = await reader.readexactly(2)
+                user = await reader.readexactly(user_len)
+                (pass_len,) = await reader.readexactly(1)
+                secret = await reader.readexactly(pass_len)
+                ok = user.decode() == username and secret.decode() == password
+                writer.write(b'\x01' + (b'\x00' if ok else b'\x01'))
+                if not ok:
+                    return
+            else:
+                writer.write(b'\x05\x00')
+            await writer.drain()
+            await reader.readexactly(10)  # CONNECT IPv4: ver, cmd, rsv, atyp, addr(4), port(2)
+            code = 5 if mode == 'connect_fail' else 0
+            writer.write(bytes([5, code, 0, 1, 0, 0, 0, 0, 0, 0]))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    try:
+        yield server.sockets[0].getsockname()[1]
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def closed_port():
+    """Port cục bộ không có ai lắng nghe (kết nối bị từ chối)."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def handshake(port, **auth):
+    proxy_dict = {'addr': '127.0.0.1', 'port': port, **auth}
+    return _socks5_handshake(proxy_dict, TARGET, TIMEOUT)
+
+
+# ----- _socks5_handshake -----
+
+def test_handshake_ok_without_auth():
+    async def run():
+        async with socks_stub('ok') as port:
+            await handshake(port)
+    asyncio.run(run())
+
+
+def test_handshake_ok_with_auth():
+    async def run():
+        async with socks_stub('ok', username='user', password='secret') as port:
+            await handshake(port, username='user', password='secret')
+    asyncio.run(run())
+
+
+def test_handshake_wrong_password():
+    async def run():
+        async with socks_stub('ok', username='user', password='secret') as port:
+            with pytest.raises(ProxyCheckError):
+                await handshake(port, username='user', password='wrong')
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('mode', ['no_method', 'bad_version', 'connect_fail'])
+def test_handshake_bad_reply(mode):
+    async def run():
+        async with socks_stub(mode) as port:
+            with pytest.raises(ProxyCheckError):
+                await handshake(port)
+    asyncio.run(run())
+
+
+def test_handshake_hangup():
+    async def run():
+        async with socks_stub('hangup') as port:
+            with pytest.raises((asyncio.IncompleteReadError, ConnectionError)):
+                await handshake(port)
+    asyncio.run(run())
+
+
+def test_handshake_slow_times_out():
+    async def run():
+        async with socks_stub('slow') as port:
+            started = time.perf_counter()
+            with pytest.raises(asyncio.TimeoutError):
+                await handshake(port)
+            assert time.perf_counter() - started < TIMEOUT * 3
+    asyncio.run(run())
+
+
+def test_handshake_refused():
+    with pytest.raises(OSError):
+        asyncio.run(handshake(closed_port()))
+
+
+def test_handshake_rejects_long_credentials_before_connecting():
+    # Port đóng: nếu handshake mở kết nối thì lỗi sẽ là OSError chứ không phải ProxyCheckError
+    with pytest.raises(ProxyCheckError):
+        asyncio.run(handshake(closed_port(), username='u' * 256, password='p'))
+
+
+def test_check_proxies_reports_each_result_in_order():
+    async def run():
+        async with socks_stub('ok') as ok_port, socks_stub('slow') as slow_port, \
+                socks_stub('connect_fail') as fail_port:
+            proxies = [
+                f'127.0.0.1:{slow_port}',
+                f'127.0.0.1:{ok_port}',
+                f'127.0.0.1:{closed_port()}',
+                f'127.0.0.1:{fail_port}',
+                f'127.0.0.1:{ok_port}:{"u" * 300}:p',
+                'not-a-proxy',
+            ]
+            return proxies, await check_proxies(proxies, concurrency=3, timeout=TIMEOUT, target=TARGET)
+
+    proxies, results = asyncio.run(run())
+    assert [item['proxy'] for item in results] == proxies
+    assert [item['ok'] for item in results] == [False, True, False, False, False, False]
+    assert results[0]['error'] == 'Timeout'
+    assert results[1]['latency_ms'] is not None
+    assert all(item['error'] for item in results if not item['ok'])
+
+
+# ----- Cách ly / backoff -----
+
+def quarantined_for(manager, proxy):
+    return manager.snapshot([proxy])[0]['quarantined_for']
+
+
+def test_quarantine_after_consecutive_failures_with_backoff():
+    manager = ProxyManager()
+    proxy = 'p1:1'
+    for _ in range(QUARANTINE_AFTER_FAILURES - 1):
+        manager.report(proxy, ok=False, acquired=False)
+    assert not manager.is_quarantined(proxy)
+
+    manager.report(proxy, ok=False, acquired=False)
+    assert manager.is_quarantined(proxy)
+    assert quarantined_for(manager, proxy) == QUARANTINE_BASE
+
+    manager.report(proxy, ok=False, acquired=False)
+    assert quarantined_for(manager, proxy) == QUARANTINE_BASE * 2
+
+    for _ in range(10):
+        manager.report(proxy, ok=False, acquired=False)
+    assert quarantined_for(manager, proxy) == QUARANTINE_MAX
+
+
+def test_success_clears_quarantine():
+    manager = ProxyManager()
+    for _ in range(QUARANTINE_AFTER_FAILURES):
+        manager.report('p1:1', ok=False, acquired=False)
+    manager.report('p1:1', ok=True, latency=0.1, acquired=False)
+    assert not manager.is_quarantined('p1:1')
+    assert manager.snapshot(['p1:1'])[0]['consecutive_failures'] == 0
+
+
+def test_failed_check_marks_proxy_dead_until_next_check():
+    manager = ProxyManager()
+    manager.record_check('p1:1', ok=False, error='Timeout')
+    assert manager.acquire(['p1:1', 'p2:2']) == 'p2:2'
+    assert manager.acquire(['p1:1']) is None
+    assert manager.snapshot(['p1:1'])[0]['dead']
+
+    manager.record_check('p1:1', ok=True, latency=0.05)
+    assert manager.acquire(['p1:1']) == 'p1:1'
+
+
+def test_dead_mark_expires_after_ttl():
+    manager = ProxyManager()
+    manager.record_check('p1:1', ok=False, checked_at=time.time() - manager.dead_ttl - 1)
+    assert manager.acquire(['p1:1']) == 'p1:1'
+
+
+def test_load_check_restores_dead_proxies():
+    manager = ProxyManager()
+    manager.load_check({
+        'checked_at': '2099-01-01T00:00:00',
+        'results': [{'proxy': 'p1:1', 'ok': False, 'error': 'Timeout'}, {'proxy': 'p2:2', 'ok': True}],
+    })
+    assert manager.usable(['p1:1', 'p2:2']) == ['p2:2']
+
+
+# ----- Thứ tự acquire -----
+
+def warm(manager, proxy, latency):
+    manager.report(proxy, ok=True, latency=latency, acquired=False)
+
+
+def test_acquire_prefers_lowest_latency():
+    manager = ProxyManager()
+    warm(manager, 'slow:1', 2.0)
+    warm(manager, 'fast:1', 0.1)
+    assert manager.acquire(['slow:1', 'fast:1']) == 'fast:1'
+
+
+def test_acquire_spreads_load_with_in_flight_penalty():
+    manager = ProxyManager()
+    warm(manager, 'a:1', 0.1)
+    warm(manager, 'b:1', 0.3)
+    picks = [manager.acquire(['a:1', 'b:1']) for _ in range(3)]
+    assert picks[0] == 'a:1'
+    assert 'b:1' in picks
+
+
+def test_acquire_skips_quarantined_and_honours_preferred():
+    manager = ProxyManager()
+    warm(manager, 'a:1', 0.1)
+    warm(manager, 'b:1', 0.5)
+    for _ in range(QUARANTINE_AFTER_FAILURES):
+        manager.report('a:1', ok=False, acquired=False)
+    assert manager.acquire(['a:1', 'b:1']) == 'b:1'
+    # preferred bị cách ly -> bỏ qua; không bị cách ly -> dùng dù chậm hơn
+    assert manager.acquire(['a:1', 'b:1'], preferred='a:1') == 'b:1'
+    assert ProxyManager().acquire(['a:1', 'b:1'], preferred='b:1') == 'b:1'
+
+
+def test_acquire_sticky_returns_pinned_proxy():
+    manager = ProxyManager()
+    warm(manager, 'a:1', 0.1)
+    manager.report('b:1', ok=True, latency=0.9, session_key='s1', acquired=False)
+    assert manager.acquire(['a:1', 'b:1'], session_key='s1', sticky=True) == 'b:1'
+    assert manager.acquire(['a:1', 'b:1'], session_key='s1', sticky=False) == 'a:1'
+
+
+def test_acquire_all_quarantined_uses_soonest_expiry():
+    manager = ProxyManager()
+    for _ in range(QUARANTINE_AFTER_FAILURES + 1):
+        manager.report('long:1', ok=False, acquired=False)
+    for _ in range(QUARANTINE_AFTER_FAILURES):
+        manager.report('short:1', ok=False, acquired=False)
+    assert manager.acquire(['long:1', 'short:1']) == 'short:1'
+
+
+def test_acquire_release_keeps_in_flight_balanced():
+    manager = ProxyManager()
+    proxy = manager.acquire(['a:1'])
+    assert manager.snapshot(['a:1'])[0]['in_flight'] == 1
+    manager.release(proxy)
+    assert manager.snapshot(['a:1'])[0]['in_flight'] == 0
+    assert manager.acquire([]) is None